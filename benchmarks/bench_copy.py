@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark file copies for copy / move jobs: shutil.copy2 / copytree (the
+previous per-file read/write path) versus copy_engine (reflink, then
+copy_file_range / sendfile, with small files of a tree copied concurrently).
+
+Two workloads: one large file, and a tree of many small files (a shader cache
+or save folder). Each is copied within the source filesystem and, when
+--cross-dir is on another filesystem (default: /dev/shm if it is), across
+filesystems. Destinations are removed between runs; page cache state is not
+dropped, so the large-file numbers are mostly memory bandwidth unless the file
+is larger than RAM.
+
+Usage:
+    python benchmarks/bench_copy.py [--size-mb 1024] [--files 20000] [--repeat 3] [--dir /run/media/mmcblk0p1] [--cross-dir /home/deck]
+
+Prints one JSON document.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import contextlib
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "py_modules"))
+
+import copy_engine  # noqa: E402
+
+
+def build_large(root, size_mb):
+    path = os.path.join(root, f"large-{size_mb}m.bin")
+    if os.path.isfile(path) and os.path.getsize(path) == size_mb * 1024 * 1024:
+        return path
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+    return path
+
+
+def build_tree(root, files):
+    """``files`` files of 1-64 KB, 100 per directory."""
+    path = os.path.join(root, f"small-{files}")
+    if os.path.isdir(path):
+        return path
+    payload = os.urandom(64 * 1024)
+    for i in range(files):
+        folder = os.path.join(path, f"{i // 100:05d}")
+        if i % 100 == 0:
+            os.makedirs(folder)
+        with open(os.path.join(folder, f"{i:07d}.bin"), "wb") as f:
+            f.write(payload[:1024 * (1 + i % 64)])
+    return path
+
+
+def tree_stats(path):
+    count = size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            count += 1
+            size += os.lstat(os.path.join(root, name)).st_size
+    return count, size
+
+
+def legacy_file(src, dst):
+    shutil.copy2(src, dst)
+
+
+def legacy_tree(src, dst):
+    shutil.copytree(src, dst, symlinks=True)
+
+
+def engine_file(src, dst):
+    return copy_engine.copy_file(src, dst)
+
+
+def engine_tree(src, dst, parallel):
+    """The copy loop of file_jobs._copy_tree without job bookkeeping."""
+    methods = set()
+    os.makedirs(dst)
+    with copy_engine.ParallelCopier(dst) if parallel else contextlib.nullcontext() as copier:
+        for root, dirs, files in os.walk(src):
+            target = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(target, exist_ok=True)
+            for name in files:
+                args = (os.path.join(root, name), os.path.join(target, name))
+                if copier is not None:
+                    copier.submit(copy_engine.copy_file, *args)
+                else:
+                    methods.add(copy_engine.copy_file(*args))
+    for root, dirs, files in os.walk(src):
+        shutil.copystat(root, os.path.join(dst, os.path.relpath(root, src)))
+    return ",".join(sorted(methods)) or None
+
+
+def run(func, src, dst, repeat):
+    timings = []
+    method = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        method = func(src, dst)
+        timings.append(time.perf_counter() - start)
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        else:
+            os.remove(dst)
+    return method, timings
+
+
+def measure(name, func, src, dst, repeat, count, size):
+    method, timings = run(func, src, dst, repeat)
+    median = statistics.median(timings)
+    result = {
+        "median_s": round(median, 3),
+        "min_s": round(min(timings), 3),
+        "mb_per_s": round(size / 1024 / 1024 / max(median, 1e-9), 1),
+        "files_per_s": round(count / max(median, 1e-9)),
+    }
+    if method:
+        result["method"] = method
+    return name, result
+
+
+def default_cross_dir(root):
+    if os.path.isdir("/dev/shm") and os.stat("/dev/shm").st_dev != os.stat(root).st_dev:
+        return "/dev/shm"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024, help="size of the large file")
+    parser.add_argument("--files", type=int, default=20000, help="files in the small-file tree")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dir", help="where to build the sources (default: a temporary directory)")
+    parser.add_argument("--cross-dir", help="a directory on another filesystem for cross-device copies")
+    parser.add_argument("--keep", action="store_true", help="keep the sources for later runs")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="friendeck-copy-")
+    os.makedirs(root, exist_ok=True)
+    cross_root = args.cross_dir or default_cross_dir(root)
+    targets = [("same_device", root)]
+    cross = None
+    if cross_root:
+        cross = tempfile.mkdtemp(prefix="friendeck-copy-", dir=cross_root)
+        targets.append(("cross_device", cross))
+
+    results = []
+    try:
+        large = build_large(root, args.size_mb)
+        small = build_tree(root, args.files)
+        workloads = (
+            ("large_file", large, (
+                ("copy2", legacy_file),
+                ("engine", engine_file),
+            )),
+            ("small_files", small, (
+                ("copytree", legacy_tree),
+                ("engine_sequential", lambda src, dst: engine_tree(src, dst, False)),
+                ("engine_parallel", lambda src, dst: engine_tree(src, dst, True)),
+            )),
+        )
+        for workload, src, variants in workloads:
+            count, size = tree_stats(src) if os.path.isdir(src) else (1, os.path.getsize(src))
+            for target, folder in targets:
+                dst = os.path.join(folder, "copy-target")
+                case = {"workload": workload, "target": target, "files": count, "bytes": size}
+                for name, func in variants:
+                    key, result = measure(name, func, src, dst, args.repeat, count, size)
+                    case[key] = result
+                baseline = case[variants[0][0]]["median_s"]
+                case["speedup"] = {
+                    name: round(baseline / max(case[name]["median_s"], 1e-6), 2) for name, _ in variants[1:]
+                }
+                results.append(case)
+    finally:
+        if cross:
+            shutil.rmtree(cross, ignore_errors=True)
+        if not args.keep:
+            if args.dir:
+                shutil.rmtree(os.path.join(root, f"small-{args.files}"), ignore_errors=True)
+                try:
+                    os.remove(os.path.join(root, f"large-{args.size_mb}m.bin"))
+                except OSError:
+                    pass
+            else:
+                shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps({
+        "benchmark": "copy",
+        "dir": os.path.abspath(root),
+        "cross_dir": cross_root,
+        "repeat": args.repeat,
+        # Parallel small-file copies need more than one core to pay off
+        "cpus": os.cpu_count(),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark directory listing for /api/files/list: the previous os.listdir
+implementation (exists + isdir + stat per entry) versus
+file_operations.list_directory (os.scandir, one stat per entry).
+
+Synthetic directories mimic a shader cache / compatdata folder: mostly small
+files, some subdirectories, a few symlinks (including broken ones). Each
+implementation is timed on a warm cache; the JSON encoding of the result is
+timed separately since it is part of every response.
+
+Usage:
+    python benchmarks/bench_listing.py [--entries 1000 10000 100000] [--repeat 5] [--dir /run/media/mmcblk0p1]
+
+Prints one JSON document.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "py_modules"))
+
+import file_operations  # noqa: E402
+
+
+def legacy_list(path):
+    """The listing loop of get_file_list before it moved to os.scandir."""
+    files = []
+    for item in os.listdir(path):
+        item_path = os.path.join(path, item)
+        try:
+            if not os.path.exists(item_path):
+                continue
+            is_dir = os.path.isdir(item_path)
+            st = os.stat(item_path)
+            files.append({
+                "name": item,
+                "path": item_path,
+                "is_dir": is_dir,
+                "size": st.st_size if not is_dir else 0,
+                "mtime": st.st_mtime,
+                "created_at": getattr(st, 'st_birthtime', st.st_ctime)
+            })
+        except Exception:
+            continue
+    files.sort(key=lambda x: (not x['is_dir'], x['name']))
+    return files
+
+
+def build_tree(root, entries):
+    """Create ``entries`` items: ~90% files, ~9% directories, ~1% symlinks."""
+    path = os.path.join(root, f"listing-{entries}")
+    if os.path.isdir(path) and len(os.listdir(path)) == entries:
+        return path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    payload = b"\0" * 512
+    for i in range(entries):
+        name = os.path.join(path, f"{i:07d}")
+        if i % 100 == 99:
+            # Every other symlink dangles
+            target = f"{i - 1:07d}" if i % 200 == 99 else "missing-target"
+            os.symlink(target, name + ".lnk")
+        elif i % 11 == 10:
+            os.mkdir(name + ".d")
+        else:
+            with open(name + ".bin", "wb") as f:
+                f.write(payload)
+    return path
+
+
+def time_call(func, path, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dir", help="where to build the synthetic directories (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic directories for later runs")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="friendeck-listing-")
+    os.makedirs(root, exist_ok=True)
+    results = []
+    try:
+        for entries in args.entries:
+            path = build_tree(root, entries)
+            # Warm the dentry/inode caches once so both sides see the same state
+            legacy_list(path)
+            case = {"entries": entries}
+            listed = {}
+            for name, func in (("legacy", legacy_list), ("scandir", file_operations.list_directory)):
+                files, timings = time_call(func, path, args.repeat)
+                median = statistics.median(timings)
+                case[name] = {
+                    "median_ms": round(median * 1000, 2),
+                    "min_ms": round(min(timings) * 1000, 2),
+                    "entries_per_s": round(len(files) / max(median, 1e-9)),
+                    "listed": len(files),
+                }
+                listed[name] = files
+            start = time.perf_counter()
+            json.dumps({"status": "success", "files": listed["scandir"], "current_path": path})
+            case["json_encode_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            case["speedup"] = round(case["legacy"]["median_ms"] / max(case["scandir"]["median_ms"], 1e-6), 2)
+            strip = lambda files: [{k: v for k, v in item.items() if k != "is_symlink"} for item in files]
+            case["same_result"] = strip(listed["legacy"]) == strip(listed["scandir"])
+            results.append(case)
+    finally:
+        if not args.keep:
+            if args.dir:
+                for entries in args.entries:
+                    shutil.rmtree(os.path.join(root, f"listing-{entries}"), ignore_errors=True)
+            else:
+                shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps({
+        "benchmark": "listing",
+        "dir": os.path.abspath(root),
+        "repeat": args.repeat,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark chunked-upload temp file preallocation: sparse truncate versus
+fallocate, measured by the sequential read speed of the finished file.
+
+Chunks are written the way two parallel upload workers deliver them: each
+worker takes the next chunk index, and completions interleave out of order.
+After writing, the file is fsync'd and dropped from the page cache with
+posix_fadvise(DONTNEED) so the read pass hits the device. Run it on the
+filesystem you care about (e.g. the microSD card), not tmpfs.
+
+Usage:
+    python benchmarks/bench_preallocation.py --dir /run/media/mmcblk0p1 [--size-mb 512]
+
+Prints one JSON document.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "py_modules"))
+
+import utils  # noqa: E402
+
+READ_BLOCK = 4 * 1024 * 1024
+
+
+def chunk_order(total_chunks, workers, seed):
+    """Completion order of chunks handed out round-robin to parallel workers."""
+    rng = random.Random(seed)
+    pending = [list(range(w, total_chunks, workers)) for w in range(workers)]
+    order = []
+    while any(pending):
+        lane = rng.choice([i for i, p in enumerate(pending) if p])
+        order.append(pending[lane].pop(0))
+    # Retried chunks land late and out of place.
+    for _ in range(max(1, total_chunks // 50)):
+        i = rng.randrange(len(order))
+        order.append(order.pop(i))
+    return order
+
+
+def write_file(path, size, chunk_size, workers, preallocate, seed):
+    total_chunks = (size + chunk_size - 1) // chunk_size
+    payload = os.urandom(chunk_size)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        start = time.perf_counter()
+        allocated = preallocate and utils.fallocate_file(fd, size)
+        if not allocated:
+            os.ftruncate(fd, size)
+        prepare_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for index in chunk_order(total_chunks, workers, seed):
+            offset = index * chunk_size
+            os.pwrite(fd, payload[:min(chunk_size, size - offset)], offset)
+        os.fsync(fd)
+        write_seconds = time.perf_counter() - start
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return allocated, prepare_seconds, write_seconds
+
+
+def read_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        start = time.perf_counter()
+        total = 0
+        while True:
+            data = os.read(fd, READ_BLOCK)
+            if not data:
+                break
+            total += len(data)
+        return total, time.perf_counter() - start
+    finally:
+        os.close(fd)
+
+
+def count_extents(path):
+    try:
+        output = subprocess.run(["filefrag", path], capture_output=True, text=True, timeout=30).stdout
+        return int(output.rsplit(":", 1)[1].split()[0])
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dir", required=True, help="directory on the filesystem under test")
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--chunk-mb", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    chunk_size = args.chunk_mb * 1024 * 1024
+    if utils.get_free_space(args.dir) < size * 2:
+        parser.error(f"need {size * 2} free bytes in {args.dir}")
+
+    results = []
+    for mode in ("sparse", "fallocate"):
+        for run in range(args.runs):
+            path = os.path.join(args.dir, f".bench-prealloc-{mode}-{run}.part")
+            try:
+                allocated, prepare_seconds, write_seconds = write_file(
+                    path, size, chunk_size, args.workers, mode == "fallocate", seed=run
+                )
+                read_bytes, read_seconds = read_file(path)
+                results.append({
+                    "mode": mode,
+                    "run": run,
+                    "fallocate_supported": allocated if mode == "fallocate" else None,
+                    "extents": count_extents(path),
+                    "prepare_ms": round(prepare_seconds * 1000, 2),
+                    "write_mb_s": round(size / 1e6 / max(write_seconds, 1e-9), 1),
+                    "sequential_read_mb_s": round(read_bytes / 1e6 / max(read_seconds, 1e-9), 1),
+                })
+            finally:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    print(json.dumps({
+        "benchmark": "preallocation",
+        "dir": os.path.abspath(args.dir),
+        "size_bytes": size,
+        "chunk_size": chunk_size,
+        "workers": args.workers,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Benchmark upload throughput of the real server routes: /upload and
+/upload-chunk across file sizes, chunk sizes, parallelism and hash algorithms.
+
+The aiohttp app is built by server_manager.setup_main_server_routes and served
+on 127.0.0.1 from its own thread and event loop, as the plugin does; Decky is
+replaced by benchmarks/decky_stub.py. A local aiohttp client sends the same
+form fields as the web page, including file_hash so the server verifies what
+it wrote. Client and server share one process (and GIL), so absolute numbers
+are a lower bound; compare runs made on the same machine.
+
+Every case reports the median MB/s over --repeat runs, p50/p99 request
+latency (per chunk for chunked uploads) and the peak RSS of the process while
+the case ran.
+
+Usage:
+    python benchmarks/bench_upload.py [--sizes-mb 16 128] [--chunk-mb 4 8 16]
+        [--parallel 1 2 4] [--algos sha256 md5] [--repeat 3] [--dir /run/media/mmcblk0p1]
+        [--output results.json] [--baseline previous.json]
+
+Writes one JSON document to --output (default: stdout). With --baseline, each
+case also carries the baseline MB/s and the change in percent.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import asyncio
+import platform
+import argparse
+import resource
+import statistics
+import threading
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "py_modules"))
+
+import decky_stub  # noqa: E402
+
+decky, STUB_ROOT = decky_stub.install()
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import utils  # noqa: E402
+import html_templates  # noqa: E402
+import server_manager  # noqa: E402
+
+# Completed uploads would otherwise pop up desktop notifications.
+utils.send_system_notification = lambda *args, **kwargs: False
+
+READ_BLOCK = 8 * 1024 * 1024
+
+
+class BenchPlugin:
+    """The plugin attributes the upload handlers use."""
+
+    def __init__(self, downloads_dir, data_dir):
+        self.downloads_dir = downloads_dir
+        self.decky_send_dir = data_dir
+        self.text_file_path = os.path.join(data_dir, "Decky-sendtxt.txt")
+        self.main_loop = None
+        self.prevent_sleep_during_transfer_enabled = False
+
+
+class ServerThread:
+    """Runs the real app on its own event loop thread."""
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runner = None
+        self.port = None
+
+    async def _start(self):
+        html_templates.reset_upload_sessions(self.plugin)
+        app = web.Application(client_max_size=1024 ** 4)
+        server_manager.setup_main_server_routes(app, self.plugin)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return self.runner.addresses[0][1]
+
+    async def _stop(self):
+        await html_templates.close_upload_sessions(self.plugin)
+        await self.runner.cleanup()
+
+    def start(self):
+        self.thread.start()
+        self.port = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return f"http://127.0.0.1:{self.port}"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class RssSampler:
+    """Peak resident set size of this process while a case runs."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self.page_size
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._sample())
+
+    def __enter__(self):
+        self.peak = self._sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._sample())
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def make_source(directory, size):
+    path = os.path.join(directory, f"source-{size}.bin")
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        with open(path, "wb") as f:
+            remaining = size
+            while remaining > 0:
+                block = os.urandom(min(READ_BLOCK, remaining))
+                f.write(block)
+                remaining -= len(block)
+    return path
+
+
+def file_hash(path, algo, cache={}):
+    key = (path, algo)
+    if key not in cache:
+        hasher = hashlib.new(algo)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK), b""):
+                hasher.update(block)
+        cache[key] = hasher.hexdigest()
+    return cache[key]
+
+
+async def _post(session, url, form):
+    start = time.perf_counter()
+    async with session.post(url, data=form) as response:
+        body = await response.json(content_type=None)
+        status = response.status
+    if status != 200 or body.get("status") != "success":
+        raise RuntimeError(f"{url} -> {status}: {body}")
+    return time.perf_counter() - start, body
+
+
+async def run_simple(session, base_url, source, size, algo):
+    form = aiohttp.FormData()
+    form.add_field("file_hash", file_hash(source, algo))
+    form.add_field("hash_algo", algo)
+    form.add_field("file_size", str(size))
+    with open(source, "rb") as f:
+        form.add_field("file", f, filename=f"bench-{uuid.uuid4().hex}.bin")
+        start = time.perf_counter()
+        latency, body = await _post(session, f"{base_url}/upload", form)
+        elapsed = time.perf_counter() - start
+    return elapsed, [latency], body["filename"]
+
+
+async def run_chunked(session, base_url, source, size, algo, chunk_size, parallel):
+    upload_id = f"bench_{uuid.uuid4().hex}"
+    filename = f"bench-{uuid.uuid4().hex}.bin"
+    total_chunks = (size + chunk_size - 1) // chunk_size
+    expected_hash = file_hash(source, algo)
+    next_index = iter(range(total_chunks))
+    latencies = []
+    fd = os.open(source, os.O_RDONLY)
+
+    async def worker():
+        for index in next_index:
+            offset = index * chunk_size
+            data = await asyncio.to_thread(os.pread, fd, min(chunk_size, size - offset), offset)
+            form = aiohttp.FormData()
+            for name, value in (
+                ("upload_id", upload_id),
+                ("chunk_index", index),
+                ("total_chunks", total_chunks),
+                ("total_size", size),
+                ("chunk_size", chunk_size),
+                ("chunk_offset", offset),
+                ("filename", filename),
+                ("file_hash", expected_hash),
+                ("hash_algo", algo),
+            ):
+                form.add_field(name, str(value))
+            form.add_field("chunk", data, filename=filename)
+            latency, _ = await _post(session, f"{base_url}/upload-chunk", form)
+            latencies.append(latency)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(min(parallel, total_chunks))))
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+    return elapsed, latencies, filename
+
+
+def summarize(case, size, runs, peak_rss):
+    rates = [size / 1e6 / max(elapsed, 1e-9) for elapsed, _ in runs]
+    latencies = [latency * 1000 for _, run_latencies in runs for latency in run_latencies]
+    return dict(
+        case,
+        runs=len(runs),
+        mb_s=round(statistics.median(rates), 1),
+        mb_s_runs=[round(rate, 1) for rate in rates],
+        latency_ms={
+            "p50": round(percentile(latencies, 50), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "requests": len(latencies),
+        },
+        peak_rss_mb=round(peak_rss / 1e6, 1),
+    )
+
+
+def case_key(case):
+    return (case["endpoint"], case["size_bytes"], case.get("chunk_size"), case.get("parallel"), case["hash_algo"])
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {case_key(case): case for case in json.load(f).get("results", [])}
+    for case in results:
+        previous = baseline.get(case_key(case))
+        if previous and previous.get("mb_s"):
+            case["baseline_mb_s"] = previous["mb_s"]
+            case["change_pct"] = round((case["mb_s"] - previous["mb_s"]) / previous["mb_s"] * 100, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def run_cases(args, base_url, plugin):
+    sources = {size: make_source(STUB_ROOT, size) for size in args.sizes}
+    results = []
+    timeout = aiohttp.ClientTimeout(total=None)
+    connector = aiohttp.TCPConnector(limit=max(args.parallel) + 1)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        cases = []
+        for size in args.sizes:
+            for algo in args.algos:
+                cases.append(({"endpoint": "/upload", "size_bytes": size, "hash_algo": algo}, None))
+                for chunk_size in args.chunk_sizes:
+                    if chunk_size >= size:
+                        continue
+                    for parallel in args.parallel:
+                        cases.append(({
+                            "endpoint": "/upload-chunk",
+                            "size_bytes": size,
+                            "chunk_size": chunk_size,
+                            "parallel": parallel,
+                            "hash_algo": algo,
+                        }, (chunk_size, parallel)))
+
+        for case, chunking in cases:
+            source = sources[case["size_bytes"]]
+            file_hash(source, case["hash_algo"])
+            runs = []
+            with RssSampler() as rss:
+                for _ in range(args.repeat):
+                    if chunking is None:
+                        elapsed, latencies, filename = await run_simple(
+                            session, base_url, source, case["size_bytes"], case["hash_algo"]
+                        )
+                    else:
+                        elapsed, latencies, filename = await run_chunked(
+                            session, base_url, source, case["size_bytes"], case["hash_algo"], *chunking
+                        )
+                    runs.append((elapsed, latencies))
+                    try:
+                        os.remove(os.path.join(plugin.downloads_dir, filename))
+                    except OSError:
+                        pass
+            result = summarize(case, case["size_bytes"], runs, rss.peak)
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[16, 128])
+    parser.add_argument("--chunk-mb", type=float, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--algos", nargs="+", default=["sha256", "md5"], choices=["sha256", "sha1", "md5"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dir", help="upload destination (default: a temporary directory)")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    args = parser.parse_args()
+    args.sizes = [int(mb * 1024 * 1024) for mb in args.sizes_mb]
+    args.chunk_sizes = [int(mb * 1024 * 1024) for mb in args.chunk_mb]
+
+    destination = args.dir or os.path.join(STUB_ROOT, "uploads")
+    destination = os.path.join(destination, f".friendeck-bench-{uuid.uuid4().hex[:8]}")
+    os.makedirs(destination)
+    data_dir = os.path.join(STUB_ROOT, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    plugin = BenchPlugin(destination, data_dir)
+    server = ServerThread(plugin)
+    try:
+        base_url = server.start()
+        results = asyncio.run(run_cases(args, base_url, plugin))
+    finally:
+        server.stop()
+        shutil.rmtree(destination, ignore_errors=True)
+        decky_stub.cleanup(STUB_ROOT)
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    document = json.dumps({
+        "benchmark": "upload",
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dir": args.dir,
+        "repeat": args.repeat,
+        "process_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6, 1),
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(document + "\n")
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
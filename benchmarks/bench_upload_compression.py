@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Benchmark compressed uploads: effective throughput of gzip/deflate/zstd bodies
+versus identity on compressible and incompressible corpora.
+
+For each corpus and encoding it measures the compressed size, the client-side
+compression time and the server-side streaming decode + write time (through
+upload_encoding.StreamDecoder, the same path the upload handlers use). The
+effective throughput at each link speed assumes compression, transfer and
+decoding are pipelined, so the slowest stage wins.
+
+The same payloads are then posted to the real /upload and /upload-chunk routes
+(served on 127.0.0.1 as in bench_upload.py, with content_encoding set and the
+file hash verified), each chunk compressed on its own as the web page does.
+These numbers include multipart parsing, hashing and fsync; --no-server skips
+them.
+
+Usage:
+    python benchmarks/bench_upload_compression.py [--size-mb 64] [--link-mbps 20 100 400]
+        [--chunk-mb 8] [--no-server]
+
+Prints one JSON document.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "py_modules"))
+
+# Installs the Decky stub before any server module is imported
+import bench_upload  # noqa: E402
+import upload_encoding  # noqa: E402
+
+import aiohttp  # noqa: E402
+
+SLICE = 1024 * 1024
+
+
+def make_text_corpus(size):
+    """Emulator-config / log style text."""
+    rng = random.Random(1)
+    keys = ["resolution", "vsync", "audio_latency", "shader_cache", "controller", "frame_limit"]
+    lines = []
+    total = 0
+    while total < size:
+        line = f"[{rng.randint(0, 99999):05d}] {rng.choice(keys)} = {rng.randint(0, 4096)}\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def make_rom_corpus(size):
+    """Uncompressed ROM dump style: padded regions with some repetitive tables."""
+    rng = random.Random(2)
+    parts = []
+    total = 0
+    while total < size:
+        kind = rng.random()
+        if kind < 0.4:
+            block = b"\xff" * 65536
+        elif kind < 0.7:
+            block = bytes(rng.randrange(16) for _ in range(4096)) * 16
+        else:
+            block = rng.randbytes(65536)
+        parts.append(block)
+        total += len(block)
+    return b"".join(parts)[:size]
+
+
+def make_random_corpus(size):
+    """Already-compressed media / archives."""
+    return os.urandom(size)
+
+
+def compress(encoding, level, data):
+    if encoding == "gzip":
+        co = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return co.compress(data) + co.flush()
+    if encoding == "deflate":
+        return zlib.compress(data, level)
+    if encoding == "zstd":
+        return upload_encoding.zstandard.ZstdCompressor(level=level).compress(data)
+    return data
+
+
+def decode_and_write(encoding, payload, expected_size, directory):
+    decoder = upload_encoding.make_decoder(encoding, expected_size)
+    fd, path = tempfile.mkstemp(dir=directory)
+    written = 0
+    try:
+        start = time.perf_counter()
+        view = memoryview(payload)
+        for offset in range(0, len(view), SLICE):
+            data = view[offset:offset + SLICE]
+            if decoder is not None:
+                data = decoder.decode(data)
+            written += os.pwrite(fd, data, written)
+        if decoder is not None:
+            tail = decoder.decode(b"", final=True)
+            written += os.pwrite(fd, tail, written)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+        os.remove(path)
+    if written != expected_size:
+        raise RuntimeError(f"decoded {written} bytes, expected {expected_size}")
+    return elapsed
+
+
+async def post_upload(session, base_url, encoding, payload, data, digest):
+    """One /upload of the whole (compressed) body; returns seconds and the file name."""
+    filename = f"bench-{uuid.uuid4().hex}.bin"
+    form = aiohttp.FormData()
+    form.add_field("file_hash", digest)
+    form.add_field("hash_algo", "sha256")
+    form.add_field("file_size", str(len(data)))
+    if encoding != "identity":
+        form.add_field("content_encoding", encoding)
+    form.add_field("file", payload, filename=filename)
+    start = time.perf_counter()
+    await bench_upload._post(session, f"{base_url}/upload", form)
+    return time.perf_counter() - start, filename
+
+
+async def post_chunks(session, base_url, encoding, level, data, digest, chunk_size):
+    """/upload-chunk with every chunk compressed separately (before timing); returns seconds, wire bytes, file name."""
+    filename = f"bench-{uuid.uuid4().hex}.bin"
+    upload_id = f"bench_{uuid.uuid4().hex}"
+    total_chunks = (len(data) + chunk_size - 1) // chunk_size
+    chunks = [compress(encoding, level, data[offset:offset + chunk_size]) for offset in range(0, len(data), chunk_size)]
+    start = time.perf_counter()
+    for index, chunk in enumerate(chunks):
+        offset = index * chunk_size
+        form = aiohttp.FormData()
+        for name, value in (
+            ("upload_id", upload_id),
+            ("chunk_index", index),
+            ("total_chunks", total_chunks),
+            ("total_size", len(data)),
+            ("chunk_size", chunk_size),
+            ("chunk_offset", offset),
+            ("filename", filename),
+            ("file_hash", digest),
+            ("hash_algo", "sha256"),
+        ):
+            form.add_field(name, str(value))
+        if encoding != "identity":
+            form.add_field("content_encoding", encoding)
+        form.add_field("chunk", chunk, filename=filename)
+        await bench_upload._post(session, f"{base_url}/upload-chunk", form)
+    return time.perf_counter() - start, sum(len(chunk) for chunk in chunks), filename
+
+
+async def run_endpoints(base_url, plugin, cases, chunk_size):
+    """Post every (entry, payload, data) case through both upload routes."""
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for entry, payload, data in cases:
+            digest = hashlib.sha256(data).hexdigest()
+            seconds, filename = await post_upload(session, base_url, entry["encoding"], payload, data, digest)
+            os.remove(os.path.join(plugin.downloads_dir, filename))
+            entry["upload_mb_s"] = round(len(data) / 1e6 / max(seconds, 1e-9), 1)
+            seconds, wire, filename = await post_chunks(
+                session, base_url, entry["encoding"], entry["level"], data, digest, chunk_size
+            )
+            os.remove(os.path.join(plugin.downloads_dir, filename))
+            entry["upload_chunk_mb_s"] = round(len(data) / 1e6 / max(seconds, 1e-9), 1)
+            entry["upload_chunk_wire_bytes"] = wire
+
+
+def measure_endpoints(cases, chunk_size):
+    destination = os.path.join(bench_upload.STUB_ROOT, "uploads")
+    data_dir = os.path.join(bench_upload.STUB_ROOT, "data")
+    os.makedirs(destination, exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+    plugin = bench_upload.BenchPlugin(destination, data_dir)
+    server = bench_upload.ServerThread(plugin)
+    try:
+        base_url = server.start()
+        asyncio.run(run_endpoints(base_url, plugin, cases, chunk_size))
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--link-mbps", type=float, nargs="+", default=[20.0, 100.0, 400.0],
+                        help="link speeds in megabits per second")
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="directory for decoded output")
+    parser.add_argument("--chunk-mb", type=float, default=8, help="chunk size for /upload-chunk")
+    parser.add_argument("--no-server", action="store_true", help="only measure the decoder, not the routes")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    corpora = {
+        "text": make_text_corpus(size),
+        "rom": make_rom_corpus(size),
+        "random": make_random_corpus(size),
+    }
+    encodings = [("identity", 0), ("gzip", 1), ("gzip", 6), ("deflate", 6)]
+    if upload_encoding.zstandard is not None:
+        encodings += [("zstd", 3), ("zstd", 9)]
+
+    results = []
+    cases = []
+    for corpus_name, data in corpora.items():
+        for encoding, level in encodings:
+            start = time.perf_counter()
+            payload = compress(encoding, level, data)
+            compress_seconds = time.perf_counter() - start
+            decode_seconds = decode_and_write(encoding, payload, len(data), args.dir)
+            entry = {
+                "corpus": corpus_name,
+                "encoding": encoding,
+                "level": level,
+                "original_bytes": len(data),
+                "wire_bytes": len(payload),
+                "ratio": round(len(data) / max(len(payload), 1), 3),
+                "compress_mb_s": round(len(data) / 1e6 / max(compress_seconds, 1e-9), 1),
+                "decode_write_mb_s": round(len(data) / 1e6 / max(decode_seconds, 1e-9), 1),
+                "effective_mb_s": {},
+            }
+            for mbps in args.link_mbps:
+                wire_seconds = len(payload) * 8 / (mbps * 1e6)
+                stage_seconds = [wire_seconds, decode_seconds]
+                if encoding != "identity":
+                    stage_seconds.append(compress_seconds)
+                entry["effective_mb_s"][f"{mbps:g}mbps"] = round(len(data) / 1e6 / max(stage_seconds), 1)
+            results.append(entry)
+            cases.append((entry, payload, data))
+
+    try:
+        if not args.no_server:
+            measure_endpoints(cases, int(args.chunk_mb * 1024 * 1024))
+    finally:
+        bench_upload.decky_stub.cleanup(bench_upload.STUB_ROOT)
+
+    print(json.dumps({
+        "benchmark": "upload_compression",
+        "size_bytes": size,
+        "zstd_available": upload_encoding.zstandard is not None,
+        "chunk_size": None if args.no_server else int(args.chunk_mb * 1024 * 1024),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
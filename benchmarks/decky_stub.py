@@ -0,0 +1,88 @@
+"""
+Stand-in for the `decky` module (see decky.pyi) so backend code can run
+outside Decky Loader.
+
+Constants follow the environment variables documented in decky.pyi. Unset
+ones fall back to directories under a private temporary DECKY_HOME.
+Events passed to emit() are counted instead of being sent to a frontend.
+
+Call install() before importing anything from py_modules.
+"""
+
+import os
+import sys
+import types
+import shutil
+import logging
+import tempfile
+import collections
+
+__version__ = '1.0.0'
+
+
+def _build(root):
+    module = types.ModuleType("decky")
+    module.__doc__ = __doc__
+    module.__version__ = __version__
+
+    env = os.environ.get
+    module.HOME = env("HOME", root)
+    module.USER = env("USER", "deck")
+    module.DECKY_VERSION = env("DECKY_VERSION", "stub")
+    module.DECKY_USER = env("DECKY_USER", module.USER)
+    module.DECKY_USER_HOME = env("DECKY_USER_HOME", module.HOME)
+    module.DECKY_HOME = env("DECKY_HOME", os.path.join(root, "homebrew"))
+    module.DECKY_PLUGIN_NAME = env("DECKY_PLUGIN_NAME", "Friendeck")
+    module.DECKY_PLUGIN_VERSION = env("DECKY_PLUGIN_VERSION", "0.0.0")
+    module.DECKY_PLUGIN_AUTHOR = env("DECKY_PLUGIN_AUTHOR", "")
+    module.DECKY_PLUGIN_DIR = env(
+        "DECKY_PLUGIN_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    for name, sub in (
+        ("DECKY_PLUGIN_SETTINGS_DIR", "settings"),
+        ("DECKY_PLUGIN_RUNTIME_DIR", "data"),
+        ("DECKY_PLUGIN_LOG_DIR", "logs"),
+    ):
+        path = env(name, os.path.join(module.DECKY_HOME, sub, "friendeck"))
+        os.makedirs(path, exist_ok=True)
+        setattr(module, name, path)
+    module.DECKY_PLUGIN_LOG = env(
+        "DECKY_PLUGIN_LOG", os.path.join(module.DECKY_PLUGIN_LOG_DIR, "plugin.log")
+    )
+
+    def migrate_any(target_dir, *files_or_directories):
+        return {}
+
+    module.migrate_any = migrate_any
+    module.migrate_settings = lambda *paths: migrate_any(module.DECKY_PLUGIN_SETTINGS_DIR, *paths)
+    module.migrate_runtime = lambda *paths: migrate_any(module.DECKY_PLUGIN_RUNTIME_DIR, *paths)
+    module.migrate_logs = lambda *paths: migrate_any(module.DECKY_PLUGIN_LOG_DIR, *paths)
+
+    module.logger = logging.getLogger("decky-stub")
+    module.emitted = collections.Counter()
+
+    async def emit(event, *args):
+        module.emitted[event] += 1
+
+    module.emit = emit
+    return module
+
+
+def install(root=None):
+    """Register the stub as ``decky`` and point HOME at a throwaway directory.
+
+    Backend modules derive their data paths (upload journal, hash store, text
+    file) from HOME, so a benchmark never touches the real ones.
+
+    Returns:
+        (module, root): the stub and the temporary root, removed by cleanup(root)
+    """
+    root = root or tempfile.mkdtemp(prefix="friendeck-bench-")
+    os.environ["HOME"] = root
+    module = _build(root)
+    sys.modules["decky"] = module
+    return module, root
+
+
+def cleanup(root):
+    shutil.rmtree(root, ignore_errors=True)
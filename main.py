@@ -9,6 +9,23 @@
 #   py_modules/file_operations.py - File system operations
 #   py_modules/html_templates.py  - HTML templates and HTTP handlers
 #   py_modules/server_manager.py  - Server lifecycle management
+#   py_modules/upload_journal.py  - Crash-safe chunked upload session journal
+#   py_modules/upload_sessions.py - Chunked upload session state
+#   py_modules/upload_tuning.py   - Upload plan (chunk size / parallelism) tuning
+#   py_modules/hash_store.py      - Content hash store for instant uploads
+#   py_modules/upload_encoding.py - Streaming decode of compressed upload bodies
+#   py_modules/completion_pipeline.py - Background post-upload events and notifications
+#   py_modules/transfer_progress.py - Aggregated transfer progress snapshots
+#   py_modules/io_scheduler.py - Upload admission control and fair disk write scheduling
+#   py_modules/listing_pages.py - Cursor-paginated directory listings
+#   py_modules/listing_cache.py - inotify-invalidated directory listing cache
+#   py_modules/storage_analyzer.py - Background recursive directory sizes
+#   py_modules/search_index.py - Persistent filename search index
+#   py_modules/file_jobs.py - Background copy / move / delete jobs
+#   py_modules/copy_engine.py - Reflink / copy_file_range file copies
+#   py_modules/cross_move.py - Resumable moves between filesystems
+#   py_modules/text_reader.py - Ranged / tail reads of large text files
+#   py_modules/file_writer.py - Atomic, streamed and delta file saves
 #
 # NOTE: Decky automatically adds py_modules/ to sys.path, so we import
 # modules directly (e.g., "import config") instead of using package imports
@@ -15,4 +15,21 @@
 #   file_operations - File system CRUD operations
 #   html_templates  - HTML templates and HTTP handlers
 #   server_manager  - Server lifecycle management
+#   upload_journal  - Crash-safe chunked upload session journal
+#   upload_sessions - Chunked upload session state
+#   upload_tuning   - Upload plan (chunk size / parallelism) tuning
+#   hash_store      - Content hash store for instant uploads
+#   upload_encoding - Streaming decode of compressed upload bodies
+#   completion_pipeline - Background post-upload events and notifications
+#   transfer_progress - Aggregated transfer progress snapshots
+#   io_scheduler    - Upload admission control and fair disk write scheduling
+#   listing_pages   - Cursor-paginated directory listings
+#   listing_cache   - inotify-invalidated directory listing cache
+#   storage_analyzer - Background recursive directory sizes
+#   search_index    - Persistent filename search index
+#   file_jobs       - Background copy / move / delete jobs
+#   copy_engine     - Reflink / copy_file_range file copies
+#   cross_move      - Resumable moves between filesystems
+#   text_reader     - Ranged / tail reads of large text files
+#   file_writer     - Atomic, streamed and delta file saves
 
@@ -0,0 +1,122 @@
+# completion_pipeline.py - Post-upload completion work for decky-send
+#
+# This module moves everything that happens after an upload is durable and
+# verified off the request path:
+# - Bounded queue of completed transfers, drained by one worker task
+# - transfer_status / transfer_complete events per transfer
+# - Text file clearing and notifications once per drained group, so a burst of
+#   completions produces one notify-send and one queue rewrite, not one each
+
+import asyncio
+from dataclasses import dataclass
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import utils
+
+NOTIFICATION_TITLE = "文件传输完成"
+
+
+@dataclass
+class Completion:
+    """One finished transfer (a file, or a batch shown under one label)."""
+
+    label: str
+    size: int
+    count: int = 1
+
+
+def _clear_text_file(path):
+    try:
+        with open(path, "w") as f:
+            f.write("")
+        config.logger.info(f"Cleared text file after file transfer: {path}")
+    except Exception as e:
+        config.logger.error(f"Error clearing text file: {e}")
+
+
+class CompletionPipeline:
+    """Queue of completed transfers processed by a background worker.
+
+    ``submit`` never blocks the caller. If the queue is full the transfer is
+    still counted in the next notification; only its per-transfer events are
+    skipped.
+    """
+
+    def __init__(self, emit, text_file_path, maxsize=256):
+        """
+        Args:
+            emit: Coroutine function ``emit(event, payload)`` forwarding to Decky
+            text_file_path: Callable returning the text transfer file to clear
+            maxsize: Maximum number of queued completions
+        """
+        self._emit = emit
+        self._text_file_path = text_file_path
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._overflow = 0
+        self._worker = None
+
+    def submit(self, label, size, count=1):
+        """Queue a completed transfer; returns immediately."""
+        try:
+            self._queue.put_nowait(Completion(label, size, count))
+        except asyncio.QueueFull:
+            self._overflow += count
+            config.logger.warning(f"Completion queue full, folding {label} into the next notification")
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            group = [await self._queue.get()]
+            while not self._queue.empty():
+                group.append(self._queue.get_nowait())
+            try:
+                await self._process(group)
+            except Exception as e:
+                config.logger.error(f"Completion pipeline error: {e}")
+            finally:
+                for _ in group:
+                    self._queue.task_done()
+
+    async def _process(self, group):
+        for item in group:
+            await self._emit("transfer_status", [item.label, item.size, item.size, 0, 0])
+            await self._emit("transfer_complete", [item.label])
+
+        await asyncio.to_thread(_clear_text_file, self._text_file_path())
+
+        total = sum(item.count for item in group) + self._overflow
+        self._overflow = 0
+        if not total:
+            return
+        if total == 1 and group and group[0].count == 1:
+            message = f"文件 '{group[0].label}' 已成功上传到 Steam Deck"
+        else:
+            message = f"{total} 个文件已成功上传到 Steam Deck"
+        try:
+            await self._emit("_show_notification", {
+                "title": NOTIFICATION_TITLE,
+                "body": message,
+                "duration": 5
+            })
+        except Exception as notify_error:
+            config.logger.error(f"Failed to emit Decky notification for file upload: {notify_error}")
+        await asyncio.to_thread(utils.send_system_notification, NOTIFICATION_TITLE, message, 5)
+        await asyncio.to_thread(utils.queue_notification, NOTIFICATION_TITLE, message)
+
+    async def close(self, timeout=5.0):
+        """Let the worker finish what is queued (up to ``timeout``), then stop it."""
+        if self._worker is not None and not self._worker.done():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                config.logger.warning("Completion pipeline did not drain before shutdown")
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._overflow:
+            try:
+                await self._process([])
+            except Exception as e:
+                config.logger.error(f"Completion pipeline error: {e}")
@@ -60,6 +60,18 @@ SWITCH_FILE_PATH = os.path.join(DECKY_SEND_DIR, "decky-sendswitch.txt")
 # Toast queue file path (for background notifications)
 NOTIFICATION_QUEUE_PATH = os.path.join(DECKY_SEND_DIR, "notification_queue.json")
 
+# Chunked upload session journal (for resuming uploads after restarts)
+UPLOAD_JOURNAL_PATH = os.path.join(DECKY_SEND_DIR, "upload_journal.json")
+
+# Content hash store of received files (for instant re-uploads)
+HASH_STORE_PATH = os.path.join(DECKY_SEND_DIR, "hash_store.json")
+
+# Filename search index (SQLite)
+SEARCH_INDEX_PATH = os.path.join(DECKY_SEND_DIR, "search_index.db")
+
+# Resume offsets of large files being moved across filesystems
+MOVE_JOURNAL_PATH = os.path.join(DECKY_SEND_DIR, "move_journal.json")
+
 # =============================================================================
 # Server Configuration
 # =============================================================================
@@ -94,6 +106,83 @@ WATCHDOG_CHECK_INTERVAL = 10.0
 PORT_CHECK_RETRIES = 5
 PORT_CHECK_RETRY_DELAY = 0.5
 
+# Upload journal flush interval (seconds) - chunk progress is batched into
+# one journal rewrite per interval
+UPLOAD_JOURNAL_FLUSH_INTERVAL = 1.0
+
+# Upload plan write probe - bytes written (and fdatasync'd) to measure a
+# destination filesystem, and how long the measurement is reused (seconds)
+UPLOAD_WRITE_PROBE_SIZE = 4 * 1024 * 1024
+UPLOAD_WRITE_PROBE_TTL = 3600.0
+
+# Maximum number of files remembered by the content hash store
+HASH_STORE_MAX_ENTRIES = 20000
+
+# Upload I/O scheduling - concurrent disk writers per filesystem, upload
+# streams admitted per filesystem and per client before answering 503, and
+# the Retry-After (seconds) sent with it
+UPLOAD_MAX_WRITERS_PER_FS = 2
+UPLOAD_MAX_STREAMS_PER_FS = 12
+UPLOAD_MAX_STREAMS_PER_CLIENT = 6
+UPLOAD_BUSY_RETRY_AFTER = 2
+
+# Directory listing cache - cached directories, total cached rows (about
+# 0.5 KB each) and inotify watches; beyond the watch limit listings are
+# validated by directory mtime instead
+LISTING_CACHE_MAX_ENTRIES = 64
+LISTING_CACHE_MAX_ROWS = 100000
+LISTING_CACHE_MAX_WATCHES = 128
+
+# Storage analysis - scanner threads, seconds a scanned directory is reused
+# without re-checking its mtime, cached directories, largest files kept per
+# directory, and seconds a request waits before answering 202 (scanning)
+STORAGE_SCAN_WORKERS = 4
+STORAGE_REVALIDATE_AFTER = 60
+STORAGE_MAX_CACHED_DIRS = 200000
+STORAGE_TOP_FILES_PER_DIR = 16
+STORAGE_SCAN_WAIT = 1.0
+
+# Filename search index - seconds between mtime rescans, maximum indexed
+# entries, inotify watches (shallowest directories first) and directory
+# names never descended into (caches and per-game Proton prefixes)
+SEARCH_INDEX_RESCAN_INTERVAL = 900
+SEARCH_INDEX_MAX_ENTRIES = 2000000
+SEARCH_INDEX_MAX_WATCHES = 2048
+SEARCH_INDEX_SKIP_DIRS = (
+    ".cache", "shadercache", "compatdata", ".git", "node_modules", "__pycache__", ".Trash-1000",
+)
+
+# File jobs (copy / move / delete) - concurrent jobs, and how many finished
+# jobs are kept for how long (seconds) so a reopened page can look them up
+FILE_JOB_WORKERS = 2
+FILE_JOB_KEEP_FINISHED = 50
+FILE_JOB_FINISHED_TTL = 3600
+
+# File copies - files up to this size are copied concurrently when copying a
+# tree, by this many threads per destination device type (unknown devices,
+# NVMe / SATA SSD, SD card, rotational disk)
+COPY_SMALL_FILE_SIZE = 1024 * 1024
+COPY_WORKERS_DEFAULT = 4
+COPY_WORKERS_SSD = 8
+COPY_WORKERS_SDCARD = 4
+COPY_WORKERS_ROTATIONAL = 2
+
+# Moves across filesystems - bytes of a large file copied between fdatasync
+# checkpoints (a resumed move restarts from the last one), and small files
+# committed per syncfs batch
+MOVE_SYNC_INTERVAL = 64 * 1024 * 1024
+MOVE_BATCH_FILES = 256
+
+# File reads - largest file returned whole (to the editor), bytes and lines
+# per ranged / tail read, and files whose line index is kept
+READ_WHOLE_MAX_BYTES = 8 * 1024 * 1024
+READ_RANGE_MAX_BYTES = 2 * 1024 * 1024
+READ_RANGE_MAX_LINES = 20000
+READ_LINE_INDEX_CACHE_ENTRIES = 16
+
+# File saves - edit operations accepted in one delta save
+WRITE_MAX_EDITS = 10000
+
 # =============================================================================
 # Settings Keys
 # =============================================================================
@@ -0,0 +1,257 @@
+# copy_engine.py - File copy strategies for decky-send
+#
+# This module copies file data with as little userspace work as possible:
+# - Per file: FICLONE reflink (instant, shares extents on btrfs / XFS), then
+#   os.copy_file_range (in-kernel copy), then os.sendfile, then read/write
+# - A strategy the kernel refuses for a (source device, destination device)
+#   pair is not tried again for that pair
+# - Small files are copied concurrently on a thread pool per destination
+#   device, sized by device type (NVMe / SSD, SD card, rotational)
+# - Metadata (mode, timestamps, extended attributes) preserved like copy2
+
+import os
+import errno
+import fcntl
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+
+# ioctl(2) request to share extents between files (btrfs, XFS, bcachefs)
+_FICLONE = 0x40049409
+
+# Bytes per kernel call: bounds the time between progress / cancel checks
+_CHUNK = 8 * 1024 * 1024
+
+# Errors meaning "this strategy does not work for these files", not "the copy failed"
+_UNSUPPORTED = frozenset((
+    errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY, errno.EBADF, errno.ETXTBSY,
+))
+
+METHODS = ("reflink", "copy_file_range", "sendfile", "readwrite")
+
+_refused = {}
+_refused_lock = threading.Lock()
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _Unsupported(Exception):
+    """A strategy refused the copy before writing anything."""
+
+
+def clone(src_fd, dst_fd):
+    """Make the empty ``dst_fd`` share all of ``src_fd``'s extents (reflink).
+
+    Returns:
+        bool: False if the filesystems cannot clone between these files
+    """
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in _UNSUPPORTED or e.errno == errno.EPERM:
+            return False
+        raise
+    return True
+
+
+def _reflink(src_fd, dst_fd, offset, on_progress, checkpoint):
+    if not clone(src_fd, dst_fd):
+        raise _Unsupported()
+    on_progress(os.fstat(dst_fd).st_size)
+
+
+def _kernel_loop(copy):
+    """Build a strategy from ``copy(src_fd, dst_fd, offset, count) -> bytes``."""
+
+    def run(src_fd, dst_fd, offset, on_progress, checkpoint):
+        start = offset
+        while True:
+            checkpoint()
+            try:
+                copied = copy(src_fd, dst_fd, offset, _CHUNK)
+            except OSError as e:
+                if offset == start and e.errno in _UNSUPPORTED:
+                    raise _Unsupported() from e
+                raise
+            if copied == 0:
+                # Some filesystems (procfs, some FUSE) report EOF at once
+                if offset == start and os.fstat(src_fd).st_size > offset:
+                    raise _Unsupported()
+                return
+            offset += copied
+            on_progress(copied)
+
+    return run
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _readwrite(src_fd, dst_fd, offset, on_progress, checkpoint):
+    while True:
+        checkpoint()
+        chunk = os.pread(src_fd, 1024 * 1024, offset)
+        if not chunk:
+            return
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(dst_fd, view, offset)
+            view = view[written:]
+            offset += written
+        on_progress(len(chunk))
+
+
+_STRATEGIES = {
+    "reflink": _reflink,
+    "copy_file_range": _kernel_loop(_copy_file_range),
+    "sendfile": _kernel_loop(_sendfile),
+    "readwrite": _readwrite,
+}
+
+
+def _noop(*args):
+    pass
+
+
+def copy_data(src_fd, dst_fd, offset=0, on_progress=None, checkpoint=None):
+    """Copy the data of ``src_fd`` from ``offset`` on to the same offset of ``dst_fd``.
+
+    ``dst_fd`` must already hold the first ``offset`` bytes (0 for a new
+    file). Blocking; see copy_file for the callbacks.
+
+    Returns:
+        str: the strategy that copied the data (see METHODS)
+    """
+    on_progress = on_progress or _noop
+    checkpoint = checkpoint or _noop
+    key = (os.fstat(src_fd).st_dev, os.fstat(dst_fd).st_dev)
+    for method in METHODS:
+        # A clone is all or nothing, so it cannot continue a partial copy
+        if method in _refused.get(key, ()) or (offset and method == "reflink"):
+            continue
+        # sendfile writes at the destination's file position
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        try:
+            _STRATEGIES[method](src_fd, dst_fd, offset, on_progress, checkpoint)
+            return method
+        except _Unsupported:
+            with _refused_lock:
+                _refused.setdefault(key, set()).add(method)
+            # Nothing was written; the next strategy starts from the same offset
+            os.ftruncate(dst_fd, offset)
+
+
+def copy_file(src, dst, on_progress=None, checkpoint=None):
+    """Copy one regular file's data and metadata. Blocking.
+
+    ``on_progress(bytes)`` is called as data is copied; ``checkpoint()`` is
+    called between chunks and may raise to abort. An aborted or failed copy
+    removes ``dst`` rather than leaving a truncated file.
+
+    Returns:
+        str: the strategy that copied the data (see METHODS)
+    """
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            method = copy_data(fsrc.fileno(), fdst.fileno(), 0, on_progress, checkpoint)
+        shutil.copystat(src, dst)
+    except BaseException:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        raise
+    return method
+
+
+# =============================================================================
+# Parallel copies
+# =============================================================================
+
+def _device_workers(path):
+    """Concurrent small-file copies worth running on the device holding ``path``."""
+    try:
+        st = os.stat(path)
+        block = os.path.realpath(f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}")
+    except OSError:
+        return config.COPY_WORKERS_DEFAULT
+    if not os.path.isdir(block):
+        # No block device (btrfs subvolume, overlay, tmpfs, network)
+        return config.COPY_WORKERS_DEFAULT
+    # Partitions keep the queue settings on their parent disk
+    queue = os.path.join(block, "queue")
+    if not os.path.isdir(queue):
+        queue = os.path.join(os.path.dirname(block), "queue")
+    try:
+        with open(os.path.join(queue, "rotational")) as f:
+            rotational = f.read().strip() == "1"
+    except OSError:
+        return config.COPY_WORKERS_DEFAULT
+    if rotational:
+        return config.COPY_WORKERS_ROTATIONAL
+    if "/mmcblk" in block:
+        return config.COPY_WORKERS_SDCARD
+    return config.COPY_WORKERS_SSD
+
+
+def _pool_for(path):
+    dev = os.stat(path).st_dev
+    with _pools_lock:
+        pool = _pools.get(dev)
+        if pool is None:
+            workers = _device_workers(path)
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"copy-{dev}")
+            _pools[dev] = pool
+        return pool
+
+
+class ParallelCopier:
+    """Runs many small copies concurrently on the destination device's pool.
+
+    Use as a context manager: leaving the block waits for every submitted
+    copy and raises the first error; on an error inside the block, queued
+    copies are dropped and running ones are waited for.
+    """
+
+    def __init__(self, destination):
+        self._pool = _pool_for(destination)
+        self._limit = self._pool._max_workers * 4
+        self._pending = set()
+
+    def submit(self, func, *args):
+        # Bound the queue so a 100k-file tree does not become 100k futures
+        if len(self._pending) >= self._limit:
+            self._reap(block=True)
+        self._pending.add(self._pool.submit(func, *args))
+
+    def _reap(self, block):
+        done, self._pending = wait(self._pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def wait(self):
+        """Wait for every copy submitted so far; raise the first error."""
+        while self._pending:
+            self._reap(block=True)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            for future in self._pending:
+                future.cancel()
+            wait(self._pending)
+            self._pending = set()
+        return False
@@ -0,0 +1,276 @@
+# cross_move.py - Moves between filesystems for decky-send
+#
+# A move between internal storage and an SD card cannot be a rename; this
+# module streams it file by file instead:
+# - Each file is copied (copy_engine, large blocks) to a hidden .partial file
+#   next to its destination, made durable, optionally verified by SHA-256,
+#   then renamed into place
+# - A source file is unlinked only after its copy is committed, so an
+#   interrupted move leaves every file complete at the source or the
+#   destination, never lost and never half-copied under its real name
+# - Large files checkpoint their durable offset in a journal; running the
+#   same move again resumes them from there
+# - Small files are copied concurrently and committed in batches with one
+#   syncfs per batch instead of one fsync per file
+
+import os
+import stat
+import json
+import shutil
+import hashlib
+import threading
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import utils
+import copy_engine
+
+_HASH_CHUNK = 1024 * 1024
+
+# NAME_MAX on Linux filesystems (ext4, btrfs, exFAT, vfat)
+_NAME_MAX = 255
+
+
+def _partial_path(dst):
+    directory, name = os.path.split(dst)
+    partial = f".{name}.partial"
+    if len(partial.encode("utf-8", "surrogateescape")) > _NAME_MAX:
+        partial = f".{hashlib.sha1(os.fsencode(name)).hexdigest()}.partial"
+    return os.path.join(directory, partial)
+
+
+def _sha256(fd, drop_cache):
+    """SHA-256 of an open file; with ``drop_cache`` it is read back from the device."""
+    if drop_cache:
+        # Only clean pages are dropped, so the caller has fdatasync'd
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    digest = hashlib.sha256()
+    offset = 0
+    while True:
+        chunk = os.pread(fd, _HASH_CHUNK, offset)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+        offset += len(chunk)
+
+
+class MoveJournal:
+    """Durable offsets of partially moved large files, keyed by .partial path.
+
+    Entries record the source identity (path, size, mtime) so a partial copy
+    is only resumed while the source is unchanged. Written synchronously from
+    job threads; a write costs one fsync and happens once per sync interval
+    of a large file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.MOVE_JOURNAL_PATH
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            config.logger.warning(f"Ignoring unreadable move journal {self.path}: {e}")
+            return
+        entries = data.get("partials") if isinstance(data, dict) else None
+        if isinstance(entries, dict):
+            # Partials removed by hand (or on another card) are forgotten
+            self._entries = {
+                partial: entry for partial, entry in entries.items()
+                if isinstance(entry, dict) and os.path.exists(partial)
+            }
+
+    def get(self, partial):
+        with self._lock:
+            self._load()
+            return self._entries.get(partial)
+
+    def record(self, partial, entry):
+        with self._lock:
+            self._load()
+            self._entries[partial] = entry
+            self._write()
+
+    def forget(self, partial):
+        with self._lock:
+            self._load()
+            if self._entries.pop(partial, None) is not None:
+                self._write()
+
+    def _write(self):
+        utils.write_json_atomic(self.path, {"version": 1, "partials": self._entries})
+
+
+_journal = MoveJournal()
+
+
+def _resume_offset(journal, partial, src, st):
+    """Bytes of ``partial`` known durable for this exact source, else 0."""
+    entry = journal.get(partial)
+    if entry is None:
+        return 0
+    if entry.get("source") != src or entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+        journal.forget(partial)
+        return 0
+    try:
+        if os.path.getsize(partial) < entry.get("offset", 0):
+            return 0
+    except OSError:
+        return 0
+    return entry.get("offset", 0)
+
+
+def _copy_to_partial(job, src, dst, st, durable, verify, journal):
+    """Copy ``src`` to the .partial file of ``dst`` and rename it into place.
+
+    With ``durable`` the data is fdatasync'd before the rename, progress is
+    journaled every MOVE_SYNC_INTERVAL bytes and a journaled partial copy is
+    resumed; otherwise the caller makes a whole batch durable at once.
+    """
+    partial = _partial_path(dst)
+    offset = _resume_offset(journal, partial, src, st) if durable else 0
+    if offset:
+        config.logger.info(f"Resuming move of {src} at {offset} of {st.st_size} bytes")
+        job.add_bytes(offset)
+    try:
+        with open(src, "rb") as fsrc, open(partial, "r+b" if offset else "w+b") as fdst:
+            src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+            # Anything past the journaled offset may never have reached the disk
+            os.ftruncate(dst_fd, offset)
+            on_progress = job.add_bytes
+            if durable and st.st_size - offset > config.MOVE_SYNC_INTERVAL:
+                progress = {"copied": offset, "synced": offset}
+
+                def on_progress(count):
+                    job.add_bytes(count)
+                    progress["copied"] += count
+                    if progress["copied"] - progress["synced"] >= config.MOVE_SYNC_INTERVAL:
+                        os.fdatasync(dst_fd)
+                        progress["synced"] = progress["copied"]
+                        journal.record(partial, {
+                            "source": src, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                            "offset": progress["synced"],
+                        })
+
+            copy_engine.copy_data(src_fd, dst_fd, offset, on_progress, job.checkpoint)
+            if durable:
+                os.fdatasync(dst_fd)
+            if verify and _sha256(src_fd, False) != _sha256(dst_fd, True):
+                journal.forget(partial)
+                raise OSError(f"Verification failed: the copy of {src} differs from the original")
+        shutil.copystat(src, partial)
+        os.replace(partial, dst)
+    except BaseException:
+        # Keep a journaled partial copy for the next attempt; drop anything else
+        if journal.get(partial) is None:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+        raise
+    journal.forget(partial)
+
+
+class _Batch:
+    """Sources whose copies are in place but not yet flushed to disk."""
+
+    def __init__(self):
+        self._sources = []
+        self._lock = threading.Lock()
+
+    def add(self, src):
+        with self._lock:
+            self._sources.append(src)
+
+    def commit(self, destination):
+        """Flush the destination filesystem, then unlink the batch's sources."""
+        with self._lock:
+            sources, self._sources = self._sources, []
+        if not sources:
+            return
+        utils.sync_filesystem(destination)
+        for src in sources:
+            os.remove(src)
+
+
+def _move_entry(job, src, dst, st, durable, verify, batch):
+    if stat.S_ISLNK(st.st_mode):
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.symlink(os.readlink(src), dst)
+    elif stat.S_ISREG(st.st_mode):
+        _copy_to_partial(job, src, dst, st, durable, verify, _journal)
+    else:
+        # FIFOs, sockets and device nodes hold no data to move; leave them
+        config.logger.warning(f"Move skipped special file {src}")
+        job.add_files()
+        return
+    if durable:
+        # The rename must be on disk before the source goes away
+        utils.fsync_dir(os.path.dirname(dst))
+        os.remove(src)
+    else:
+        batch.add(src)
+    job.add_files()
+
+
+def move_tree(job, source, destination, verify=False):
+    """Move a file or directory tree to another filesystem. Blocking.
+
+    ``job`` provides ``checkpoint()``, ``add_bytes(count)`` and
+    ``add_files(count)`` (a file_jobs.FileJob). Existing destination
+    directories are merged into and existing files replaced. When it raises
+    (cancelled or failed), every file is complete at the source or at the
+    destination; moving again continues where this attempt stopped.
+    """
+    st = os.lstat(source)
+    if not stat.S_ISDIR(st.st_mode):
+        _move_entry(job, source, destination, st, True, verify, None)
+        return
+    os.makedirs(destination, exist_ok=True)
+    batch = _Batch()
+    walked = []
+    try:
+        with copy_engine.ParallelCopier(destination) as copier:
+            queued = 0
+            for root, dirs, files in os.walk(source):
+                job.checkpoint()
+                walked.append(root)
+                target = os.path.join(destination, os.path.relpath(root, source))
+                os.makedirs(target, exist_ok=True)
+                # Symlinked directories are moved as links, not followed
+                names = files + [d for d in dirs if os.path.islink(os.path.join(root, d))]
+                for name in names:
+                    src, dst = os.path.join(root, name), os.path.join(target, name)
+                    est = os.lstat(src)
+                    if stat.S_ISREG(est.st_mode) and est.st_size > config.COPY_SMALL_FILE_SIZE:
+                        _move_entry(job, src, dst, est, True, verify, batch)
+                        continue
+                    # Verified files need their own fdatasync to be read back from disk
+                    copier.submit(_move_entry, job, src, dst, est, verify, verify, batch)
+                    queued += 1
+                    if queued >= config.MOVE_BATCH_FILES:
+                        copier.wait()
+                        batch.commit(destination)
+                        queued = 0
+    finally:
+        # Copies that completed before an error or cancel are committed too
+        batch.commit(destination)
+
+    # Deepest first; a directory that still has entries (skipped special
+    # files, or files created meanwhile) stays at the source
+    for root in reversed(walked):
+        target = os.path.join(destination, os.path.relpath(root, source))
+        shutil.copystat(root, target)
+        try:
+            os.rmdir(root)
+        except OSError as e:
+            config.logger.warning(f"Move left {root} in place: {e}")
@@ -0,0 +1,330 @@
+# file_jobs.py - Background file operation jobs for decky-send
+#
+# This module keeps long copy / move / delete operations off the event loop:
+# - Jobs run in a bounded worker pool and are addressed by id
+# - Progress in bytes and files, with throughput over the last seconds
+# - Cancel and pause / resume, checked between chunks and between files
+# - Finished jobs are kept for a while so a reopened page can still see them
+# - File data is copied by copy_engine (reflink / copy_file_range first), and
+#   small files of a tree are copied concurrently
+# - Moves across filesystems stream file by file (cross_move) and resume
+
+import os
+import stat
+import errno
+import time
+import uuid
+import shutil
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import copy_engine
+import cross_move
+
+KINDS = ("copy", "move", "delete")
+
+_SPEED_WINDOW = 5.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's worker when the job is cancelled."""
+
+
+class FileJob:
+    """One copy, move or delete operation and its progress."""
+
+    def __init__(self, kind, source, destination=None, verify=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.source = source
+        self.destination = destination
+        # Moves across filesystems: compare SHA-256 before removing each source file
+        self.verify = verify
+        self.state = "queued"
+        self.error = None
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.files_total = 0
+        self.files_done = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._samples = deque()
+        # Progress is reported from several copy threads at once
+        self._progress_lock = threading.Lock()
+        self._cancelled = threading.Event()
+        # Set while the job may run; cleared to pause it
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def checkpoint(self):
+        """Block while paused; raise JobCancelled once cancelled. Worker threads only."""
+        if not self._running.is_set():
+            self.state = "paused"
+            while not self._running.wait(0.5):
+                if self._cancelled.is_set():
+                    break
+            if not self._cancelled.is_set():
+                self.state = "running"
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def add_bytes(self, count):
+        with self._progress_lock:
+            self.bytes_done += count
+            now = time.monotonic()
+            self._samples.append((now, self.bytes_done))
+            while len(self._samples) > 2 and now - self._samples[0][0] > _SPEED_WINDOW:
+                self._samples.popleft()
+
+    def add_files(self, count=1):
+        with self._progress_lock:
+            self.files_done += count
+
+    def speed(self):
+        """Bytes per second over the last few seconds (0 when idle)."""
+        with self._progress_lock:
+            if self.state != "running" or len(self._samples) < 2:
+                return 0
+            (t0, b0), (t1, b1) = self._samples[0], self._samples[-1]
+        if time.monotonic() - t1 > _SPEED_WINDOW or t1 <= t0:
+            return 0
+        return int((b1 - b0) / (t1 - t0))
+
+    def to_dict(self):
+        speed = self.speed()
+        remaining = max(self.bytes_total - self.bytes_done, 0)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "source": self.source,
+            "destination": self.destination,
+            "verify": self.verify,
+            "state": self.state,
+            "error": self.error,
+            "bytes_total": self.bytes_total,
+            "bytes_done": self.bytes_done,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "speed": speed,
+            "eta": round(remaining / speed, 1) if speed else None,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# =============================================================================
+# Operations (worker thread)
+# =============================================================================
+
+def _measure(job, path):
+    """Fill in the totals of ``job`` for the tree at ``path`` (symlinks not followed)."""
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        job.files_total += 1
+        job.bytes_total += st.st_size if stat.S_ISREG(st.st_mode) else 0
+        return
+    for root, dirs, files in os.walk(path):
+        job.checkpoint()
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            try:
+                est = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            job.files_total += 1
+            if stat.S_ISREG(est.st_mode):
+                job.bytes_total += est.st_size
+
+
+def _copy_entry(job, src, dst, st=None):
+    st = st or os.lstat(src)
+    if stat.S_ISLNK(st.st_mode):
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.symlink(os.readlink(src), dst)
+    elif stat.S_ISREG(st.st_mode):
+        # Removes a partial dst itself on error or cancel
+        copy_engine.copy_file(src, dst, job.add_bytes, job.checkpoint)
+    job.add_files()
+
+
+def _copy_tree(job, source, destination):
+    """Copy a file or directory tree; existing directories are merged into."""
+    if not stat.S_ISDIR(os.lstat(source).st_mode):
+        _copy_entry(job, source, destination)
+        return
+    os.makedirs(destination, exist_ok=True)
+    # Small files are dominated by per-file syscalls, so they overlap on the
+    # destination device's pool; large files stream one at a time here
+    with copy_engine.ParallelCopier(destination) as copier:
+        for root, dirs, files in os.walk(source):
+            job.checkpoint()
+            target = os.path.join(destination, os.path.relpath(root, source))
+            os.makedirs(target, exist_ok=True)
+            for name in dirs:
+                # Symlinked directories are copied as links, not followed
+                if os.path.islink(os.path.join(root, name)):
+                    _copy_entry(job, os.path.join(root, name), os.path.join(target, name))
+            for name in files:
+                src, dst = os.path.join(root, name), os.path.join(target, name)
+                st = os.lstat(src)
+                if stat.S_ISREG(st.st_mode) and st.st_size <= config.COPY_SMALL_FILE_SIZE:
+                    copier.submit(_copy_entry, job, src, dst, st)
+                else:
+                    _copy_entry(job, src, dst, st)
+    # Directory times last: creating entries above changed them
+    for root, dirs, files in os.walk(source):
+        shutil.copystat(root, os.path.join(destination, os.path.relpath(root, source)))
+
+
+def _delete_entry(job, path):
+    st = os.lstat(path)
+    os.remove(path)
+    job.add_files()
+    if stat.S_ISREG(st.st_mode):
+        job.add_bytes(st.st_size)
+
+
+def _delete_tree(job, path):
+    if not stat.S_ISDIR(os.lstat(path).st_mode):
+        _delete_entry(job, path)
+        return
+    for root, dirs, files in os.walk(path, topdown=False):
+        links = {d for d in dirs if os.path.islink(os.path.join(root, d))}
+        for name in files + sorted(links):
+            job.checkpoint()
+            _delete_entry(job, os.path.join(root, name))
+        for name in dirs:
+            if name not in links:
+                os.rmdir(os.path.join(root, name))
+    os.rmdir(path)
+
+
+def _run_copy(job):
+    _measure(job, job.source)
+    job.checkpoint()
+    _copy_tree(job, job.source, job.destination)
+
+
+def _run_move(job):
+    # The destination is the full target path, never a directory to move
+    # into: an existing one is what a resubmitted cross-device move resumes
+    try:
+        os.rename(job.source, job.destination)
+        job.files_total = 1
+        job.add_files()
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Another filesystem: each file's source goes once its copy is committed,
+    # so a cancelled or failed move is finished by submitting it again
+    _measure(job, job.source)
+    cross_move.move_tree(job, job.source, job.destination, job.verify)
+
+
+def _run_delete(job):
+    _measure(job, job.source)
+    job.checkpoint()
+    _delete_tree(job, job.source)
+
+
+_OPERATIONS = {"copy": _run_copy, "move": _run_move, "delete": _run_delete}
+
+
+class JobManager:
+    """Runs file jobs in a bounded pool and keeps recent ones for polling."""
+
+    def __init__(self, workers=None, keep_finished=None, finished_ttl=None):
+        self.keep_finished = keep_finished or config.FILE_JOB_KEEP_FINISHED
+        self.finished_ttl = finished_ttl or config.FILE_JOB_FINISHED_TTL
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or config.FILE_JOB_WORKERS, thread_name_prefix="file-job"
+        )
+
+    def submit(self, kind, source, destination=None, verify=False):
+        if kind not in KINDS:
+            raise ValueError(f"Unsupported job kind: {kind}")
+        job = FileJob(kind, source, destination, verify)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job._cancelled.is_set():
+            job.finished_at = time.time()
+            job.state = "cancelled"
+            return
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            _OPERATIONS[job.kind](job)
+            state = "done"
+        except JobCancelled:
+            state = "cancelled"
+        except Exception as e:
+            config.logger.error(f"File job {job.id} ({job.kind} {job.source}) failed: {e}")
+            job.error = str(e)
+            state = "failed"
+        # Set before the final state: list() and submit() prune finished jobs by it
+        job.finished_at = time.time()
+        job.state = state
+        config.logger.info(
+            f"File job {job.id} {job.kind} {job.state}: {job.files_done} files, "
+            f"{job.bytes_done} bytes in {job.finished_at - job.started_at:.1f}s"
+        )
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            self._prune()
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job._cancelled.set()
+            # A paused job must wake up to notice
+            job._running.set()
+        return job
+
+    def pause(self, job_id):
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job._running.clear()
+            if job.state == "queued":
+                job.state = "paused"
+        return job
+
+    def resume(self, job_id):
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job._running.set()
+            if job.state == "paused" and job.started_at is None:
+                job.state = "queued"
+        return job
+
+    def _prune(self):
+        """Forget old finished jobs (lock held)."""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished and job.finished_at is not None]
+        excess = len(finished) - self.keep_finished
+        for job in finished:
+            if excess > 0 or now - job.finished_at > self.finished_ttl:
+                del self._jobs[job.id]
+                excess -= 1
@@ -1,21 +1,36 @@
 # file_operations.py - File system operations for decky-send
 #
 # This module provides file system CRUD operations including:
-# - Directory listing
+# - Directory listing (os.scandir based, off the event loop)
+# - Cursor-paginated, sorted and filtered directory listing
+# - In-memory listing cache invalidated by inotify
+# - Background storage analysis (recursive directory sizes)
+# - Filename search over a persistent index of home and the SD card
 # - File read/write
 # - File/directory creation
-# - Copy, move, delete operations
+# - Copy, move, delete operations (background jobs with progress)
 # - File download
 # - Text content management
 
 import os
+import json
+import stat
+import time
 import shutil
+import asyncio
 import subprocess
 import mimetypes
 from pathlib import Path
 from aiohttp import web
 # NOTE: Direct import - Decky adds py_modules/ to sys.path
 import config
+import listing_pages
+import listing_cache
+import storage_analyzer
+import search_index
+import file_jobs
+import text_reader
+import file_writer
 
 # =============================================================================
 # System Detection Helpers
@@ -159,6 +174,50 @@ def _path_in_allowed_dirs(path, allowed_dirs):
             continue
     return False
 
+# =============================================================================
+# Directory Listing
+# =============================================================================
+
+def _list_entry(entry):
+    """Build the listing record of one DirEntry with a single stat call.
+
+    Symlinks are described by their target (a link to a folder is listed as a
+    folder); broken links and entries removed since readdir are skipped.
+    """
+    st = entry.stat()
+    is_dir = stat.S_ISDIR(st.st_mode)
+    return {
+        "name": entry.name,
+        "path": entry.path,
+        "is_dir": is_dir,
+        "is_symlink": entry.is_symlink(),
+        "size": 0 if is_dir else st.st_size,
+        "mtime": st.st_mtime,
+        "created_at": getattr(st, 'st_birthtime', st.st_ctime)
+    }
+
+
+def list_directory(path):
+    """List a directory, folders first, then by name.
+
+    Blocking; call it from a worker thread.
+
+    Raises:
+        FileNotFoundError: path does not exist
+        NotADirectoryError: path is not a directory
+    """
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                files.append(_list_entry(entry))
+            except OSError as e:
+                # Vanished during traversal, broken symlink, permission denied
+                config.logger.debug(f"Skipping file {entry.path}: {e}")
+    files.sort(key=lambda x: (not x['is_dir'], x['name']))
+    return files
+
+
 # =============================================================================
 # HTTP API Handlers (for aiohttp routes)
 # =============================================================================
@@ -177,60 +236,114 @@ async def get_file_list(request):
         # Validate path to prevent directory traversal
         path = os.path.abspath(path)
         
-        # Check if path exists
-        if not os.path.exists(path):
+        # Listing and serialization run in a worker thread: a folder with tens
+        # of thousands of entries must not stall other requests. Repeat visits
+        # are served from the listing cache.
+        try:
+            files = await asyncio.to_thread(_listing_cache.get, path, list_directory)
+        except FileNotFoundError:
             return web.json_response({"status": "error", "message": "Path not found"}, status=404)
-        
-        # Check if path is a directory
-        if not os.path.isdir(path):
+        except NotADirectoryError:
             return web.json_response({"status": "error", "message": "Path is not a directory"}, status=400)
         
-        # Get file list
-        files = []
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            try:
-                # Check if item still exists (might have been deleted during traversal)
-                if not os.path.exists(item_path):
-                    continue
-                
-                is_dir = os.path.isdir(item_path)
-                stat = os.stat(item_path)
-                size = stat.st_size if not is_dir else 0
-                mtime = stat.st_mtime
-                created_at = getattr(stat, 'st_birthtime', stat.st_ctime)
-                
-                files.append({
-                    "name": item,
-                    "path": item_path,
-                    "is_dir": is_dir,
-                    "size": size,
-                    "mtime": mtime,
-                    "created_at": created_at
-                })
-            except Exception as e:
-                # Skip files that can't be accessed (e.g., permission errors, special files)
-                config.logger.debug(f"Skipping file {item_path}: {e}")
-                continue
-        
-        # Sort files: directories first, then by name
-        files.sort(key=lambda x: (not x['is_dir'], x['name']))
-        
-        return web.json_response({
+        body = await asyncio.to_thread(json.dumps, {
             "status": "success",
             "files": files,
             "current_path": path
         })
+        return web.json_response(text=body)
     except Exception as e:
         config.logger.error(f"Failed to get file list: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+_listing_cache = listing_cache.ListingCache()
+
+
+async def get_listing_cache_stats(request):
+    """Get listing cache counters (hit rate, entries, watches) for monitoring
+    
+    GET /api/files/list-cache
+    """
+    stats = await asyncio.to_thread(_listing_cache.stats)
+    return web.json_response({"status": "success", "stats": stats})
+
+
+_listing_cursors = listing_pages.ListingCursorStore()
+
+
+async def get_file_list_page(request):
+    """Get one page of a directory listing
+    
+    POST /api/files/list-page
+    Body (first page): {"path": "/some/path", "limit": 200, "sort": "none" | "name" |
+        "size" | "mtime" | "type", "order": "asc" | "desc", "dirs_first": true,
+        "prefix": "abc", "glob": "*.png"}
+    Body (next pages): {"cursor": "<next_cursor>", "limit": 200}
+    
+    Rows are arrays in the order given by "fields", with names relative to
+    "path". sort "none" returns directory order and streams: the first page
+    costs the same for any folder size. dirs_first only applies to sorted
+    listings. "total" is null until an unsorted listing reaches its end.
+    """
+    try:
+        data = await request.json()
+        cursor = data.get('cursor')
+        limit = data.get('limit', listing_pages.DEFAULT_PAGE_SIZE)
+        if not isinstance(limit, int) or limit <= 0:
+            return web.json_response({"status": "error", "message": "Invalid limit"}, status=400)
+        
+        if not cursor:
+            path = os.path.abspath(data.get('path') or str(Path.home()))
+            sort = data.get('sort') or 'none'
+            if sort not in listing_pages.SORT_KEYS:
+                return web.json_response({"status": "error", "message": f"Unsupported sort: {sort}"}, status=400)
+            try:
+                cursor = await asyncio.to_thread(
+                    _listing_cursors.open,
+                    path,
+                    sort,
+                    data.get('order') == 'desc',
+                    data.get('dirs_first', True) is not False,
+                    data.get('prefix') or None,
+                    data.get('glob') or None,
+                )
+            except FileNotFoundError:
+                return web.json_response({"status": "error", "message": "Path not found"}, status=404)
+            except NotADirectoryError:
+                return web.json_response({"status": "error", "message": "Path is not a directory"}, status=400)
+        
+        try:
+            page = await asyncio.to_thread(_listing_cursors.read, cursor, limit)
+        except listing_pages.CursorExpiredError:
+            return web.json_response({"status": "error", "message": "Cursor expired"}, status=410)
+        
+        body = await asyncio.to_thread(json.dumps, {
+            "status": "success",
+            "path": page["path"],
+            "fields": listing_pages.FIELDS,
+            "entries": page["rows"],
+            "next_cursor": page["next_cursor"],
+            "total": page["total"]
+        })
+        return web.json_response(text=body)
+    except Exception as e:
+        config.logger.error(f"Failed to get file list page: {e}")
+        return web.json_response({"status": "error", "message": str(e)}, status=500)
+
+
 async def read_file(request):
     """Read file content
     
     POST /api/files/read
     Body: {"path": "/some/file.txt"}
+        Whole file, up to READ_WHOLE_MAX_BYTES (413 beyond, with "size")
+    Body: {"path": "/some/file.txt", "tail": 1000}
+        Last lines of the file
+    Body: {"path": "/some/file.txt", "line": 2000000, "lines": 500}
+        Lines from a 1-based line number
+    Body: {"path": "/some/file.txt", "offset": 0, "length": 65536}
+        Byte range; continue from "next_offset"
     """
     try:
         # Get path from request
@@ -250,16 +363,35 @@ async def read_file(request):
         if os.path.isdir(path):
             return web.json_response({"status": "error", "message": "Path is a directory"}, status=400)
         
-        # Read file content
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if any(data.get(key) is not None for key in ('tail', 'line', 'offset', 'length')):
+            try:
+                result = await asyncio.to_thread(
+                    text_reader.read_range, path,
+                    offset=data.get('offset'), length=data.get('length'),
+                    line=data.get('line'), lines=data.get('lines'), tail=data.get('tail')
+                )
+            except text_reader.BinaryFileError:
+                raise
+            except (TypeError, ValueError) as e:
+                return web.json_response({"status": "error", "message": f"Invalid range: {e}"}, status=400)
+            return web.json_response({"status": "success", "path": path, **result})
+        
+        # Whole file: the type is sniffed before anything large is read
+        content, version = await asyncio.to_thread(text_reader.read_whole, path)
+        if content is None:
+            return web.json_response({
+                "status": "error",
+                "message": "File is too large to open whole; request a range or tail",
+                "size": os.path.getsize(path)
+            }, status=413)
         
         return web.json_response({
             "status": "success",
             "content": content,
-            "path": path
+            "path": path,
+            "version": version
         })
-    except UnicodeDecodeError:
+    except (UnicodeDecodeError, text_reader.BinaryFileError):
         return web.json_response({"status": "error", "message": "Cannot read binary file"}, status=400)
     except Exception as e:
         config.logger.error(f"Failed to read file: {e}")
@@ -271,33 +403,74 @@ async def write_file(request):
     
     POST /api/files/write
     Body: {"path": "/some/file.txt", "content": "file content"}
+    Body: {"path": "/some/file.txt", "base": "<version>", "edits": [{"offset": 0, "delete": 3, "insert": "abc"}]}
+        Edits use byte offsets into the version returned by /api/files/read
+    POST /api/files/write?path=/some/file.txt[&base=<version>]
+    Body: the raw new content, streamed (Content-Type: application/octet-stream)
+    
+    The file is replaced atomically (temp file, fsync, rename) and left
+    untouched when the content does not change. An optional "base" version
+    answers 409 if the file was modified since it was read.
     """
     try:
-        # Get data from request
-        data = await request.json()
-        path = data.get('path')
-        content = data.get('content')
-        
-        if not path:
-            return web.json_response({"status": "error", "message": "Path is required"}, status=400)
-        
-        # Validate path
-        path = os.path.abspath(path)
-        
-        # Write content to file
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        if request.content_type == 'application/octet-stream':
+            path = request.query.get('path')
+            if not path:
+                return web.json_response({"status": "error", "message": "Path is required"}, status=400)
+            path = os.path.abspath(path)
+            changed, version = await _write_streamed(path, request.query.get('base'), request.content)
+        else:
+            # Get data from request
+            data = await request.json()
+            path = data.get('path')
+            content = data.get('content')
+            edits = data.get('edits')
+            base = data.get('base')
+            
+            if not path:
+                return web.json_response({"status": "error", "message": "Path is required"}, status=400)
+            
+            # Validate path
+            path = os.path.abspath(path)
+            
+            if edits is not None:
+                if not base:
+                    return web.json_response({"status": "error", "message": "Base version is required for edits"}, status=400)
+                try:
+                    changed, version = await asyncio.to_thread(file_writer.apply_edits, path, base, edits)
+                except (TypeError, ValueError) as e:
+                    return web.json_response({"status": "error", "message": f"Invalid edits: {e}"}, status=400)
+            elif isinstance(content, str):
+                changed, version = await asyncio.to_thread(
+                    file_writer.write_content, path, content.encode('utf-8'), base
+                )
+            else:
+                return web.json_response({"status": "error", "message": "Content or edits are required"}, status=400)
         
         return web.json_response({
             "status": "success",
-            "message": "File written successfully",
-            "path": path
+            "message": "File written successfully" if changed else "File unchanged",
+            "path": path,
+            "changed": changed,
+            "version": version
         })
+    except file_writer.VersionConflict as e:
+        return web.json_response({"status": "error", "message": str(e), "version": e.current}, status=409)
     except Exception as e:
         config.logger.error(f"Failed to write file: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+async def _write_streamed(path, base, stream):
+    """Write a request body to ``path`` atomically without buffering it whole."""
+    writer = await asyncio.to_thread(file_writer.AtomicWriter, path, base)
+    with writer:
+        async for chunk in stream.iter_chunked(1024 * 1024):
+            await asyncio.to_thread(writer.write, chunk)
+        changed = await asyncio.to_thread(writer.commit)
+    return changed, await asyncio.to_thread(file_writer.current_version, writer.path)
+
+
 async def create_file(request):
     """Create a new file
     
@@ -371,6 +544,18 @@ async def create_directory(request):
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+_file_jobs = file_jobs.JobManager()
+
+
+def _invalid_transfer(source, destination):
+    """Reason a copy / move of ``source`` to ``destination`` cannot work, or None."""
+    if source == destination:
+        return "Source and destination are the same"
+    if os.path.isdir(source) and destination.startswith(source.rstrip(os.sep) + os.sep):
+        return "Cannot copy or move a directory into itself"
+    return None
+
+
 async def copy_file(request):
     """Copy file or directory
     
@@ -399,20 +584,19 @@ async def copy_file(request):
         if not os.path.exists(dest_dir):
             return web.json_response({"status": "error", "message": "Destination directory not found"}, status=404)
         
-        # Copy file or directory
-        if os.path.isdir(source):
-            # Copy directory recursively
-            shutil.copytree(source, destination, dirs_exist_ok=True)
-        else:
-            # Copy file
-            shutil.copy2(source, destination)
+        invalid = _invalid_transfer(source, destination)
+        if invalid:
+            return web.json_response({"status": "error", "message": invalid}, status=400)
         
+        # Copy runs as a background job; poll /api/jobs/status for progress
+        job = _file_jobs.submit("copy", source, destination)
         return web.json_response({
-            "status": "success",
-            "message": "File copied successfully",
+            "status": "accepted",
+            "message": "Copy started",
             "source": source,
-            "destination": destination
-        })
+            "destination": destination,
+            "job": job.to_dict()
+        }, status=202)
     except Exception as e:
         config.logger.error(f"Failed to copy file: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
@@ -422,13 +606,19 @@ async def move_file(request):
     """Move file or directory
     
     POST /api/files/move
-    Body: {"source": "/source/path", "destination": "/dest/path"}
+    Body: {"source": "/source/path", "destination": "/dest/path", "verify": false}
+    
+    destination is the full target path, not the directory to move into.
+    Moves to another filesystem copy file by file; "verify" compares the
+    SHA-256 of each copy before its source is removed. Moving the same
+    source and destination again resumes an interrupted move.
     """
     try:
         # Get data from request
         data = await request.json()
         source = data.get('source')
         destination = data.get('destination')
+        verify = bool(data.get('verify', False))
         
         if not source or not destination:
             return web.json_response({"status": "error", "message": "Source and destination are required"}, status=400)
@@ -446,15 +636,19 @@ async def move_file(request):
         if not os.path.exists(dest_dir):
             return web.json_response({"status": "error", "message": "Destination directory not found"}, status=404)
         
-        # Move file or directory
-        shutil.move(source, destination)
+        invalid = _invalid_transfer(source, destination)
+        if invalid:
+            return web.json_response({"status": "error", "message": invalid}, status=400)
         
+        # Same-filesystem moves finish at once; others stream file by file in the job
+        job = _file_jobs.submit("move", source, destination, verify=verify)
         return web.json_response({
-            "status": "success",
-            "message": "File moved successfully",
+            "status": "accepted",
+            "message": "Move started",
             "source": source,
-            "destination": destination
-        })
+            "destination": destination,
+            "job": job.to_dict()
+        }, status=202)
     except Exception as e:
         config.logger.error(f"Failed to move file: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
@@ -481,24 +675,57 @@ async def delete_file(request):
         if not os.path.exists(path):
             return web.json_response({"status": "error", "message": "Path not found"}, status=404)
         
-        # Delete file or directory
-        if os.path.isdir(path):
-            # Delete directory recursively
-            shutil.rmtree(path)
-        else:
-            # Delete file
-            os.remove(path)
-        
+        # Delete runs as a background job; poll /api/jobs/status for progress
+        job = _file_jobs.submit("delete", path)
         return web.json_response({
-            "status": "success",
-            "message": "File deleted successfully",
-            "path": path
-        })
+            "status": "accepted",
+            "message": "Delete started",
+            "path": path,
+            "job": job.to_dict()
+        }, status=202)
     except Exception as e:
         config.logger.error(f"Failed to delete file: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+async def list_jobs(request):
+    """List running and recently finished file jobs
+    
+    GET /api/jobs
+    """
+    jobs = [job.to_dict() for job in _file_jobs.list()]
+    return web.json_response({"status": "success", "jobs": jobs})
+
+
+async def get_job(request):
+    """Get the progress of one file job
+    
+    GET /api/jobs/status?id=<job id>
+    """
+    job = _file_jobs.get(request.query.get('id', ''))
+    if job is None:
+        return web.json_response({"status": "error", "message": "Job not found"}, status=404)
+    return web.json_response({"status": "success", "job": job.to_dict()})
+
+
+async def control_job(request):
+    """Cancel, pause or resume a file job
+    
+    POST /api/jobs/cancel | /api/jobs/pause | /api/jobs/resume
+    Body: {"id": "<job id>"}
+    """
+    try:
+        data = await request.json()
+        action = request.path.rsplit('/', 1)[-1]
+        job = getattr(_file_jobs, action)(data.get('id', ''))
+        if job is None:
+            return web.json_response({"status": "error", "message": "Job not found"}, status=404)
+        return web.json_response({"status": "success", "job": job.to_dict()})
+    except Exception as e:
+        config.logger.error(f"Failed to control job: {e}")
+        return web.json_response({"status": "error", "message": str(e)}, status=500)
+
+
 async def download_file(request):
     """Download file
     
@@ -667,6 +894,97 @@ async def unpack_archive(request):
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+_storage_analyzer = storage_analyzer.StorageAnalyzer()
+
+
+async def get_storage_usage(request):
+    """Get the recursive size of a directory and its largest children
+    
+    POST /api/storage/usage
+    Body: {"path": "/some/path", "top": 20, "refresh": false}
+    
+    Small or cached trees are answered directly. Otherwise the analysis keeps
+    running in the background and 202 is returned with progress counters;
+    repeat the request to poll.
+    """
+    try:
+        data = await request.json()
+        path = os.path.abspath(data.get('path', str(Path.home())))
+        try:
+            top = int(data.get('top', 20))
+        except (TypeError, ValueError):
+            return web.json_response({"status": "error", "message": "Invalid top"}, status=400)
+        
+        # Joins a running analysis of the same path instead of starting another
+        job, progress = _storage_analyzer.start(path, bool(data.get('refresh', False)))
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), timeout=config.STORAGE_SCAN_WAIT)
+        except asyncio.TimeoutError:
+            return web.json_response({
+                "status": "scanning",
+                "path": path,
+                "progress": dict(progress)
+            }, status=202)
+        except FileNotFoundError:
+            return web.json_response({"status": "error", "message": "Path not found"}, status=404)
+        except NotADirectoryError:
+            return web.json_response({"status": "error", "message": "Path is not a directory"}, status=400)
+        
+        usage = await asyncio.to_thread(_storage_analyzer.usage, path, top)
+        if usage is None:
+            # Evicted between the analysis and this read; the next poll rescans
+            return web.json_response({"status": "scanning", "path": path, "progress": dict(progress)}, status=202)
+        return web.json_response({"status": "success", **usage})
+    except Exception as e:
+        config.logger.error(f"Failed to analyze storage: {e}")
+        return web.json_response({"status": "error", "message": str(e)}, status=500)
+
+
+_search_index = search_index.SearchIndex(lambda: [config.HOME_DIR, _find_sdcard_mount()])
+
+
+def start_search_index():
+    """Start building / updating the filename index in the background."""
+    _search_index.start()
+
+
+def stop_search_index():
+    """Stop the index thread (blocking; waits for the current batch)."""
+    _search_index.stop()
+
+
+async def search_files(request):
+    """Search file and folder names in home and on the SD card
+    
+    GET /api/files/search?q=<terms>&limit=50&path=/optional/scope
+    
+    Every whitespace-separated term must occur in the name (case-insensitive).
+    Results are ranked exact name, name prefix, then substring.
+    """
+    try:
+        query = request.query.get('q', '').strip()
+        try:
+            limit = int(request.query.get('limit', '50'))
+        except ValueError:
+            return web.json_response({"status": "error", "message": "Invalid limit"}, status=400)
+        scope = request.query.get('path')
+        if scope:
+            scope = os.path.realpath(scope)
+        
+        start = time.perf_counter()
+        results = await asyncio.to_thread(_search_index.search, query, limit, scope) if query else []
+        return web.json_response({
+            "status": "success",
+            "query": query,
+            "results": results,
+            "took_ms": round((time.perf_counter() - start) * 1000, 1),
+            "index": _search_index.stats()
+        })
+    except Exception as e:
+        config.logger.error(f"Failed to search files: {e}")
+        return web.json_response({"status": "error", "message": str(e)}, status=500)
+
+
 async def get_sdcard_info(request):
     """Get SD card mount information
     
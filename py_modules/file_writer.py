@@ -0,0 +1,215 @@
+# file_writer.py - Crash-safe file saves for decky-send
+#
+# This module writes edited files without ever leaving them truncated:
+# - New content goes to a temp file in the same directory, is fsync'd, then
+#   renamed over the original (mode and owner kept)
+# - Content can be streamed in pieces (request bodies of any size)
+# - Delta saves apply edit operations against a base version token, copying
+#   the unchanged bytes from the current file
+# - The new content is compared with the current file while it is written;
+#   a save that changes nothing is dropped before the rename
+
+import os
+import tempfile
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import utils
+
+_CHUNK = 1024 * 1024
+
+
+class VersionConflict(Exception):
+    """The file changed since the version the edits were based on."""
+
+    def __init__(self, current):
+        super().__init__("File was modified since it was opened")
+        self.current = current
+
+
+def version_token(st):
+    """Opaque version of a file: changes whenever it is rewritten or replaced."""
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+class AtomicWriter:
+    """Write a file's new content to a temp file, then rename it into place.
+
+    Use as a context manager and call ``commit()`` at the end; leaving the
+    block without committing (or with an error) discards the temp file. A
+    symlink is followed, so its target is replaced rather than the link.
+    Hard links to the old file keep the old content.
+    """
+
+    def __init__(self, path, base=None):
+        self.path = os.path.realpath(path)
+        directory, name = os.path.split(self.path)
+        self._old_fd = None
+        self._old_st = None
+        try:
+            self._old_fd = os.open(self.path, os.O_RDONLY)
+            self._old_st = os.fstat(self._old_fd)
+        except FileNotFoundError:
+            pass
+        if base is not None:
+            current = version_token(self._old_st) if self._old_st is not None else None
+            if current != base:
+                self._close_old()
+                raise VersionConflict(current)
+        try:
+            fd, self._temp_path = tempfile.mkstemp(prefix=f".{name[:200]}.", suffix=".tmp", dir=directory)
+        except BaseException:
+            self._close_old()
+            raise
+        self._file = os.fdopen(fd, "wb")
+        self._pos = 0
+        # Still byte-for-byte equal to the current file so far
+        self._same = self._old_st is not None
+
+    @property
+    def old_fd(self):
+        """Descriptor of the current file (None for a new file)."""
+        return self._old_fd
+
+    @property
+    def old_size(self):
+        return self._old_st.st_size if self._old_st is not None else 0
+
+    def write(self, data):
+        if self._same and os.pread(self._old_fd, len(data), self._pos) != data:
+            self._same = False
+        self._file.write(data)
+        self._pos += len(data)
+
+    def copy_from_old(self, offset, length):
+        """Append ``length`` bytes of the current file starting at ``offset``."""
+        end = offset + length
+        while offset < end:
+            data = os.pread(self._old_fd, min(_CHUNK, end - offset), offset)
+            if not data:
+                raise ValueError("File ended before the edited range")
+            if self._same and offset != self._pos:
+                self._same = os.pread(self._old_fd, len(data), self._pos) == data
+            self._file.write(data)
+            self._pos += len(data)
+            offset += len(data)
+
+    def commit(self):
+        """Make the new content the file's content.
+
+        Returns:
+            bool: False if it equals the current content (nothing written)
+        """
+        if self._same and self._pos == self.old_size:
+            self._discard()
+            return False
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if self._old_st is not None:
+            os.chmod(self._temp_path, self._old_st.st_mode & 0o7777)
+            try:
+                os.chown(self._temp_path, self._old_st.st_uid, self._old_st.st_gid)
+            except PermissionError:
+                pass
+        else:
+            # mkstemp creates 0600; new files get the usual umask-based mode
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self._temp_path, 0o666 & ~umask)
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+        self._close_old()
+        utils.fsync_dir(os.path.dirname(self.path))
+        return True
+
+    def _discard(self):
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+        self._close_old()
+
+    def _close_old(self):
+        if self._old_fd is not None:
+            os.close(self._old_fd)
+            self._old_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._file.closed:
+            self._discard()
+        return False
+
+
+def current_version(path):
+    return version_token(os.stat(path))
+
+
+def write_content(path, data, base=None):
+    """Replace a file's content with ``data`` (bytes). Blocking.
+
+    Returns:
+        (bool, str): whether the file changed, and its version afterwards
+    """
+    with AtomicWriter(path, base) as writer:
+        writer.write(data)
+        changed = writer.commit()
+    return changed, current_version(writer.path)
+
+
+def _parse_edits(edits, old_fd, size):
+    """Validate edit operations; returns them sorted as (offset, delete, insert bytes)."""
+    if not isinstance(edits, list):
+        raise ValueError("Edits must be a list")
+    if len(edits) > config.WRITE_MAX_EDITS:
+        raise ValueError(f"Too many edits (at most {config.WRITE_MAX_EDITS})")
+    parsed = []
+    for edit in edits:
+        if not isinstance(edit, dict):
+            raise ValueError("Each edit must be an object")
+        offset = int(edit.get("offset", 0))
+        delete = int(edit.get("delete", 0))
+        insert = edit.get("insert") or ""
+        if not isinstance(insert, str):
+            raise ValueError("Edit insert must be a string")
+        if offset < 0 or delete < 0 or offset + delete > size:
+            raise ValueError(f"Edit at {offset} is outside the file")
+        # Both ends must fall between UTF-8 characters
+        for position in (offset, offset + delete):
+            if position < size and 0x80 <= os.pread(old_fd, 1, position)[0] <= 0xBF:
+                raise ValueError(f"Edit boundary {position} splits a character")
+        parsed.append((offset, delete, insert.encode("utf-8")))
+    parsed.sort(key=lambda edit: edit[0])
+    for (offset, delete, _), (next_offset, _, _) in zip(parsed, parsed[1:]):
+        if offset + delete > next_offset:
+            raise ValueError(f"Edits at {offset} and {next_offset} overlap")
+    return parsed
+
+
+def apply_edits(path, base, edits):
+    """Apply edit operations to the file version ``base``. Blocking.
+
+    Each edit is ``{"offset": int, "delete": int, "insert": str}`` with byte
+    offsets into the base version; edits must not overlap.
+
+    Returns:
+        (bool, str): whether the file changed, and its version afterwards
+
+    Raises:
+        VersionConflict: the file is no longer at version ``base``
+        ValueError: malformed or out-of-range edits
+    """
+    with AtomicWriter(path, base) as writer:
+        if writer.old_fd is None:
+            raise FileNotFoundError(path)
+        pos = 0
+        for offset, delete, insert in _parse_edits(edits, writer.old_fd, writer.old_size):
+            writer.copy_from_old(pos, offset - pos)
+            writer.write(insert)
+            pos = offset + delete
+        writer.copy_from_old(pos, writer.old_size - pos)
+        changed = writer.commit()
+    return changed, current_version(writer.path)
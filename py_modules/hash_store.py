@@ -0,0 +1,180 @@
+# hash_store.py - Content hash store for decky-send instant uploads
+#
+# This module remembers the SHA-256 of files the Deck already has so a repeat
+# upload can be satisfied locally instead of over the network:
+# - Entries keyed by file identity (device, inode, size, mtime)
+# - Reverse index from hash to files, revalidated on every lookup
+# - Batched atomic persistence across restarts
+# - Local materialization by reflink, hardlink (opt-in) or copy
+
+import os
+import json
+import asyncio
+from collections import OrderedDict
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import utils
+import copy_engine
+
+
+def _identity_key(st):
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class FileHashStore:
+    """SHA-256 of known files, keyed by (device, inode, size, mtime).
+
+    An entry is only trusted while the file still has the identity it had when
+    it was hashed; any rewrite changes the mtime (or inode) and the entry is
+    dropped on the next lookup.
+    """
+
+    def __init__(self, path=None, max_entries=None, save_delay=2.0):
+        self.path = path or config.HASH_STORE_PATH
+        self.max_entries = max_entries or config.HASH_STORE_MAX_ENTRIES
+        self.save_delay = save_delay
+        self._entries = None
+        self._by_hash = {}
+        self._dirty = False
+        self._save_task = None
+
+    # -------------------------------------------------------------------------
+    # Lookup and update
+    # -------------------------------------------------------------------------
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, entry in (data.get("entries") or {}).items():
+                if isinstance(entry, dict) and entry.get("path") and entry.get("sha256"):
+                    self._add(key, entry["path"], entry["sha256"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            config.logger.warning(f"Ignoring unreadable hash store {self.path}: {e}")
+
+    def _add(self, key, path, sha256):
+        self._discard(key)
+        self._entries[key] = {"path": path, "sha256": sha256}
+        self._by_hash.setdefault(sha256, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_hash.get(entry["sha256"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_hash[entry["sha256"]]
+        self._dirty = True
+
+    def remember(self, path, sha256, st=None):
+        """Record the SHA-256 of ``path`` (stat'd now unless ``st`` is given)."""
+        self._load()
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        self._add(_identity_key(st), os.path.abspath(path), sha256.lower())
+        self._dirty = True
+        self._schedule_save()
+
+    def lookup(self, sha256, size):
+        """Return the path of an unchanged file with this hash and size, or None."""
+        self._load()
+        for key in list(self._by_hash.get(sha256.lower(), ())):
+            path = self._entries[key]["path"]
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is None or _identity_key(st) != key:
+                self._discard(key)
+                self._schedule_save()
+                continue
+            if st.st_size == size:
+                self._entries.move_to_end(key)
+                return path
+        return None
+
+    # -------------------------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------------------------
+
+    def _schedule_save(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_after_delay())
+
+    async def _save_after_delay(self):
+        await asyncio.sleep(self.save_delay)
+        await self.flush()
+
+    async def flush(self):
+        """Persist pending changes now."""
+        if not self._dirty or self._entries is None:
+            return
+        self._dirty = False
+        payload = {"version": 1, "entries": dict(self._entries)}
+        try:
+            await asyncio.to_thread(utils.write_json_atomic, self.path, payload)
+        except Exception as e:
+            config.logger.error(f"Failed to write hash store {self.path}: {e}")
+
+
+def materialize(source_path, dest_path, allow_hardlink=False):
+    """Create ``dest_path`` with the contents of ``source_path`` without the network.
+
+    Tries a reflink first (instant, copy-on-write), then a hardlink if allowed
+    and both paths share a filesystem, then a regular local copy. The result
+    appears atomically at dest_path.
+
+    Returns:
+        str: "reflink", "hardlink" or "copy"
+    """
+    temp_path = dest_path + ".part"
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+    try:
+        method = None
+        with open(source_path, "rb") as src, open(temp_path, "wb") as dst:
+            if copy_engine.clone(src.fileno(), dst.fileno()):
+                method = "reflink"
+        if method is None and allow_hardlink:
+            os.remove(temp_path)
+            try:
+                os.link(source_path, temp_path)
+                method = "hardlink"
+            except OSError:
+                pass
+        if method is None:
+            with open(source_path, "rb") as src, open(temp_path, "wb") as dst:
+                copy_engine.copy_data(src.fileno(), dst.fileno())
+            method = "copy"
+        if method != "hardlink":
+            fd = os.open(temp_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        os.replace(temp_path, dest_path)
+        return method
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
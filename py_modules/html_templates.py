@@ -13,7 +13,6 @@ import time
 import asyncio
 import hashlib
 import subprocess
-<<<<<<< HEAD
 import shutil
 import pty
 import uuid
@@ -21,25 +20,219 @@ import signal
 import select
 import errno
 import threading
-=======
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
 from aiohttp import web
 
 # Import decky for logging and event emission
 import decky
 import utils
+import upload_journal
+import upload_sessions
+import upload_tuning
+import hash_store
+import upload_encoding
+import completion_pipeline
+import transfer_progress
+import io_scheduler
+
+
+_UPLOAD_SESSION_TTL_SECONDS = 7200
+_UPLOAD_SESSION_SWEEP_INTERVAL_SECONDS = 60.0
 
 
 def _get_upload_session_store(plugin):
     sessions = getattr(plugin, "_upload_sessions", None)
     if sessions is None:
-        sessions = {}
+        journal = _get_upload_journal(plugin)
+
+        def on_expire(upload_id, session):
+            decky.logger.info(f"Expiring idle upload session: {upload_id}")
+            session.close_fd()
+            journal.forget(upload_id)
+            _end_transfer_progress(plugin, upload_id)
+
+        sessions = upload_sessions.UploadSessionRegistry(
+            _UPLOAD_SESSION_TTL_SECONDS,
+            sweep_interval=_UPLOAD_SESSION_SWEEP_INTERVAL_SECONDS,
+            on_expire=on_expire,
+        )
+        for upload_id, session in _restore_upload_sessions(journal).items():
+            sessions.add(upload_id, session)
         setattr(plugin, "_upload_sessions", sessions)
-    lock = getattr(plugin, "_upload_sessions_lock", None)
-    if lock is None:
-        lock = asyncio.Lock()
-        setattr(plugin, "_upload_sessions_lock", lock)
-    return sessions, lock
+    return sessions
+
+
+def _get_upload_journal(plugin):
+    journal = getattr(plugin, "_upload_journal", None)
+    if journal is None:
+        journal = upload_journal.UploadJournal()
+        setattr(plugin, "_upload_journal", journal)
+    return journal
+
+
+def _get_upload_tuner(plugin):
+    tuner = getattr(plugin, "_upload_tuner", None)
+    if tuner is None:
+        tuner = upload_tuning.UploadTuner()
+        setattr(plugin, "_upload_tuner", tuner)
+    return tuner
+
+
+def _get_hash_store(plugin):
+    store = getattr(plugin, "_hash_store", None)
+    if store is None:
+        store = hash_store.FileHashStore()
+        setattr(plugin, "_hash_store", store)
+    return store
+
+
+def _get_completion_pipeline(plugin):
+    pipeline = getattr(plugin, "_completion_pipeline", None)
+    if pipeline is None:
+        pipeline = completion_pipeline.CompletionPipeline(
+            lambda event, payload: _emit_decky(plugin, event, payload),
+            lambda: plugin.text_file_path,
+        )
+        setattr(plugin, "_completion_pipeline", pipeline)
+    return pipeline
+
+
+def _get_progress_bus(plugin):
+    bus = getattr(plugin, "_progress_bus", None)
+    if bus is None:
+        bus = transfer_progress.ProgressBus(lambda events: _emit_decky_events(plugin, events))
+        setattr(plugin, "_progress_bus", bus)
+    return bus
+
+
+def _get_io_scheduler(plugin):
+    scheduler = getattr(plugin, "_io_scheduler", None)
+    if scheduler is None:
+        scheduler = io_scheduler.IOScheduler()
+        setattr(plugin, "_io_scheduler", scheduler)
+    return scheduler
+
+
+def _upload_busy_response(busy):
+    decky.logger.info(f"Upload rejected, retry in {busy.retry_after}s: {busy.reason}")
+    return web.json_response(
+        {"status": "error", "message": "设备繁忙，请稍后重试"},
+        status=503,
+        headers={"Retry-After": str(busy.retry_after)}
+    )
+
+
+async def _scheduled_write(ticket, func, *args):
+    """Run a blocking disk write in a worker thread while holding a write slot."""
+    async with ticket.write_slot():
+        return await asyncio.to_thread(func, *args)
+
+
+def _end_transfer_progress(plugin, transfer_id):
+    bus = getattr(plugin, "_progress_bus", None)
+    if bus is not None:
+        bus.end(transfer_id)
+
+
+def _new_upload_session(file_path, temp_path, filename, expected_hash, expected_algo,
+                        total_chunks, total_size, chunk_size, now):
+    return upload_sessions.UploadSession(
+        file_path, temp_path, filename, expected_hash, _normalize_hash_algo(expected_algo),
+        total_chunks, total_size, chunk_size, now,
+        rolling_hash=_RollingUploadHash(expected_algo),
+    )
+
+
+def _restore_upload_sessions(journal):
+    """Rebuild chunked upload sessions recorded in the journal.
+
+    Sessions whose temp file is gone, has the wrong size or that have expired
+    are dropped, so a resume never trusts chunks that are not on disk.
+    """
+    sessions = {}
+    now = time.time()
+    for upload_id, entry in journal.load().items():
+        try:
+            if now - float(entry.get("last_update") or 0) > _UPLOAD_SESSION_TTL_SECONDS:
+                raise ValueError("expired")
+            session = upload_sessions.UploadSession.from_journal_entry(
+                entry, now, rolling_hash=_RollingUploadHash(entry.get("hash_algo"))
+            )
+            if not os.path.isfile(session.temp_path):
+                raise ValueError("temp file missing")
+            if session.total_size > 0 and os.path.getsize(session.temp_path) != session.total_size:
+                raise ValueError("temp file size mismatch")
+        except Exception as e:
+            decky.logger.info(f"Discarding journaled upload session {upload_id}: {e}")
+            journal.forget(upload_id)
+            continue
+        # Chunks already on disk are absorbed by the rolling hash from the temp
+        # file as the upload continues, instead of all at once when it finishes.
+        if session.total_size > 0:
+            for first, last in session.received_ranges():
+                for index in range(first, last + 1):
+                    session.rolling_hash.spilled[index] = session.chunk_length(index)
+        sessions[upload_id] = session
+    if sessions:
+        decky.logger.info(f"Restored {len(sessions)} chunked upload session(s) from journal")
+    return sessions
+
+
+def _drop_upload_session(plugin, sessions, upload_id):
+    session = sessions.pop(upload_id)
+    if session is not None:
+        session.close_fd()
+    _get_upload_journal(plugin).forget(upload_id)
+    _end_transfer_progress(plugin, upload_id)
+
+
+def reset_upload_sessions(plugin):
+    """Forget in-memory upload sessions so they are rebuilt from the journal.
+
+    Called when the server (and its event loop) is recreated; the journal on
+    disk stays the source of truth for resumable uploads.
+    """
+    sessions = getattr(plugin, "_upload_sessions", None)
+    if sessions is not None:
+        sessions.close()
+    plugin._upload_sessions = None
+    plugin._completion_pipeline = None
+    plugin._progress_bus = None
+    plugin._io_scheduler = None
+    plugin._upload_journal = None
+
+
+async def close_upload_sessions(plugin):
+    """Flush the upload journal and hash store, release session descriptors on shutdown."""
+    bus = getattr(plugin, "_progress_bus", None)
+    if bus is not None:
+        await bus.close()
+    pipeline = getattr(plugin, "_completion_pipeline", None)
+    if pipeline is not None:
+        await pipeline.close()
+    journal = getattr(plugin, "_upload_journal", None)
+    if journal is not None:
+        await journal.flush()
+    store = getattr(plugin, "_hash_store", None)
+    if store is not None:
+        await store.flush()
+    reset_upload_sessions(plugin)
+
+
+# Multipart bodies are streamed to disk through a buffer of this size, so peak
+# memory per upload request stays fixed regardless of file or chunk size.
+_UPLOAD_STREAM_BUFFER_SIZE = 1024 * 1024
+
+
+def _pwrite_all(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
 
 
 _transfer_sleep_lock = threading.Lock()
@@ -168,24 +361,250 @@ async def _compute_file_hash_async(path, algo="sha256"):
     return await asyncio.to_thread(_compute_file_hash, path, algo)
 
 
+def _hash_file_range(fd, hasher, offset, length=None, chunk_size=_UPLOAD_STREAM_BUFFER_SIZE):
+    """Feed ``length`` bytes of ``fd`` starting at ``offset`` (or up to EOF) into hasher."""
+    while length is None or length > 0:
+        size = chunk_size if length is None else min(chunk_size, length)
+        data = os.pread(fd, size, offset)
+        if not data:
+            break
+        hasher.update(data)
+        offset += len(data)
+        if length is not None:
+            length -= len(data)
+    return offset
 
-async def _emit_decky(plugin, event, payload):
+
+def _write_upload_slice(fd, data, offset, hashers, decoder=None, final=False):
+    """Write one streamed slice and feed it to the hashers (runs in a worker thread).
+
+    With a decoder the received slice is decompressed first, so offsets, sizes
+    and hashes always refer to the decoded file. Returns the bytes written.
+    """
+    if decoder is not None:
+        data = decoder.decode(data, final)
+    if data:
+        _pwrite_all(fd, data, offset)
+        for hasher in hashers:
+            hasher.update(data)
+    return data
+
+
+def _prepare_upload_temp(temp_path, total_size):
+    """Create or resize a chunked upload's temp file with its blocks preallocated.
+
+    Runs in a worker thread. Preallocating keeps chunks that arrive out of
+    order from fragmenting the file, and raises OSError(ENOSPC) before the
+    first byte is accepted if the filesystem cannot hold the rest of it.
+    Filesystems without fallocate get a sparse file as before.
+    """
+    fd = os.open(temp_path, os.O_RDWR | os.O_CREAT, 0o644)
     try:
-        target_loop = getattr(plugin, "main_loop", None)
+        if total_size <= 0:
+            return
+        st = os.fstat(fd)
+        if st.st_size > total_size:
+            os.ftruncate(fd, total_size)
+        needed = total_size - min(st.st_blocks * 512, total_size)
+        if needed > utils.get_free_space(os.path.dirname(temp_path) or "."):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), temp_path)
+        if not utils.fallocate_file(fd, total_size):
+            os.ftruncate(fd, total_size)
+    finally:
+        os.close(fd)
+
+
+def _has_space_for(file_path, size):
+    """Whether ``size`` bytes fit where file_path is written (its current blocks are reused)."""
+    try:
+        free = utils.get_free_space(os.path.dirname(file_path) or ".")
+    except OSError:
+        return True
+    try:
+        free += os.stat(file_path).st_blocks * 512
+    except OSError:
+        pass
+    return size <= free
+
+
+# Out-of-order chunks are kept in memory up to this many bytes per upload so the
+# rolling hash can absorb them later without touching the disk again. Chunks
+# beyond the limit are read back from the temp file once the prefix reaches them.
+_ROLLING_HASH_BUFFER_LIMIT = 32 * 1024 * 1024
+
+
+class _RollingUploadHash:
+    """In-order hash of a chunked upload, fed as the contiguous prefix grows.
+
+    The chunk at the head of the prefix is hashed while it streams in; chunks that
+    arrive ahead of it are buffered (bounded) or remembered as on-disk and absorbed
+    once the prefix reaches them, so finalizing does not re-read the whole file.
+    Bookkeeping runs on the server loop; digest updates run in worker threads.
+    """
+
+    def __init__(self, algo):
+        self.algo = _normalize_hash_algo(algo)
+        self.hasher = hashlib.new(self.algo)
+        self.next_index = 0
+        self.next_offset = 0
+        self.live_index = None
+        self.buffered = {}
+        self.buffered_bytes = 0
+        self.reserved_bytes = 0
+        self.spilled = {}
+        self.draining = False
+        self._drain_lock = asyncio.Lock()
+        self._drain_task = None
+
+    def claim_live(self, index):
+        """Return a hasher to feed while streaming, if ``index`` heads the prefix."""
+        if self.hasher is None or self.draining or self.live_index is not None or index != self.next_index:
+            return None
+        self.live_index = index
+        return self.hasher.copy()
+
+    def reserve(self, index, length):
+        """Reserve buffer room for an out-of-order chunk; False means spill to disk."""
+        if index <= self.next_index:
+            return False
+        if self.buffered_bytes + self.reserved_bytes + length > _ROLLING_HASH_BUFFER_LIMIT:
+            return False
+        self.reserved_bytes += length
+        return True
+
+    def settle(self, index, accepted, length, live_hasher=None, buffer=None, reserved=0):
+        """Record the outcome of one chunk request."""
+        self.reserved_bytes = max(self.reserved_bytes - reserved, 0)
+        if live_hasher is not None and self.live_index == index:
+            self.live_index = None
+            if accepted and index == self.next_index:
+                self.hasher = live_hasher
+                self.next_index += 1
+                self.next_offset += length
+            return
+        if not accepted or index < self.next_index:
+            return
+        previous = self.buffered.pop(index, None)
+        if previous is not None:
+            self.buffered_bytes -= len(previous)
+        if buffer is not None:
+            self.buffered[index] = bytes(buffer)
+            self.buffered_bytes += length
+        else:
+            self.spilled[index] = length
+
+    async def drain(self, session):
+        """Absorb every buffered or spilled chunk that now extends the prefix.
+
+        A drain already in progress picks up newly settled chunks itself, so
+        concurrent callers return immediately.
+        """
+        if self._drain_lock.locked():
+            return
+        async with self._drain_lock:
+            await self._drain_locked(session)
+
+    def schedule_drain(self, session):
+        """Run ``drain`` in the background so the chunk request can respond at once.
+
+        The task gets the session rather than its descriptor: by the time it
+        runs, the upload may have been finalized, reset or expired and the
+        descriptor number reused for another file.
+        """
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.get_running_loop().create_task(self._drain_quietly(session))
+
+    async def _drain_quietly(self, session):
         try:
-            current_loop = asyncio.get_running_loop()
-        except RuntimeError:
-            current_loop = None
-        if target_loop and target_loop.is_running() and target_loop is not current_loop:
-            future = asyncio.run_coroutine_threadsafe(decky.emit(event, payload), target_loop)
+            await self.drain(session)
+        except Exception as e:
+            decky.logger.error(f"Rolling upload hash failed, will rehash at finalize: {e}")
+
+    async def _drain_locked(self, session):
+        self.draining = True
+        try:
+            while self.hasher is not None and self.live_index != self.next_index:
+                index = self.next_index
+                data = self.buffered.pop(index, None)
+                if data is not None:
+                    self.buffered_bytes -= len(data)
+                    await asyncio.to_thread(self.hasher.update, data)
+                    length = len(data)
+                elif index in self.spilled:
+                    fd = session.dup_fd()
+                    if fd is None:
+                        break
+                    length = self.spilled.pop(index)
+                    try:
+                        await asyncio.to_thread(_hash_file_range, fd, self.hasher, self.next_offset, length)
+                    finally:
+                        os.close(fd)
+                else:
+                    break
+                self.next_index += 1
+                self.next_offset += length
+        except BaseException:
+            # A partial update leaves the digest out of step with next_offset.
+            self.hasher = None
+            raise
+        finally:
+            self.draining = False
+
+    async def finish(self, session, total_size=0):
+        """Return the digest once all chunks are on disk.
+
+        Normally only the last chunk's bookkeeping is left, so this is constant
+        time; anything the prefix never reached is read back from the temp file.
+        """
+        async with self._drain_lock:
+            fd = session.open_fd()
+            if self.hasher is not None:
+                await self._drain_locked(session)
+            else:
+                self.hasher = hashlib.new(self.algo)
+                self.next_offset = 0
+            remaining = total_size - self.next_offset if total_size > 0 else None
+            if remaining is None or remaining > 0:
+                self.next_offset = await asyncio.to_thread(
+                    _hash_file_range, fd, self.hasher, self.next_offset, remaining
+                )
+            return self.hasher.hexdigest()
+
+
+
+async def _run_on_decky_loop(plugin, coro):
+    target_loop = getattr(plugin, "main_loop", None)
+    try:
+        current_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        current_loop = None
+    if target_loop and target_loop.is_running() and target_loop is not current_loop:
+        future = asyncio.run_coroutine_threadsafe(coro, target_loop)
+        await asyncio.wrap_future(future)
+        return
+    await coro
+
+
+async def _emit_decky(plugin, event, payload):
+    try:
+        await _run_on_decky_loop(plugin, decky.emit(event, payload))
+    except Exception as emit_error:
+        decky.logger.error(f"Decky emit failed ({event}): {emit_error}")
+
+
+async def _emit_decky_events(plugin, events):
+    """Emit several (event, payload) pairs with a single hop onto the Decky loop."""
+    async def emit_all():
+        for event, payload in events:
             try:
-                await asyncio.wrap_future(future)
+                await decky.emit(event, payload)
             except Exception as emit_error:
                 decky.logger.error(f"Decky emit failed ({event}): {emit_error}")
-            return
-        await decky.emit(event, payload)
+
+    try:
+        await _run_on_decky_loop(plugin, emit_all())
     except Exception as emit_error:
-        decky.logger.error(f"Decky emit failed ({event}): {emit_error}")
+        decky.logger.error(f"Decky emit failed: {emit_error}")
 
 
 
@@ -791,11 +1210,13 @@ def get_file_manager_html():
                         inputCancel: '取消',
                         editorTitle: '文件编辑器',
                         editorTitleWithName: '编辑文件：{{name}}',
+                        editorTitleTail: '{{name}} 的最后 {{lines}} 行（文件过大，只读）',
                         unpackTitle: '正在解压',
                         unpacking: '正在解压...',
                         unpackingWithName: '正在解压：{{name}}',
                         fileOpCopy: '正在复制',
                         fileOpMove: '正在剪切',
+                        fileOpDelete: '正在删除',
                         fileOpTarget: '目标：{{name}}',
                         renameTitle: '重命名',
                         newFileTitle: '新建文件',
@@ -895,11 +1316,13 @@ def get_file_manager_html():
                         inputCancel: 'Cancel',
                         editorTitle: 'File Editor',
                         editorTitleWithName: 'Edit file: {{name}}',
+                        editorTitleTail: 'Last {{lines}} lines of {{name}} (file too large, read-only)',
                         unpackTitle: 'Extracting',
                         unpacking: 'Extracting...',
                         unpackingWithName: 'Extracting: {{name}}',
                         fileOpCopy: 'Copying',
                         fileOpMove: 'Moving',
+                        fileOpDelete: 'Deleting',
                         fileOpTarget: 'Target: {{name}}',
                         renameTitle: 'Rename',
                         newFileTitle: 'New File',
@@ -1089,6 +1512,10 @@ def get_file_manager_html():
                 // File Manager Functionality
                 let currentPath = '/home/deck'; // Set default path to /home/deck
                 let editingFile = null;
+                // Content and version the open file was read at (for delta saves)
+                let editingBase = null;
+                // Lines shown when a file is too large to open whole
+                const FILE_TAIL_LINES = 2000;
                 let contextMenuPath = '';
                 
                 // DOM Elements
@@ -1143,6 +1570,8 @@ def get_file_manager_html():
                 const fileOpProgressText = document.getElementById('fileop-progress-text');
                 let fileOpTimer = null;
                 let fileOpProgressValue = 0;
+                const fileOpClose = document.getElementById('fileop-close');
+                let activeFileJobId = null;
 
                 if (sdcardBtn) {
                     sdcardBtn.addEventListener('click', () => {
@@ -1717,18 +2146,100 @@ def get_file_manager_html():
                         fileOpModal.style.display = 'none';
                     }, 500);
                 }
+
+                // Follow a background file job (copy / move / delete) until it ends,
+                // showing its real progress; the × button cancels it.
+                async function waitForFileJob(job) {
+                    activeFileJobId = job.id;
+                    if (fileOpTimer) {
+                        clearInterval(fileOpTimer);
+                        fileOpTimer = null;
+                    }
+                    if (fileOpClose) {
+                        fileOpClose.style.visibility = 'visible';
+                    }
+                    try {
+                        while (!['done', 'failed', 'cancelled'].includes(job.state)) {
+                            updateFileOpProgress(job);
+                            await new Promise(resolve => setTimeout(resolve, 400));
+                            const response = await fetch('/api/jobs/status?id=' + encodeURIComponent(job.id));
+                            const data = await response.json();
+                            if (data.status !== 'success') {
+                                throw new Error(data.message);
+                            }
+                            job = data.job;
+                        }
+                        return job;
+                    } finally {
+                        activeFileJobId = null;
+                        if (fileOpClose) {
+                            fileOpClose.style.visibility = 'hidden';
+                        }
+                    }
+                }
+
+                function updateFileOpProgress(job) {
+                    let percent = 0;
+                    if (job.bytes_total > 0) {
+                        percent = Math.floor(job.bytes_done * 100 / job.bytes_total);
+                    } else if (job.files_total > 0) {
+                        percent = Math.floor(job.files_done * 100 / job.files_total);
+                    }
+                    if (fileOpProgressFill) {
+                        fileOpProgressFill.style.width = `${percent}%`;
+                    }
+                    if (fileOpProgressText) {
+                        fileOpProgressText.textContent = job.speed > 0 ? `${percent}% · ${formatSize(job.speed)}/s` : `${percent}%`;
+                    }
+                }
+
+                // Submit a copy / move / delete request; resolves to {ok, message} once the job has ended
+                async function runFileOperation(endpoint, body) {
+                    const response = await fetch(endpoint, {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json'
+                        },
+                        body: JSON.stringify(body)
+                    });
+                    const data = await response.json();
+                    if (data.status !== 'accepted') {
+                        return { ok: data.status === 'success', message: data.message };
+                    }
+                    const job = await waitForFileJob(data.job);
+                    return { ok: job.state === 'done', message: job.error || job.state };
+                }
+
+                if (fileOpClose) {
+                    fileOpClose.addEventListener('click', async () => {
+                        if (!activeFileJobId) return;
+                        await fetch('/api/jobs/cancel', {
+                            method: 'POST',
+                            headers: {
+                                'Content-Type': 'application/json'
+                            },
+                            body: JSON.stringify({ id: activeFileJobId })
+                        });
+                    });
+                }
                 
-                function showFileEditor(title, content, filePath) {
+                function showFileEditor(title, content, filePath, readOnly = false, version = null) {
                     editorTitle.textContent = title;
                     fileContent.value = content;
-                    editingFile = filePath;
+                    fileContent.readOnly = readOnly;
+                    saveFileBtn.disabled = readOnly;
+                    editingFile = readOnly ? null : filePath;
+                    editingBase = readOnly || !version ? null : { content, version };
                     fileEditorModal.style.display = 'block';
                     fileContent.focus();
                 }
                 
                 function hideFileEditor() {
                     fileEditorModal.style.display = 'none';
+                    fileContent.readOnly = false;
+                    saveFileBtn.disabled = false;
                     editingFile = null;
+                    editingBase = null;
                 }
                 
                 // Event Listeners for Modals
@@ -2068,8 +2579,11 @@ def get_file_manager_html():
                         });
                         
                         const data = await response.json();
-                        if (data.status === 'success') {
-                            showFileEditor(t('modal.editorTitleWithName', { name: filePath.split('/').pop() || '' }), data.content, filePath);
+                        if (response.status === 413) {
+                            // Too large to edit: show the end of the file instead
+                            await openFileTail(filePath);
+                        } else if (data.status === 'success') {
+                            showFileEditor(t('modal.editorTitleWithName', { name: filePath.split('/').pop() || '' }), data.content, filePath, false, data.version);
                         } else {
                             alert('打开文件失败: ' + data.message);
                         }
@@ -2079,19 +2593,71 @@ def get_file_manager_html():
                     }
                 }
                 
+                // Open the last lines of a large file (read-only)
+                async function openFileTail(filePath) {
+                    const response = await fetch('/api/files/read', {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json'
+                        },
+                        body: JSON.stringify({ path: filePath, tail: FILE_TAIL_LINES })
+                    });
+                
+                    const data = await response.json();
+                    if (data.status === 'success') {
+                        const name = filePath.split('/').pop() || '';
+                        showFileEditor(t('modal.editorTitleTail', { name, lines: data.lines }), data.content, filePath, true);
+                        fileContent.scrollTop = fileContent.scrollHeight;
+                    } else {
+                        alert('打开文件失败: ' + data.message);
+                    }
+                }
+                
+                // One edit covering the changed middle of the text, in UTF-8 byte offsets
+                function textEdit(before, after) {
+                    const max = Math.min(before.length, after.length);
+                    let start = 0;
+                    while (start < max && before.charCodeAt(start) === after.charCodeAt(start)) {
+                        start++;
+                    }
+                    let end = 0;
+                    while (end < max - start && before.charCodeAt(before.length - 1 - end) === after.charCodeAt(after.length - 1 - end)) {
+                        end++;
+                    }
+                    // Never split a surrogate pair (emoji and other astral characters)
+                    if (start > 0 && before.charCodeAt(start - 1) >= 0xD800 && before.charCodeAt(start - 1) <= 0xDBFF) {
+                        start--;
+                    }
+                    if (end > 0 && before.charCodeAt(before.length - end) >= 0xDC00 && before.charCodeAt(before.length - end) <= 0xDFFF) {
+                        end--;
+                    }
+                    const encoder = new TextEncoder();
+                    return {
+                        offset: encoder.encode(before.slice(0, start)).length,
+                        delete: encoder.encode(before.slice(start, before.length - end)).length,
+                        insert: after.slice(start, after.length - end)
+                    };
+                }
+                
                 // Save file
                 async function saveFile(content, filePath) {
                     try {
+                        // Send only the changed part when the version read is known
+                        const body = editingBase && editingFile === filePath
+                            ? { path: filePath, base: editingBase.version, edits: [textEdit(editingBase.content, content)] }
+                            : { path: filePath, content };
                         const response = await fetch('/api/files/write', {
                             method: 'POST',
                             headers: {
                                 'Content-Type': 'application/json'
                             },
-                            body: JSON.stringify({ path: filePath, content })
+                            body: JSON.stringify(body)
                         });
-                        
+                
                         const data = await response.json();
-                        if (data.status === 'success') {
+                        if (response.status === 409) {
+                            alert('保存文件失败: 文件已被其他程序修改，请重新打开后再编辑');
+                        } else if (data.status === 'success') {
                             alert('文件保存成功');
                             hideFileEditor();
                             await renderFileList(currentPath);
@@ -2171,23 +2737,18 @@ def get_file_manager_html():
                             return;
                         }
                         
-                        const response = await fetch('/api/files/delete', {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json'
-                            },
-                            body: JSON.stringify({ path })
-                        });
-                        
-                        const data = await response.json();
-                        if (data.status === 'success') {
-                            await renderFileList(currentPath);
+                        showFileOpProgress(t('modal.fileOpDelete'), path.split('/').pop());
+                        const result = await runFileOperation('/api/files/delete', { path });
+                        finishFileOpProgress(result.ok);
+                        await renderFileList(currentPath);
+                        if (result.ok) {
                             alert('删除成功');
                         } else {
-                            alert('删除失败: ' + data.message);
+                            alert('删除失败: ' + result.message);
                         }
                     } catch (error) {
                         console.error('删除出错:', error);
+                        finishFileOpProgress(false);
                         alert('删除出错: ' + error.message);
                     }
                 }
@@ -2249,17 +2810,9 @@ def get_file_manager_html():
                         showFileOpProgress(opTitle, filename);
                         const endpoint = isCut ? '/api/files/move' : '/api/files/copy';
                         
-                        const response = await fetch(endpoint, {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json'
-                            },
-                            body: JSON.stringify({ source: copiedPath, destination: targetPath })
-                        });
-                        
-                        const data = await response.json();
-                        finishFileOpProgress(data.status === 'success');
-                        if (data.status === 'success') {
+                        const result = await runFileOperation(endpoint, { source: copiedPath, destination: targetPath });
+                        finishFileOpProgress(result.ok);
+                        if (result.ok) {
                             await renderFileList(currentPath);
                             alert(isCut ? '剪切成功' : '粘贴成功');
                             // Hide paste button after successful paste
@@ -2267,7 +2820,8 @@ def get_file_manager_html():
                             clipboardMode = 'copy';
                             updatePasteButtonVisibility();
                         } else {
-                            alert((isCut ? '剪切' : '粘贴') + '失败: ' + data.message);
+                            await renderFileList(currentPath);
+                            alert((isCut ? '剪切' : '粘贴') + '失败: ' + result.message);
                         }
                     } catch (error) {
                         console.error('粘贴出错:', error);
@@ -2406,15 +2960,7 @@ async def handle_index(request):
                 overflow: hidden;
             }
             body {
-<<<<<<< HEAD
                 font-family: "Plus Jakarta Sans", "Noto Sans SC", "PingFang SC", "Microsoft YaHei", sans-serif;
-=======
-<<<<<<< HEAD
-                font-family: "Plus Jakarta Sans", "Noto Sans SC", "PingFang SC", "Microsoft YaHei", sans-serif;
-=======
-                font-family: "IBM Plex Sans", "Noto Sans", "Ubuntu", "Segoe UI", sans-serif;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 max-width: min(960px, 100%);
                 margin: 0 auto;
                 padding: calc(env(safe-area-inset-top, 0px) + 18px) 16px 16px;
@@ -2422,14 +2968,7 @@ async def handle_index(request):
                 background: transparent;
                 color: var(--text);
                 min-height: 100vh;
-<<<<<<< HEAD
-                line-height: var(--type-body-medium-line-height);
-=======
-<<<<<<< HEAD
                 line-height: var(--type-body-medium-line-height);
-=======
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             body::after {
                 content: "";
@@ -2448,10 +2987,6 @@ async def handle_index(request):
             }
             h1 {
                 color: var(--text);
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 font-size: var(--type-title-large-size);
                 line-height: var(--type-title-large-line-height);
                 font-weight: var(--type-title-large-weight);
@@ -2463,59 +2998,23 @@ async def handle_index(request):
                 margin-top: 0;
                 font-size: var(--type-body-medium-size);
             }
-<<<<<<< HEAD
-=======
-=======
-                font-weight: 700;
-                letter-spacing: 0.5px;
-                margin: 0 0 6px;
-            }
-            p {
-                color: var(--muted);
-                margin-top: 0;
-            }
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             .subtitle {
                 margin-bottom: 0;
             }
             
             /* Tab styles */
             .tab-container {
-<<<<<<< HEAD
-                margin: var(--space-4) 0;
-=======
-<<<<<<< HEAD
                 margin: var(--space-4) 0;
-=======
-                margin: 12px 0;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .tab-buttons {
                 display: flex;
                 justify-content: center;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 gap: var(--space-1);
                 margin-bottom: var(--space-4);
                 padding: var(--space-1);
                 background: var(--panel);
                 border: 1px solid var(--border);
                 border-radius: var(--shape-large);
-<<<<<<< HEAD
-=======
-=======
-                gap: 6px;
-                margin-bottom: 12px;
-                padding: 6px;
-                background: var(--panel);
-                border: 1px solid var(--border);
-                border-radius: 14px;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 box-shadow: var(--shadow);
                 overflow-x: hidden;
                 overflow-y: hidden;
@@ -2536,10 +3035,6 @@ async def handle_index(request):
                 -webkit-user-select: none;
                 -ms-user-select: none;
             }
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             .tab-button {
                 background: transparent;
                 border: 1px solid transparent;
@@ -2549,27 +3044,10 @@ async def handle_index(request):
                 line-height: var(--type-label-large-line-height);
                 cursor: pointer;
                 transition: all var(--motion-short) ease;
-<<<<<<< HEAD
-=======
-=======
-            .tab-button {
-                background: transparent;
-                border: 1px solid transparent;
-                color: var(--muted);
-                padding: 10px 16px;
-                font-size: 14px;
-                cursor: pointer;
-                transition: all 0.2s ease;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 border-radius: 999px;
                 margin: 0;
                 flex: 0 0 auto;
                 white-space: nowrap;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 font-weight: var(--type-label-large-weight);
             }
             .tab-button.active {
@@ -2582,22 +3060,6 @@ async def handle_index(request):
                 color: var(--text);
                 background-color: rgba(143, 216, 204, 0.12);
             }
-<<<<<<< HEAD
-=======
-=======
-            }
-            .tab-button.active {
-                color: var(--text);
-                background: var(--accent-soft);
-                border-color: rgba(77, 182, 172, 0.45);
-                box-shadow: inset 0 0 0 1px rgba(77, 182, 172, 0.15);
-            }
-            .tab-button:hover {
-                color: var(--text);
-                background-color: rgba(255, 255, 255, 0.06);
-            }
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             
             .tab-panel {
                 display: none;
@@ -2810,46 +3272,19 @@ async def handle_index(request):
             .action-buttons {
                 display: flex;
                 align-items: center;
-<<<<<<< HEAD
                 justify-content: center;
                 gap: var(--space-1);
                 margin: 6px 0;
-=======
-<<<<<<< HEAD
-                justify-content: center;
-                gap: var(--space-1);
-                margin: 6px 0;
-=======
-<<<<<<< HEAD
-                justify-content: center;
-                gap: 8px;
-                margin: 8px 0;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 flex-wrap: nowrap;
                 overflow-x: hidden;
                 overflow-y: hidden;
                 scrollbar-width: none;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 padding: 3px 4px;
                 -webkit-overflow-scrolling: touch;
                 border: 1px solid rgba(255, 255, 255, 0.08);
                 border-radius: var(--shape-medium);
                 background: var(--panel);
                 box-shadow: var(--shadow);
-<<<<<<< HEAD
-=======
-=======
-                padding: 6px;
-                -webkit-overflow-scrolling: touch;
-                border: 1px solid rgba(255, 255, 255, 0.08);
-                border-radius: 12px;
-                background: rgba(255, 255, 255, 0.03);
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .action-buttons.is-scrollable {
                 justify-content: flex-start;
@@ -2860,40 +3295,12 @@ async def handle_index(request):
             }
             .action-buttons::-webkit-scrollbar-thumb {
                 display: none;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
-=======
-=======
-                gap: 6px;
-                margin: 10px 0;
-                flex-wrap: nowrap;
-                overflow-x: auto;
-                overflow-y: hidden;
-                scrollbar-width: thin;
-                scrollbar-color: rgba(77, 182, 172, 0.55) transparent;
-                padding: 2px 2px 8px 2px;
-                -webkit-overflow-scrolling: touch;
-            }
-            .action-buttons::-webkit-scrollbar {
-                height: 6px;
-            }
-            .action-buttons::-webkit-scrollbar-thumb {
-                background: rgba(77, 182, 172, 0.5);
-                border-radius: 999px;
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .action-buttons button {
                 background: var(--panel-strong);
                 color: var(--text);
                 border: 1px solid var(--border);
                 box-shadow: none;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 border-radius: var(--shape-medium);
                 padding: 0 10px;
                 font-size: 0.75rem;
@@ -2906,37 +3313,10 @@ async def handle_index(request):
             .action-buttons button:hover {
                 border-color: rgba(143, 216, 204, 0.55);
                 background: rgba(143, 216, 204, 0.12);
-<<<<<<< HEAD
-=======
-=======
-<<<<<<< HEAD
-                border-radius: 10px;
-                padding: 0 12px;
-                font-size: 12px;
-                font-weight: 600;
-                margin: 0;
-                min-height: 34px;
-                line-height: 1;
-=======
-                padding: 7px 12px;
-                font-size: 12px;
-                margin: 0;
-                min-height: 34px;
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
-                flex: 0 0 auto;
-            }
-            .action-buttons button:hover {
-                border-color: rgba(77, 182, 172, 0.5);
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .action-inline-control {
                 display: inline-flex;
                 align-items: center;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 gap: 6px;
                 background: var(--panel-strong);
                 color: var(--text);
@@ -2948,48 +3328,13 @@ async def handle_index(request):
                 flex: 0 0 auto;
                 min-height: 32px;
             }
-<<<<<<< HEAD
-=======
-=======
-                gap: 8px;
-                background: var(--panel-strong);
-                color: var(--text);
-                border: 1px solid var(--border);
-                border-radius: 10px;
-<<<<<<< HEAD
-                padding: 0 10px;
-=======
-                padding: 5px 8px;
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
-                font-size: 11px;
-                white-space: nowrap;
-                flex: 0 0 auto;
-                min-height: 34px;
-            }
-<<<<<<< HEAD
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             .action-inline-control span {
                 color: var(--muted);
                 font-weight: 600;
             }
-<<<<<<< HEAD
-            .action-inline-control input[type="checkbox"] {
-                width: 13px;
-                height: 13px;
-=======
-<<<<<<< HEAD
             .action-inline-control input[type="checkbox"] {
                 width: 13px;
                 height: 13px;
-=======
-=======
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
-            .action-inline-control input[type="checkbox"] {
-                width: 14px;
-                height: 14px;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 margin: 0;
                 accent-color: var(--accent);
             }
@@ -2997,46 +3342,17 @@ async def handle_index(request):
                 background: var(--bg-elev);
                 color: var(--text);
                 border: 1px solid var(--border);
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 border-radius: var(--shape-small);
                 padding: 2px var(--space-2);
                 font-size: 0.75rem;
                 min-height: 24px;
                 max-width: 130px;
-<<<<<<< HEAD
-=======
-=======
-                border-radius: 8px;
-                padding: 3px 6px;
-                font-size: 11px;
-<<<<<<< HEAD
-                min-height: 26px;
-                max-width: 138px;
-=======
-                max-width: 152px;
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .action-buttons,
             .action-buttons * {
                 user-select: none;
                 -webkit-user-select: none;
                 -ms-user-select: none;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
-=======
-            }
-            .file-list-container {
-                border: 1px solid var(--border);
-                border-radius: 12px;
-                background-color: var(--panel);
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .file-list-container {
                 border: 1px solid var(--border);
@@ -3079,10 +3395,6 @@ async def handle_index(request):
                 margin-top: 8px;
                 text-align: right;
             }
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             .upload-path-current {
                 font-size: var(--type-body-medium-size);
                 color: var(--muted);
@@ -3116,60 +3428,12 @@ async def handle_index(request):
                 gap: var(--space-3);
                 justify-content: flex-end;
                 margin-top: var(--space-4);
-<<<<<<< HEAD
-=======
-=======
-            .upload-path-current {
-                font-size: 12px;
-                color: var(--muted);
-                margin-bottom: 10px;
-                word-break: break-all;
-            }
-            .upload-path-list {
-                border: 1px solid var(--border);
-                border-radius: 10px;
-                background: var(--panel);
-                max-height: 260px;
-                overflow-y: auto;
-                padding: 6px;
-                text-align: left;
-            }
-            .upload-path-item {
-                padding: 8px 10px;
-                border-radius: 8px;
-                cursor: pointer;
-                display: flex;
-                align-items: center;
-                gap: 8px;
-                color: var(--text);
-                transition: background-color 0.15s ease;
-            }
-            .upload-path-item:hover {
-                background: rgba(77, 182, 172, 0.12);
-            }
-            .upload-path-actions {
-                display: flex;
-                gap: 10px;
-                justify-content: flex-end;
-                margin-top: 14px;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 flex-wrap: wrap;
             }
             .media-toolbar {
                 display: flex;
-<<<<<<< HEAD
-                gap: var(--space-2);
-                margin: var(--space-3) 0 var(--space-2) 0;
-=======
-<<<<<<< HEAD
                 gap: var(--space-2);
                 margin: var(--space-3) 0 var(--space-2) 0;
-=======
-                gap: 8px;
-                margin: 10px 0 8px 0;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 flex-wrap: wrap;
                 justify-content: center;
             }
@@ -3181,10 +3445,6 @@ async def handle_index(request):
                 box-shadow: none;
             }
             #media-download-btn {
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 background: var(--accent);
                 color: var(--on-accent);
                 border: 1px solid transparent;
@@ -3195,34 +3455,11 @@ async def handle_index(request):
                 font-size: var(--type-body-medium-size);
                 color: var(--muted);
                 margin: 0 0 var(--space-3) 0;
-<<<<<<< HEAD
-=======
-=======
-                background: linear-gradient(180deg, var(--accent) 0%, var(--accent-strong) 100%);
-                color: #0c1416;
-                border: 1px solid rgba(0, 0, 0, 0.1);
-                box-shadow: 0 8px 18px rgba(47, 166, 154, 0.25);
-            }
-            .media-summary {
-                text-align: left;
-                font-size: 12px;
-                color: var(--muted);
-                margin: 0 0 10px 0;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .media-grid {
                 display: grid;
                 grid-template-columns: repeat(auto-fill, minmax(140px, 1fr));
-<<<<<<< HEAD
                 gap: var(--space-3);
-=======
-<<<<<<< HEAD
-                gap: var(--space-3);
-=======
-                gap: 10px;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 text-align: left;
                 max-height: min(62vh, 520px);
                 overflow-y: auto;
@@ -3232,41 +3469,18 @@ async def handle_index(request):
             .media-card {
                 background: var(--panel);
                 border: 1px solid var(--border);
-<<<<<<< HEAD
-                border-radius: var(--shape-medium);
-=======
-<<<<<<< HEAD
                 border-radius: var(--shape-medium);
-=======
-                border-radius: 10px;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 overflow: hidden;
                 cursor: pointer;
                 transition: border-color 0.15s ease, box-shadow 0.15s ease;
             }
             .media-card:hover {
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 border-color: rgba(143, 216, 204, 0.6);
                 box-shadow: 0 0 0 1px rgba(143, 216, 204, 0.28);
             }
             .media-card.selected {
                 border-color: var(--accent);
                 box-shadow: 0 0 0 1px rgba(143, 216, 204, 0.35), inset 0 0 0 1px rgba(143, 216, 204, 0.25);
-<<<<<<< HEAD
-=======
-=======
-                border-color: rgba(77, 182, 172, 0.6);
-                box-shadow: 0 0 0 1px rgba(77, 182, 172, 0.25);
-            }
-            .media-card.selected {
-                border-color: var(--accent);
-                box-shadow: 0 0 0 1px rgba(77, 182, 172, 0.35), inset 0 0 0 1px rgba(77, 182, 172, 0.25);
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             }
             .media-card.queued {
                 border-color: rgba(124, 197, 255, 0.8);
@@ -3351,13 +3565,6 @@ async def handle_index(request):
             @media (max-width: 640px) {
                 body {
                     max-width: 100%;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                     padding: calc(env(safe-area-inset-top, 0px) + 10px) 10px 10px;
                 }
                 .subtitle {
@@ -3372,26 +3579,6 @@ async def handle_index(request):
                 .tab-button {
                     padding: 7px 11px;
                     font-size: 12px;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
-=======
-=======
-                    padding: 16px;
-                }
-                .subtitle {
-                    display: none;
-                }
-                .tab-buttons {
-                    flex-wrap: wrap;
-                    border-radius: 18px;
-                }
-                .tab-button {
-                    padding: 8px 12px;
-                    font-size: 13px;
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 }
                 .media-grid {
                     grid-template-columns: repeat(2, minmax(0, 1fr));
@@ -3420,10 +3607,6 @@ async def handle_index(request):
                     gap: 8px;
                 }
                 .action-buttons {
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                     gap: 5px;
                     margin: 5px 0;
                     padding: 3px;
@@ -3432,39 +3615,11 @@ async def handle_index(request):
                     padding: 0 8px;
                     font-size: 11px;
                     min-height: 30px;
-<<<<<<< HEAD
-=======
-=======
-<<<<<<< HEAD
-                    gap: 6px;
-                    margin: 6px 0;
-                    padding: 4px;
-                }
-                .action-buttons button {
-                    padding: 0 9px;
-                    font-size: 11px;
-                    min-height: 30px;
-=======
-                    gap: 5px;
-                    margin: 8px 0;
-                    padding: 2px 2px 6px 2px;
-                }
-                .action-buttons button {
-                    padding: 6px 10px;
-                    font-size: 11px;
-                    min-height: 32px;
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 }
                 .action-inline-control {
                     width: auto;
                     justify-content: flex-start;
                     font-size: 10px;
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                     min-height: 30px;
                     gap: 5px;
                     padding: 0 7px;
@@ -3473,26 +3628,6 @@ async def handle_index(request):
                     max-width: 104px;
                     font-size: 10px;
                     padding: 1px 4px;
-<<<<<<< HEAD
-=======
-=======
-<<<<<<< HEAD
-                    min-height: 30px;
-                    gap: 6px;
-                    padding: 0 8px;
-                }
-                .action-inline-control select {
-                    max-width: 110px;
-=======
-                    min-height: 32px;
-                }
-                .action-inline-control select {
-                    max-width: 130px;
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
-                    font-size: 10px;
-                    padding: 2px 5px;
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 }
             }
         </style>
@@ -3722,18 +3857,8 @@ async def handle_index(request):
             const I18N = {
                 'zh-CN': {
                     title: {
-<<<<<<< HEAD
-                        fileManager: 'Friendeck 文件管理器',
-                        upload: 'Friendeck 文件上传'
-=======
-<<<<<<< HEAD
                         fileManager: 'Friendeck 文件管理器',
                         upload: 'Friendeck 文件上传'
-=======
-                        fileManager: 'decky-send 文件管理器',
-                        upload: 'decky-send 文件上传'
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                     },
                     subtitle: '将文件或文本上传到 Steam Deck',
                     tabs: {
@@ -3801,11 +3926,13 @@ async def handle_index(request):
                         inputCancel: '取消',
                         editorTitle: '文件编辑器',
                         editorTitleWithName: '编辑文件：{{name}}',
+                        editorTitleTail: '{{name}} 的最后 {{lines}} 行（文件过大，只读）',
                         unpackTitle: '正在解压',
                         unpacking: '正在解压...',
                         unpackingWithName: '正在解压：{{name}}',
                         fileOpCopy: '正在复制',
                         fileOpMove: '正在剪切',
+                        fileOpDelete: '正在删除',
                         fileOpTarget: '目标：{{name}}',
                         renameTitle: '重命名',
                         newFileTitle: '新建文件',
@@ -3836,18 +3963,8 @@ async def handle_index(request):
                 },
                 'en-US': {
                     title: {
-<<<<<<< HEAD
-                        fileManager: 'Friendeck File Manager',
-                        upload: 'Friendeck File Transfer'
-=======
-<<<<<<< HEAD
                         fileManager: 'Friendeck File Manager',
                         upload: 'Friendeck File Transfer'
-=======
-                        fileManager: 'decky-send File Manager',
-                        upload: 'decky-send File Transfer'
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                     },
                     subtitle: 'Upload files or text to Steam Deck',
                     tabs: {
@@ -3915,11 +4032,13 @@ async def handle_index(request):
                         inputCancel: 'Cancel',
                         editorTitle: 'File Editor',
                         editorTitleWithName: 'Edit file: {{name}}',
+                        editorTitleTail: 'Last {{lines}} lines of {{name}} (file too large, read-only)',
                         unpackTitle: 'Extracting',
                         unpacking: 'Extracting...',
                         unpackingWithName: 'Extracting: {{name}}',
                         fileOpCopy: 'Copying',
                         fileOpMove: 'Moving',
+                        fileOpDelete: 'Deleting',
                         fileOpTarget: 'Target: {{name}}',
                         renameTitle: 'Rename',
                         newFileTitle: 'New File',
@@ -4149,18 +4268,7 @@ async def handle_index(request):
                             ensureMediaLoaded();
                         }
                     }
-<<<<<<< HEAD
                     updateTopRailModes();
-=======
-<<<<<<< HEAD
-                    updateTopRailModes();
-=======
-<<<<<<< HEAD
-                    updateTopRailModes();
-=======
->>>>>>> e69c626ae51e58cf11fdabde00d6e48388db3e5c
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
                 };
                 
                 tabButtons.forEach(button => {
@@ -4250,10 +4358,6 @@ async def handle_index(request):
             let mediaObserver = null;
             let uploadPromptEnabled = false;
             let defaultUploadDir = '';
-<<<<<<< HEAD
-=======
-<<<<<<< HEAD
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             const uploadPathModal = document.getElementById('upload-path-modal');
             const uploadPathCurrent = document.getElementById('upload-path-current');
             const uploadPathList = document.getElementById('upload-path-list');
@@ -4262,19 +4366,6 @@ async def handle_index(request):
             const uploadPathCancel = document.getElementById('upload-path-cancel');
             let uploadPathResolve = null;
             let uploadPathCurrentValue = '';
-<<<<<<< HEAD
-=======
-=======
-            const uploadPathModal = document.getElementById('upload-path-modal');
-            const uploadPathCurrent = document.getElementById('upload-path-current');
-            const uploadPathList = document.getElementById('upload-path-list');
-            const uploadPathUp = document.getElementById('upload-path-up');
-            const uploadPathOk = document.getElementById('upload-path-ok');
-            const uploadPathCancel = document.getElementById('upload-path-cancel');
-            let uploadPathResolve = null;
-            let uploadPathCurrentValue = '';
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
 
             async function refreshUploadOptions() {
                 try {
@@ -4958,11 +5049,28 @@ function cancelFile(file) {
             
                         
 const FILE_PARALLEL = 2;
+// Fallbacks if /api/upload/plan is unavailable; the server normally tunes these
+// to the destination disk and this client's link.
 const CHUNK_THRESHOLD = 512 * 1024 * 1024;
 const CHUNK_SIZE = 8 * 1024 * 1024;
 const CHUNK_PARALLEL = 2;
+// Smaller files never get chunked, so they skip the plan request.
+const PLAN_MIN_SIZE = 64 * 1024 * 1024;
+// Files up to BATCH_FILE_MAX are sent together through /upload-batch.
+const BATCH_FILE_MAX = 1024 * 1024;
+const BATCH_MAX_FILES = 500;
+const BATCH_MAX_BYTES = 32 * 1024 * 1024;
+// Compressible files (judged from a gzip'd sample) are sent gzip-encoded; the
+// server decodes while streaming. Whole-file compression is limited to simple
+// uploads up to COMPRESS_SIMPLE_MAX since the compressed body is held in memory.
+const COMPRESS_SAMPLE_SIZE = 256 * 1024;
+const COMPRESS_MAX_RATIO = 0.8;
+const COMPRESS_SIMPLE_MAX = 64 * 1024 * 1024;
 const CHUNK_MAX_RETRIES = 5;
 const CHUNK_RETRY_BASE = 500;
+// A busy server answers 503 with Retry-After; the upload waits and resends
+// without counting it as a failed attempt.
+const BUSY_MAX_RETRIES = 30;
 const HASH_THRESHOLD = 256 * 1024 * 1024;
 const HASH_ALGO = 'SHA-256';
 
@@ -4992,6 +5100,13 @@ function sleep(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));
 }
 
+function getRetryAfterMs(xhr) {
+    const seconds = parseFloat(xhr.getResponseHeader('Retry-After') || '');
+    const base = Number.isFinite(seconds) && seconds > 0 ? seconds * 1000 : 2000;
+    // Jitter keeps clients turned away together from coming back together
+    return base + Math.round(Math.random() * base * 0.5);
+}
+
 async function computeFileHash(file) {
     if (!window.crypto || !window.crypto.subtle) {
         return null;
@@ -5014,12 +5129,83 @@ async function computeFileHashIfNeeded(file) {
     }
 }
 
+async function gzipBlob(blob) {
+    const stream = blob.stream().pipeThrough(new CompressionStream('gzip'));
+    return await new Response(stream).blob();
+}
+
+async function isCompressible(file) {
+    if (typeof CompressionStream === 'undefined' || file.size < 4096) {
+        return false;
+    }
+    try {
+        const sample = file.slice(0, Math.min(file.size, COMPRESS_SAMPLE_SIZE));
+        const packed = await gzipBlob(sample);
+        return packed.size < sample.size * COMPRESS_MAX_RATIO;
+    } catch (error) {
+        return false;
+    }
+}
+
+async function tryInstantUpload(file, chosenPath, fileHash) {
+    try {
+        const response = await fetch('/api/upload/instant', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                file_hash: fileHash,
+                hash_algo: HASH_ALGO,
+                size: file.size,
+                filename: file.name,
+                dest_path: chosenPath || '',
+                relative_path: getFileRelativePath(file) || ''
+            })
+        });
+        if (!response.ok) return null;
+        const data = await response.json();
+        if (data.status !== 'success' || !data.hit) return null;
+        const fileKey = getFileKey(file);
+        activateProgress(fileKey);
+        updateFileProgress(fileKey, 100, 0, 'success');
+        return { status: 'success' };
+    } catch (error) {
+        console.warn('Instant upload check failed', error);
+        return null;
+    }
+}
+
+async function getUploadPlan(file, chosenPath) {
+    const fallback = {
+        chunkSize: CHUNK_SIZE,
+        parallel: CHUNK_PARALLEL,
+        chunked: file.size >= CHUNK_THRESHOLD
+    };
+    try {
+        const response = await fetch('/api/upload/plan', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                dest_path: chosenPath || '',
+                file_size: file.size,
+                upload_id: buildUploadId(file, chosenPath)
+            })
+        });
+        if (!response.ok) return fallback;
+        const data = await response.json();
+        if (data.status !== 'success' || !(data.chunk_size > 0) || !(data.parallel > 0)) return fallback;
+        return { chunkSize: data.chunk_size, parallel: data.parallel, chunked: !!data.chunked };
+    } catch (error) {
+        console.warn('Upload plan request failed', error);
+        return fallback;
+    }
+}
+
 async function getResumeInfo(uploadId, totalChunks, totalSize) {
     try {
         const response = await fetch('/upload-status', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ upload_id: uploadId, total_chunks: totalChunks, total_size: totalSize })
+            body: JSON.stringify({ upload_id: uploadId, total_chunks: totalChunks, total_size: totalSize, format: 'ranges' })
         });
         if (!response.ok) return null;
         const data = await response.json();
@@ -5039,7 +5225,7 @@ function activateProgress(fileKey) {
     }
 }
 
-function uploadFileSimple(file, chosenPath, fileHash) {
+function uploadFileSimple(file, chosenPath, fileHash, encodedBody) {
     return new Promise((resolve) => {
         const fileKey = getFileKey(file);
         activateProgress(fileKey);
@@ -5053,22 +5239,19 @@ function uploadFileSimple(file, chosenPath, fileHash) {
         if (relPath) {
             formData.append('relative_path', relPath);
         }
-<<<<<<< HEAD
         if (fileHash) {
             formData.append('file_hash', fileHash);
             formData.append('hash_algo', HASH_ALGO);
         }
         formData.append('file_size', String(file.size));
-=======
-        if (fileHash) {
-            formData.append('file_hash', fileHash);
-            formData.append('hash_algo', HASH_ALGO);
-        }
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
-        formData.append('file', file, file.name || 'upload.bin');
+        if (encodedBody) {
+            formData.append('content_encoding', 'gzip');
+        }
+        formData.append('file', encodedBody || file, file.name || 'upload.bin');
 
         let lastUpdateTime = Date.now();
         let lastUploadedBytes = 0;
+        let busyRetries = 0;
 
         xhr.upload.addEventListener('progress', (e) => {
             if (e.lengthComputable) {
@@ -5088,6 +5271,15 @@ function uploadFileSimple(file, chosenPath, fileHash) {
         });
 
         xhr.addEventListener('load', () => {
+            if (xhr.status === 503 && busyRetries < BUSY_MAX_RETRIES) {
+                busyRetries += 1;
+                setTimeout(() => {
+                    lastUploadedBytes = 0;
+                    xhr.open('POST', '/upload');
+                    xhr.send(formData);
+                }, getRetryAfterMs(xhr));
+                return;
+            }
             if (xhr.status === 200) {
                 updateFileProgress(fileKey, 100, 0, 'success');
                 resolve({ status: 'success' });
@@ -5113,23 +5305,134 @@ function uploadFileSimple(file, chosenPath, fileHash) {
     });
 }
 
-async function uploadFileChunked(file, chosenPath, fileHash) {
+function uploadBatch(files, chosenPath) {
+    return new Promise((resolve) => {
+        const fileKeys = files.map((file) => getFileKey(file));
+        fileKeys.forEach((fileKey) => activateProgress(fileKey));
+        const markAll = (progress, status) => {
+            fileKeys.forEach((fileKey) => updateFileProgress(fileKey, progress, 0, status));
+        };
+
+        const xhr = new XMLHttpRequest();
+        const formData = new FormData();
+        if (chosenPath) {
+            formData.append('dest_path', chosenPath);
+        }
+        files.forEach((file) => {
+            const relPath = getFileRelativePath(file);
+            if (relPath) {
+                formData.append('relative_path', relPath);
+            }
+            formData.append('file', file, file.name || 'upload.bin');
+        });
+
+        let lastUpdateTime = Date.now();
+        let lastUploadedBytes = 0;
+        let busyRetries = 0;
+        xhr.upload.addEventListener('progress', (e) => {
+            if (!e.lengthComputable) return;
+            const currentTime = Date.now();
+            const timeDiff = (currentTime - lastUpdateTime) / 1000;
+            if (timeDiff >= 0.2 || e.loaded === e.total) {
+                const progress = Math.min(100, Math.round((e.loaded / e.total) * 100));
+                const speed = timeDiff > 0 ? Math.round(((e.loaded - lastUploadedBytes) / 1024) / timeDiff) : 0;
+                fileKeys.forEach((fileKey) => updateFileProgress(fileKey, progress, speed));
+                lastUpdateTime = currentTime;
+                lastUploadedBytes = e.loaded;
+            }
+        });
+
+        xhr.addEventListener('load', () => {
+            if (xhr.status === 503 && busyRetries < BUSY_MAX_RETRIES) {
+                busyRetries += 1;
+                setTimeout(() => {
+                    lastUploadedBytes = 0;
+                    xhr.open('POST', '/upload-batch');
+                    xhr.send(formData);
+                }, getRetryAfterMs(xhr));
+                return;
+            }
+            let data = null;
+            try {
+                data = JSON.parse(xhr.responseText);
+            } catch (error) {
+                data = null;
+            }
+            if (xhr.status !== 200 || !data || data.status !== 'success') {
+                markAll(100, 'error');
+                resolve({ failed: files.length });
+                return;
+            }
+            const failedIndexes = new Set((data.failed || []).map((item) => item.index));
+            fileKeys.forEach((fileKey, index) => {
+                updateFileProgress(fileKey, 100, 0, failedIndexes.has(index) ? 'error' : 'success');
+            });
+            resolve({ failed: failedIndexes.size });
+        });
+        xhr.addEventListener('error', () => {
+            markAll(0, 'error');
+            resolve({ failed: files.length });
+        });
+        xhr.addEventListener('timeout', () => {
+            markAll(0, 'error');
+            resolve({ failed: files.length });
+        });
+
+        xhr.timeout = 0;
+        xhr.open('POST', '/upload-batch');
+        xhr.send(formData);
+    });
+}
+
+function buildUploadQueue(files) {
+    const queue = [];
+    let batch = [];
+    let batchBytes = 0;
+    files.forEach((file) => {
+        if (file.size > BATCH_FILE_MAX) {
+            queue.push({ file });
+            return;
+        }
+        if (batch.length >= BATCH_MAX_FILES || batchBytes + file.size > BATCH_MAX_BYTES) {
+            queue.push({ batch });
+            batch = [];
+            batchBytes = 0;
+        }
+        batch.push(file);
+        batchBytes += file.size;
+    });
+    if (batch.length === 1) {
+        queue.push({ file: batch[0] });
+    } else if (batch.length > 0) {
+        queue.push({ batch });
+    }
+    return queue;
+}
+
+async function uploadFileChunked(file, chosenPath, fileHash, plan) {
     const fileKey = getFileKey(file);
     activateProgress(fileKey);
 
     const uploadId = buildUploadId(file, chosenPath);
-    const totalChunks = Math.ceil(file.size / CHUNK_SIZE);
+    const chunkBytes = plan.chunkSize;
+    const totalChunks = Math.ceil(file.size / chunkBytes);
     const chunkProgress = new Array(totalChunks).fill(0);
     let uploadedBytes = 0;
     const startTime = Date.now();
 
     let completedChunks = new Set();
     const resumeInfo = await getResumeInfo(uploadId, totalChunks, file.size);
-    if (resumeInfo && Array.isArray(resumeInfo.received) && resumeInfo.total_chunks === totalChunks && resumeInfo.total_size === file.size) {
-        completedChunks = new Set(resumeInfo.received);
+    if (resumeInfo && resumeInfo.found && Array.isArray(resumeInfo.missing_ranges) && resumeInfo.total_chunks === totalChunks && resumeInfo.total_size === file.size) {
+        const missing = new Uint8Array(totalChunks);
+        resumeInfo.missing_ranges.forEach(([first, last]) => missing.fill(1, first, last + 1));
+        for (let index = 0; index < totalChunks; index++) {
+            if (!missing[index]) {
+                completedChunks.add(index);
+            }
+        }
         if (completedChunks.size > 0) {
             completedChunks.forEach((index) => {
-                const chunkSize = index === totalChunks - 1 ? (file.size - (totalChunks - 1) * CHUNK_SIZE) : CHUNK_SIZE;
+                const chunkSize = index === totalChunks - 1 ? (file.size - (totalChunks - 1) * chunkBytes) : chunkBytes;
                 chunkProgress[index] = chunkSize;
                 uploadedBytes += chunkSize;
             });
@@ -5159,10 +5462,25 @@ async function uploadFileChunked(file, chosenPath, fileHash) {
         updateFileProgress(fileKey, progress, speed);
     };
 
-    const uploadChunk = (index) => new Promise((resolve, reject) => {
-        const start = index * CHUNK_SIZE;
-        const end = Math.min(file.size, start + CHUNK_SIZE);
+    const compressChunks = await isCompressible(file);
+
+    const uploadChunk = async (index) => {
+        const start = index * chunkBytes;
+        const end = Math.min(file.size, start + chunkBytes);
         const blob = file.slice(start, end);
+        let body = blob;
+        if (compressChunks) {
+            try {
+                body = await gzipBlob(blob);
+            } catch (error) {
+                body = blob;
+            }
+        }
+        return await sendChunk(index, blob, body);
+    };
+
+    const sendChunk = (index, blob, body) => new Promise((resolve, reject) => {
+        const start = index * chunkBytes;
 
         const xhr = new XMLHttpRequest();
         const formData = new FormData();
@@ -5170,7 +5488,7 @@ async function uploadFileChunked(file, chosenPath, fileHash) {
         formData.append('chunk_index', String(index));
         formData.append('total_chunks', String(totalChunks));
         formData.append('total_size', String(file.size));
-        formData.append('chunk_size', String(CHUNK_SIZE));
+        formData.append('chunk_size', String(chunkBytes));
         formData.append('chunk_offset', String(start));
         formData.append('filename', file.name);
         if (chosenPath) {
@@ -5184,11 +5502,16 @@ async function uploadFileChunked(file, chosenPath, fileHash) {
             formData.append('file_hash', fileHash);
             formData.append('hash_algo', HASH_ALGO);
         }
-        formData.append('chunk', blob, file.name);
+        if (body !== blob) {
+            formData.append('content_encoding', 'gzip');
+        }
+        formData.append('chunk', body, file.name);
 
         xhr.upload.addEventListener('progress', (e) => {
             if (e.lengthComputable) {
-                updateOverallProgress(index, e.loaded);
+                // Progress is reported in file bytes, not compressed wire bytes
+                const loaded = body === blob ? e.loaded : Math.round(e.loaded * blob.size / Math.max(body.size, 1));
+                updateOverallProgress(index, Math.min(loaded, blob.size));
             }
         });
 
@@ -5196,6 +5519,11 @@ async function uploadFileChunked(file, chosenPath, fileHash) {
             if (xhr.status === 200) {
                 updateOverallProgress(index, blob.size);
                 resolve();
+            } else if (xhr.status === 503) {
+                updateOverallProgress(index, 0);
+                const busy = new Error('server busy');
+                busy.retryAfterMs = getRetryAfterMs(xhr);
+                reject(busy);
             } else {
                 reject(new Error('chunk upload failed'));
             }
@@ -5211,12 +5539,19 @@ async function uploadFileChunked(file, chosenPath, fileHash) {
         if (completedChunks.has(index)) {
             return;
         }
+        let busyRetries = 0;
         for (let attempt = 0; attempt <= CHUNK_MAX_RETRIES; attempt++) {
             try {
                 await uploadChunk(index);
                 completedChunks.add(index);
                 return;
             } catch (err) {
+                if (err.retryAfterMs && busyRetries < BUSY_MAX_RETRIES) {
+                    busyRetries += 1;
+                    attempt -= 1;
+                    await sleep(err.retryAfterMs);
+                    continue;
+                }
                 if (attempt === CHUNK_MAX_RETRIES) {
                     throw err;
                 }
@@ -5226,7 +5561,7 @@ async function uploadFileChunked(file, chosenPath, fileHash) {
     };
 
     let nextIndex = 0;
-    const workers = Array.from({ length: Math.min(CHUNK_PARALLEL, totalChunks) }, async () => {
+    const workers = Array.from({ length: Math.min(plan.parallel, totalChunks) }, async () => {
         while (true) {
             const current = nextIndex;
             nextIndex += 1;
@@ -5245,16 +5580,31 @@ async function uploadFileChunked(file, chosenPath, fileHash) {
 
 async function uploadFile(file, chosenPath) {
     const fileHash = await computeFileHashIfNeeded(file);
-    if (file.size >= CHUNK_THRESHOLD) {
+    if (fileHash) {
+        const instant = await tryInstantUpload(file, chosenPath, fileHash);
+        if (instant) {
+            return instant;
+        }
+    }
+    const plan = file.size >= PLAN_MIN_SIZE ? await getUploadPlan(file, chosenPath) : null;
+    if (plan && plan.chunked) {
         try {
-            return await uploadFileChunked(file, chosenPath, fileHash);
+            return await uploadFileChunked(file, chosenPath, fileHash, plan);
         } catch (error) {
             console.error(`${file.name} chunk upload failed`, error);
             updateFileProgress(getFileKey(file), 100, 0, 'error');
             return { status: 'error' };
         }
     }
-    return await uploadFileSimple(file, chosenPath, fileHash);
+    let encodedBody = null;
+    if (file.size <= COMPRESS_SIMPLE_MAX && await isCompressible(file)) {
+        try {
+            encodedBody = await gzipBlob(file);
+        } catch (error) {
+            encodedBody = null;
+        }
+    }
+    return await uploadFileSimple(file, chosenPath, fileHash, encodedBody);
 }
 
 uploadBtn.addEventListener('click', async () => {
@@ -5274,20 +5624,27 @@ uploadBtn.addEventListener('click', async () => {
     }
 
     const queueFiles = [...selectedFiles].sort((a, b) => b.size - a.size);
+    const uploadQueue = buildUploadQueue(queueFiles);
     let uploadedFiles = 0;
     let failedFiles = 0;
     const totalFiles = queueFiles.length;
     let queueIndex = 0;
 
-    const fileWorkers = Array.from({ length: Math.min(FILE_PARALLEL, totalFiles) }, async () => {
+    const fileWorkers = Array.from({ length: Math.min(FILE_PARALLEL, uploadQueue.length) }, async () => {
         while (true) {
             const currentIndex = queueIndex;
             queueIndex += 1;
-            if (currentIndex >= totalFiles) {
+            if (currentIndex >= uploadQueue.length) {
                 break;
             }
-            const file = queueFiles[currentIndex];
-            const result = await uploadFile(file, chosenPath);
+            const item = uploadQueue[currentIndex];
+            if (item.batch) {
+                const result = await uploadBatch(item.batch, chosenPath);
+                uploadedFiles += item.batch.length;
+                failedFiles += result.failed;
+                continue;
+            }
+            const result = await uploadFile(item.file, chosenPath);
             uploadedFiles += 1;
             if (!result || result.status !== 'success') {
                 failedFiles += 1;
@@ -5355,6 +5712,10 @@ const textInput = document.getElementById('text-input');
             let currentPath = '/home/deck'; // Set default path to /home/deck
             let selectedFileManagerFiles = [];
             let editingFile = null;
+            // Content and version the open file was read at (for delta saves)
+            let editingBase = null;
+            // Lines shown when a file is too large to open whole
+            const FILE_TAIL_LINES = 2000;
             let contextMenuPath = '';
             let showHiddenFiles = false;
             let fileSortMode = 'name-asc';
@@ -5370,15 +5731,7 @@ const textInput = document.getElementById('text-input');
             const refreshBtn = document.getElementById('refresh-btn');
             const pasteBtn = document.getElementById('paste-btn');
             const newFileBtn = document.getElementById('new-file-btn');
-<<<<<<< HEAD
-            const newDirBtn = document.getElementById('new-dir-btn');
-=======
-<<<<<<< HEAD
             const newDirBtn = document.getElementById('new-dir-btn');
-=======
-            const newDirBtn = document.getElementById('new-dir-btn');
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             const newBtn = document.getElementById('new-btn');
             const deleteBtn = document.getElementById('delete-btn');
             const sdcardBtn = document.getElementById('sdcard-btn');
@@ -5419,6 +5772,8 @@ const textInput = document.getElementById('text-input');
             const fileOpProgressText = document.getElementById('fileop-progress-text');
             let fileOpTimer = null;
             let fileOpProgressValue = 0;
+            const fileOpClose = document.getElementById('fileop-close');
+            let activeFileJobId = null;
 
             if (sdcardBtn) {
                 sdcardBtn.addEventListener('click', () => {
@@ -6151,18 +6506,100 @@ const textInput = document.getElementById('text-input');
                     fileOpModal.style.display = 'none';
                 }, 500);
             }
+
+            // Follow a background file job (copy / move / delete) until it ends,
+            // showing its real progress; the × button cancels it.
+            async function waitForFileJob(job) {
+                activeFileJobId = job.id;
+                if (fileOpTimer) {
+                    clearInterval(fileOpTimer);
+                    fileOpTimer = null;
+                }
+                if (fileOpClose) {
+                    fileOpClose.style.visibility = 'visible';
+                }
+                try {
+                    while (!['done', 'failed', 'cancelled'].includes(job.state)) {
+                        updateFileOpProgress(job);
+                        await new Promise(resolve => setTimeout(resolve, 400));
+                        const response = await fetch('/api/jobs/status?id=' + encodeURIComponent(job.id));
+                        const data = await response.json();
+                        if (data.status !== 'success') {
+                            throw new Error(data.message);
+                        }
+                        job = data.job;
+                    }
+                    return job;
+                } finally {
+                    activeFileJobId = null;
+                    if (fileOpClose) {
+                        fileOpClose.style.visibility = 'hidden';
+                    }
+                }
+            }
+
+            function updateFileOpProgress(job) {
+                let percent = 0;
+                if (job.bytes_total > 0) {
+                    percent = Math.floor(job.bytes_done * 100 / job.bytes_total);
+                } else if (job.files_total > 0) {
+                    percent = Math.floor(job.files_done * 100 / job.files_total);
+                }
+                if (fileOpProgressFill) {
+                    fileOpProgressFill.style.width = `${percent}%`;
+                }
+                if (fileOpProgressText) {
+                    fileOpProgressText.textContent = job.speed > 0 ? `${percent}% · ${formatSize(job.speed)}/s` : `${percent}%`;
+                }
+            }
+
+            // Submit a copy / move / delete request; resolves to {ok, message} once the job has ended
+            async function runFileOperation(endpoint, body) {
+                const response = await fetch(endpoint, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify(body)
+                });
+                const data = await response.json();
+                if (data.status !== 'accepted') {
+                    return { ok: data.status === 'success', message: data.message };
+                }
+                const job = await waitForFileJob(data.job);
+                return { ok: job.state === 'done', message: job.error || job.state };
+            }
+
+            if (fileOpClose) {
+                fileOpClose.addEventListener('click', async () => {
+                    if (!activeFileJobId) return;
+                    await fetch('/api/jobs/cancel', {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json'
+                        },
+                        body: JSON.stringify({ id: activeFileJobId })
+                    });
+                });
+            }
             
-            function showFileEditor(title, content, filePath) {
+            function showFileEditor(title, content, filePath, readOnly = false, version = null) {
                 editorTitle.textContent = title;
                 fileContent.value = content;
-                editingFile = filePath;
+                fileContent.readOnly = readOnly;
+                saveFileBtn.disabled = readOnly;
+                editingFile = readOnly ? null : filePath;
+                editingBase = readOnly || !version ? null : { content, version };
                 fileEditorModal.style.display = 'block';
                 fileContent.focus();
             }
             
             function hideFileEditor() {
                 fileEditorModal.style.display = 'none';
+                fileContent.readOnly = false;
+                saveFileBtn.disabled = false;
                 editingFile = null;
+                editingBase = null;
             }
             
             // Event Listeners for Modals
@@ -6601,8 +7038,11 @@ const textInput = document.getElementById('text-input');
                     });
                     
                     const data = await response.json();
-                    if (data.status === 'success') {
-                        showFileEditor(t('modal.editorTitleWithName', { name: filePath.split('/').pop() || '' }), data.content, filePath);
+                    if (response.status === 413) {
+                        // Too large to edit: show the end of the file instead
+                        await openFileTail(filePath);
+                    } else if (data.status === 'success') {
+                        showFileEditor(t('modal.editorTitleWithName', { name: filePath.split('/').pop() || '' }), data.content, filePath, false, data.version);
                     } else {
                         alert('打开文件失败: ' + data.message);
                     }
@@ -6612,19 +7052,71 @@ const textInput = document.getElementById('text-input');
                 }
             }
             
+            // Open the last lines of a large file (read-only)
+            async function openFileTail(filePath) {
+                const response = await fetch('/api/files/read', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({ path: filePath, tail: FILE_TAIL_LINES })
+                });
+            
+                const data = await response.json();
+                if (data.status === 'success') {
+                    const name = filePath.split('/').pop() || '';
+                    showFileEditor(t('modal.editorTitleTail', { name, lines: data.lines }), data.content, filePath, true);
+                    fileContent.scrollTop = fileContent.scrollHeight;
+                } else {
+                    alert('打开文件失败: ' + data.message);
+                }
+            }
+            
+            // One edit covering the changed middle of the text, in UTF-8 byte offsets
+            function textEdit(before, after) {
+                const max = Math.min(before.length, after.length);
+                let start = 0;
+                while (start < max && before.charCodeAt(start) === after.charCodeAt(start)) {
+                    start++;
+                }
+                let end = 0;
+                while (end < max - start && before.charCodeAt(before.length - 1 - end) === after.charCodeAt(after.length - 1 - end)) {
+                    end++;
+                }
+                // Never split a surrogate pair (emoji and other astral characters)
+                if (start > 0 && before.charCodeAt(start - 1) >= 0xD800 && before.charCodeAt(start - 1) <= 0xDBFF) {
+                    start--;
+                }
+                if (end > 0 && before.charCodeAt(before.length - end) >= 0xDC00 && before.charCodeAt(before.length - end) <= 0xDFFF) {
+                    end--;
+                }
+                const encoder = new TextEncoder();
+                return {
+                    offset: encoder.encode(before.slice(0, start)).length,
+                    delete: encoder.encode(before.slice(start, before.length - end)).length,
+                    insert: after.slice(start, after.length - end)
+                };
+            }
+            
             // Save file
             async function saveFile(content, filePath) {
                 try {
+                    // Send only the changed part when the version read is known
+                    const body = editingBase && editingFile === filePath
+                        ? { path: filePath, base: editingBase.version, edits: [textEdit(editingBase.content, content)] }
+                        : { path: filePath, content };
                     const response = await fetch('/api/files/write', {
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json'
                         },
-                        body: JSON.stringify({ path: filePath, content })
+                        body: JSON.stringify(body)
                     });
-                    
+            
                     const data = await response.json();
-                    if (data.status === 'success') {
+                    if (response.status === 409) {
+                        alert('保存文件失败: 文件已被其他程序修改，请重新打开后再编辑');
+                    } else if (data.status === 'success') {
                         alert('文件保存成功');
                         hideFileEditor();
                         await renderFileList(currentPath);
@@ -6704,23 +7196,18 @@ const textInput = document.getElementById('text-input');
                         return;
                     }
                     
-                    const response = await fetch('/api/files/delete', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify({ path })
-                    });
-                    
-                    const data = await response.json();
-                    if (data.status === 'success') {
-                        await renderFileList(currentPath);
+                    showFileOpProgress(t('modal.fileOpDelete'), path.split('/').pop());
+                    const result = await runFileOperation('/api/files/delete', { path });
+                    finishFileOpProgress(result.ok);
+                    await renderFileList(currentPath);
+                    if (result.ok) {
                         alert('删除成功');
                     } else {
-                        alert('删除失败: ' + data.message);
+                        alert('删除失败: ' + result.message);
                     }
                 } catch (error) {
                     console.error('删除出错:', error);
+                    finishFileOpProgress(false);
                     alert('删除出错: ' + error.message);
                 }
             }
@@ -6786,16 +7273,9 @@ const textInput = document.getElementById('text-input');
                         const filename = sourcePath.split('/').pop();
                         const targetPath = destPath + '/' + filename;
                         showFileOpProgress(opTitle, filename);
-                        const response = await fetch(endpoint, {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json'
-                            },
-                            body: JSON.stringify({ source: sourcePath, destination: targetPath })
-                        });
-                        const data = await response.json();
-                        finishFileOpProgress(data.status === 'success');
-                        if (data.status !== 'success') {
+                        const result = await runFileOperation(endpoint, { source: sourcePath, destination: targetPath });
+                        finishFileOpProgress(result.ok);
+                        if (!result.ok) {
                             failedItems.push(filename);
                             failedPaths.push(sourcePath);
                         }
@@ -6903,6 +7383,52 @@ async def handle_upload_options(request, plugin):
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+async def handle_upload_plan(request, plugin):
+    """Recommend chunk size, parallel streams and chunking threshold
+
+    Body: {"dest_path": "...", "file_size": 0, "upload_id": "..."}
+    The plan is derived from the destination filesystem's measured write rate
+    and this client's recent upload throughput. A known upload_id keeps the
+    chunk size of its session so a resumed upload keeps the same chunk layout.
+    """
+    try:
+        data = await request.json()
+        dest_path = (data.get('dest_path') or '').strip()
+        upload_id = (data.get('upload_id') or '').strip()
+        try:
+            file_size = int(data.get('file_size') or 0)
+        except (TypeError, ValueError):
+            file_size = 0
+        target_dir, error = _resolve_upload_dir(plugin, dest_path)
+        if error is not None:
+            return web.json_response({"status": "error", "message": error}, status=400)
+
+        tuner = _get_upload_tuner(plugin)
+        disk_bps = await tuner.disk_rate(target_dir)
+        stream_bps = tuner.client_rate(request.remote)
+        plan = tuner.plan(disk_bps, stream_bps)
+        chunked = file_size >= plan["threshold"]
+
+        session = _get_upload_session_store(plugin).get(upload_id) if upload_id else None
+        if session is not None and (not file_size or session.total_size == file_size):
+            plan["chunk_size"] = session.chunk_size
+            chunked = True
+
+        return web.json_response({
+            "status": "success",
+            "chunk_size": plan["chunk_size"],
+            "parallel": plan["parallel"],
+            "threshold": plan["threshold"],
+            "chunked": chunked,
+            "disk_bps": int(disk_bps) if disk_bps else None,
+            "stream_bps": int(stream_bps) if stream_bps else None,
+            "encodings": upload_encoding.supported_encodings()
+        })
+    except Exception as e:
+        decky.logger.error(f"Failed to build upload plan: {e}")
+        return web.json_response({"status": "error", "message": str(e)}, status=500)
+
+
 async def handle_language_settings(request, plugin):
     """Return language preference for the web client"""
     try:
@@ -6921,6 +7447,8 @@ async def handle_upload(request, plugin):
         plugin: Plugin instance to access downloads_dir and text_file_path
     """
     sleep_block_acquired = False
+    progress_id = None
+    ticket = None
     try:
         # Parse multipart form data
         reader = await request.multipart()
@@ -6931,6 +7459,7 @@ async def handle_upload(request, plugin):
         expected_hash = None
         expected_algo = None
         expected_size = 0
+        content_encoding = None
 
         while field:
             if field.name == 'dest_path':
@@ -6958,49 +7487,30 @@ async def handle_upload(request, plugin):
                     expected_size = int((await field.text()).strip() or 0)
                 except Exception:
                     expected_size = 0
+            elif field.name == 'content_encoding':
+                try:
+                    content_encoding = (await field.text()).strip()
+                except Exception:
+                    content_encoding = None
             elif field.name == 'file' and field.filename:
                 file_field = field
                 break
             field = await reader.next()
 
         if file_field and file_field.filename:
-            raw_filename = file_field.filename.replace('\x00', '')
-            safe_filename = os.path.basename(raw_filename.replace('\\', '/')).strip()
-            if safe_filename in ("", ".", ".."):
-                safe_filename = f"upload_{int(time.time())}"
-            filename = safe_filename
-            upload_dir = plugin.downloads_dir
-            if dest_path:
-                if "\x00" in dest_path:
-                    return web.json_response({"status": "error", "message": "目录路径包含非法字符"}, status=400)
-                resolved = os.path.realpath(os.path.expanduser(dest_path))
-                if not resolved:
-                    return web.json_response({"status": "error", "message": "无效的目录路径"}, status=400)
-                if os.path.exists(resolved) and not os.path.isdir(resolved):
-                    return web.json_response({"status": "error", "message": "目标路径不是文件夹"}, status=400)
-                try:
-                    os.makedirs(resolved, exist_ok=True)
-                except Exception:
-                    return web.json_response({"status": "error", "message": "无法创建目标目录"}, status=400)
-                upload_dir = resolved
-            rel_path = None
-            if relative_path:
-                cleaned = relative_path.replace('\\', '/').lstrip('/')
-                normalized = os.path.normpath(cleaned)
-                if normalized.startswith("..") or os.path.isabs(normalized):
-                    return web.json_response({"status": "error", "message": "无效的相对路径"}, status=400)
-                rel_dir = os.path.dirname(normalized)
-                rel_base = os.path.basename(normalized)
-                safe_base = os.path.basename(rel_base.replace('\\', '/')).strip()
-                if safe_base in ("", ".", ".."):
-                    safe_base = safe_filename
-                rel_path = os.path.join(rel_dir, safe_base) if rel_dir else safe_base
-
-            file_path = os.path.join(upload_dir, rel_path or filename)
+            # The file body may be compressed (content_encoding field or the
+            # part's Content-Encoding header); it is decoded while streaming.
             try:
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            except Exception:
-                return web.json_response({"status": "error", "message": "无法创建目标目录"}, status=400)
+                decoder = upload_encoding.make_decoder(
+                    content_encoding or file_field.headers.get('Content-Encoding'),
+                    expected_size or None
+                )
+            except upload_encoding.UnsupportedEncodingError as e:
+                return web.json_response({"status": "error", "message": f"不支持的内容编码: {e}"}, status=415)
+            filename, _ = _safe_upload_relative_path(None, file_field.filename)
+            file_path, error_response = _resolve_upload_file_path(plugin, dest_path, relative_path, filename)
+            if error_response is not None:
+                return error_response
             
             # Get content length from header, but note this includes multipart overhead
             # For more accurate progress, we'll track actual bytes written
@@ -7016,6 +7526,9 @@ async def handle_upload(request, plugin):
             
             # If Content-Length is not available, we'll use the actual transferred size
             # and update the size as we receive more data
+            if decoder is not None:
+                # Content-Length counts compressed bytes; progress follows the decoded size
+                estimated_file_size = expected_size
             if estimated_file_size <= 0:
                 decky.logger.info(f"Content-Length not available or invalid, using dynamic sizing for: {filename}")
                 estimated_file_size = 0  # Will be updated dynamically
@@ -7026,74 +7539,63 @@ async def handle_upload(request, plugin):
             # Initialize transfer stats
             transferred = 0
             start_time = time.time()
-            # Emit the first progress update immediately so Decky UI
-            # doesn't stay blank for fast-start uploads.
-            last_emit_time = 0.0
             
-            # Save file and track progress
-            with open(file_path, 'wb', buffering=1024 * 1024) as f:
+            # Save file and track progress. The hasher is fed from the same
+            # buffers that go to disk, in a worker thread, so the file is not
+            # read back afterwards and the server loop is not stalled.
+            if expected_size > 0 and not _has_space_for(file_path, expected_size):
+                decky.logger.warning(f"Not enough space for upload {file_path}: {expected_size} bytes")
+                return web.json_response({"status": "error", "message": "存储空间不足"}, status=507)
+            try:
+                ticket = _get_io_scheduler(plugin).admit(os.path.dirname(file_path), request.remote)
+            except io_scheduler.UploadBusyError as busy:
+                return _upload_busy_response(busy)
+
+            algo_name = _normalize_hash_algo(expected_algo)
+            hasher = hashlib.new(algo_name)
+            # Progress totals grow with the transfer when the size is unknown.
+            progress = _get_progress_bus(plugin)
+            progress_id = progress.begin(filename, estimated_file_size)
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
                 while True:
                     try:
-                        chunk = await file_field.read_chunk(size=1024 * 1024)  # Read 1MB chunk
+                        chunk = await file_field.read_chunk(size=_UPLOAD_STREAM_BUFFER_SIZE)  # Read 1MB chunk
                         if not chunk:  # EOF
                             break
-                        f.write(chunk)
+                        chunk = await _scheduled_write(
+                            ticket, _write_upload_slice, fd, chunk, transferred, (hasher,), decoder
+                        )
                         
-                        # Update transfer stats
+                        # Progress is published by the shared progress bus
                         transferred += len(chunk)
-                        current_time = time.time()
-                        elapsed_time = current_time - start_time
-                        
-                        # Calculate speed in bytes per second
-                        if elapsed_time > 0:
-                            speed = transferred / elapsed_time
-                        else:
-                            speed = 0
-                        
-                        # Emit progress every 500ms to reduce event flood (same as DS)
-                        # This improves performance and reduces frontend load
-                        if current_time - last_emit_time >= 0.5:
-                            # Determine the total size to use for progress calculation
-                            # If we have an estimated size, use it; otherwise, use the current transferred amount
-                            # This ensures the progress bar works even without Content-Length header
-                            total_size = estimated_file_size if estimated_file_size > 0 else transferred
-                            if estimated_file_size <= 0:
-                                # If we don't have an estimated size, use transferred as the base
-                                # but set a reasonable upper bound to show progress
-                                total_size = max(transferred, 1)  # Avoid division by zero
-                            else:
-                                # Use the estimated size, but ensure it's at least the amount transferred
-                                total_size = max(estimated_file_size, transferred)
-                            
-                            eta = 0
-                            if speed > 0 and total_size > transferred and estimated_file_size > 0:
-                                # Only calculate ETA if we have an estimated size
-                                eta = (total_size - transferred) / speed
-                            elif speed > 0 and estimated_file_size <= 0:
-                                # If no estimated size, provide a rough ETA based on current speed
-                                # Assuming remaining data is roughly equal to what's been transferred
-                                eta = transferred / speed
-                            
-                            # Emit transfer status event to frontend
-                            # NOTE: Decky frontend expects arguments wrapped in a list for destructuring
-                            # If passed as positional args, frontend receives the first arg as the array to destructure
-                            await _emit_decky(plugin, 
-                                "transfer_status",
-                                [
-                                    filename,
-                                    total_size,  # Use calculated total size
-                                    transferred,
-                                    speed,
-                                    round(eta)
-                                ]
-                            )
-                            last_emit_time = current_time
+                        progress.update(progress_id, transferred)
                     except Exception as chunk_error:
                         decky.logger.error(f"Error reading chunk: {chunk_error}")
                         raise
+                if decoder is not None:
+                    tail = await _scheduled_write(
+                        ticket, _write_upload_slice, fd, b"", transferred, (hasher,), decoder, True
+                    )
+                    transferred += len(tail)
+                    progress.update(progress_id, transferred)
+                # The client is only told the upload succeeded once it is on disk.
+                await _scheduled_write(ticket, os.fdatasync, fd)
+            except upload_encoding.UploadDecodeError as decode_error:
+                decky.logger.error(f"Compressed upload rejected for {file_path}: {decode_error}")
+                os.close(fd)
+                fd = None
+                try:
+                    os.remove(file_path)
+                except Exception:
+                    pass
+                return web.json_response({"status": "error", "message": "压缩数据无效"}, status=400)
+            finally:
+                if fd is not None:
+                    os.close(fd)
             
-            # Get actual file size after write
-            actual_size = os.path.getsize(file_path)
+            # Size and hash are both known once the stream ends
+            actual_size = transferred
             if expected_size > 0 and actual_size != expected_size:
                 decky.logger.error(
                     f"Simple upload size mismatch: actual={actual_size}, expected={expected_size}, file={file_path}"
@@ -7103,60 +7605,23 @@ async def handle_upload(request, plugin):
                 except Exception:
                     pass
                 return web.json_response({"status": "error", "message": "文件大小校验失败"}, status=400)
-            computed_hash = None
-            algo_name = _normalize_hash_algo(expected_algo)
-            try:
-                computed_hash = await _compute_file_hash_async(file_path, algo_name)
-                if expected_hash and computed_hash.lower() != expected_hash.lower():
-                    try:
-                        os.remove(file_path)
-                    except Exception:
-                        pass
-                    return web.json_response({"status": "error", "message": "文件校验失败"}, status=400)
-            except Exception as hash_error:
-                decky.logger.error(f"Hash compute error: {hash_error}")
-                if expected_hash:
-                    return web.json_response({"status": "error", "message": "文件校验出错"}, status=500)
+            computed_hash = hasher.hexdigest()
+            if expected_hash and computed_hash.lower() != expected_hash.lower():
+                try:
+                    os.remove(file_path)
+                except Exception:
+                    pass
+                return web.json_response({"status": "error", "message": "文件校验失败"}, status=400)
 
             decky.logger.info(f"Upload completed: {filename}, Actual size: {actual_size} bytes")
+            _get_upload_tuner(plugin).record_transfer(request.remote, actual_size, time.time() - start_time)
+            if algo_name == "sha256":
+                _get_hash_store(plugin).remember(file_path, computed_hash)
             
-            # Emit final 100% progress with actual size
-            await _emit_decky(plugin, 
-                "transfer_status",
-                [
-                    filename,
-                    actual_size,
-                    actual_size,
-                    0,
-                    0
-                ]
-            )
-            
-            # Clear the text file after successful file transfer
-            try:
-                with open(plugin.text_file_path, "w") as f:
-                    f.write("")
-                decky.logger.info(f"Cleared text file after file transfer: {plugin.text_file_path}")
-            except Exception as e:
-                decky.logger.error(f"Error clearing text file: {e}")
-            
-            # Emit transfer complete event
-            # NOTE: Wrap in list for frontend destructuring
-            await _emit_decky(plugin, "transfer_complete", [filename])
-            
-            # Send notifications (Decky UI + system) so it works even when UI is closed
-            notification_title = "文件传输完成"
-            notification_msg = f"文件 '{filename}' 已成功上传到 Steam Deck"
-            try:
-                await _emit_decky(plugin, "_show_notification", {
-                    "title": notification_title,
-                    "body": notification_msg,
-                    "duration": 5
-                })
-            except Exception as notify_error:
-                decky.logger.error(f"Failed to emit Decky notification for file upload: {notify_error}")
-            utils.send_system_notification(notification_title, notification_msg, 5)
-            utils.queue_notification(notification_title, notification_msg)
+            # Final progress, text file clearing and notifications (Decky UI +
+            # system) run in the completion pipeline after the response
+            progress.end(progress_id)
+            _get_completion_pipeline(plugin).submit(filename, actual_size)
             
             return web.json_response({"filename": filename, "status": "success", "hash": computed_hash, "hash_algo": algo_name})
         
@@ -7166,6 +7631,10 @@ async def handle_upload(request, plugin):
         decky.logger.error(f"Upload error: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
     finally:
+        if progress_id is not None:
+            _end_transfer_progress(plugin, progress_id)
+        if ticket is not None:
+            ticket.release()
         if sleep_block_acquired:
             _release_transfer_sleep_block()
 
@@ -7173,31 +7642,32 @@ async def handle_upload(request, plugin):
 async def handle_upload_chunk(request, plugin):
     """Handle chunked file upload request"""
     sleep_block_acquired = False
+    ticket = None
+    sessions = lock = upload_id = writer = None
     try:
         reader = await request.multipart()
         field = await reader.next()
-        chunk_data = None
+        chunk_field = None
         expected_hash = None
         expected_algo = None
         fields = {}
 
+        # Metadata fields precede the chunk body, so stop at the chunk field and
+        # stream it to disk instead of buffering the whole chunk in memory.
         while field:
             if field.name == 'chunk' and field.filename:
-                try:
-                    chunk_data = await field.read()
-                except Exception:
-                    chunk_data = b""
+                chunk_field = field
                 # Keep the uploaded filename if explicit metadata is missing.
-                if field.filename and not fields.get('filename'):
+                if not fields.get('filename'):
                     fields['filename'] = field.filename
-            else:
-                try:
-                    fields[field.name] = (await field.text()).strip()
-                except Exception:
-                    fields[field.name] = ''
+                break
+            try:
+                fields[field.name] = (await field.text()).strip()
+            except Exception:
+                fields[field.name] = ''
             field = await reader.next()
 
-        if chunk_data is None:
+        if chunk_field is None:
             return web.json_response({"status": "error", "message": "No chunk provided"}, status=400)
 
         upload_id = fields.get('upload_id') or fields.get('uploadId') or f"upload_{int(time.time())}"
@@ -7242,204 +7712,232 @@ async def handle_upload_chunk(request, plugin):
         expected_hash = fields.get('file_hash') or None
         expected_algo = fields.get('hash_algo') or None
         relative_path = fields.get('relative_path') or None
-        filename_field = fields.get('filename') or ''
-        raw_filename = filename_field.replace('\x00', '')
-        safe_filename = os.path.basename(raw_filename.replace('\\', '/')).strip()
-        if safe_filename in ("", ".", ".."):
-            safe_filename = f"upload_{int(time.time())}"
-        filename = safe_filename
-
-        upload_dir = plugin.downloads_dir
-        if dest_path:
-            if "\x00" in dest_path:
-                return web.json_response({"status": "error", "message": "目录路径包含非法字符"}, status=400)
-            resolved = os.path.realpath(os.path.expanduser(dest_path))
-            if not resolved:
-                return web.json_response({"status": "error", "message": "无效的目录路径"}, status=400)
-            if os.path.exists(resolved) and not os.path.isdir(resolved):
-                return web.json_response({"status": "error", "message": "目标路径不是文件夹"}, status=400)
-            try:
-                os.makedirs(resolved, exist_ok=True)
-            except Exception:
-                return web.json_response({"status": "error", "message": "无法创建目标目录"}, status=400)
-            upload_dir = resolved
-
-        rel_path = None
-        if relative_path:
-            cleaned = relative_path.replace('\\', '/').lstrip('/')
-            normalized = os.path.normpath(cleaned)
-            if normalized.startswith("..") or os.path.isabs(normalized):
-                return web.json_response({"status": "error", "message": "无效的相对路径"}, status=400)
-            rel_dir = os.path.dirname(normalized)
-            rel_base = os.path.basename(normalized)
-            safe_base = os.path.basename(rel_base.replace('\\', '/')).strip()
-            if safe_base in ("", ".", ".."):
-                safe_base = safe_filename
-            rel_path = os.path.join(rel_dir, safe_base) if rel_dir else safe_base
-
-        file_path = os.path.join(upload_dir, rel_path or filename)
+        filename, _ = _safe_upload_relative_path(None, fields.get('filename'))
+        file_path, error_response = _resolve_upload_file_path(plugin, dest_path, relative_path, filename)
+        if error_response is not None:
+            return error_response
+
+        # Admission comes before any session state is created, so a client
+        # told to back off simply retries the same chunk later.
         try:
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        except Exception:
-            return web.json_response({"status": "error", "message": "无法创建目标目录"}, status=400)
+            ticket = _get_io_scheduler(plugin).admit(os.path.dirname(file_path), request.remote)
+        except io_scheduler.UploadBusyError as busy:
+            return _upload_busy_response(busy)
 
         temp_path = file_path + ".part"
-        sessions, lock = _get_upload_session_store(plugin)
+        sessions = _get_upload_session_store(plugin)
+        lock = sessions.lock(upload_id)
         now = time.time()
 
         async with lock:
-            stale_keys = [key for key, sess in sessions.items() if now - sess.get("last_update", now) > 7200]
-            for key in stale_keys:
-                sessions.pop(key, None)
-
             session = sessions.get(upload_id)
             if session:
                 meta_mismatch = (
-                    session.get("file_path") != file_path
-                    or int(session.get("total_chunks") or 0) != total_chunks
-                    or (total_size > 0 and int(session.get("total_size") or 0) not in (0, total_size))
+                    session.file_path != file_path
+                    or session.total_chunks != total_chunks
+                    or (total_size > 0 and session.total_size not in (0, total_size))
                 )
                 if meta_mismatch:
                     decky.logger.warning(f"Upload session metadata mismatch, resetting session: {upload_id}")
-                    sessions.pop(upload_id, None)
+                    _drop_upload_session(plugin, sessions, upload_id)
                     session = None
             if not session:
-                session = {
-                    "file_path": file_path,
-                    "expected_hash": expected_hash,
-                    "hash_algo": _normalize_hash_algo(expected_algo),
-                    "temp_path": temp_path,
-                    "total_chunks": total_chunks,
-                    "total_size": total_size,
-                    "chunk_size": chunk_size,
-                    "received": set(),
-                    "received_bytes": 0,
-                    "start_time": now,
-                    "last_emit": 0.0,
-                    "last_update": now,
-                    "filename": filename
-                }
-                sessions[upload_id] = session
+                finished = sessions.finished(upload_id, file_path)
+                if finished is not None:
+                    # A chunk retried after the upload completed: answer as the
+                    # finalizing request did instead of starting a new upload.
+                    return web.json_response(finished)
+                session = _new_upload_session(
+                    file_path, temp_path, filename, expected_hash, expected_algo,
+                    total_chunks, total_size, chunk_size, now
+                )
+                sessions.add(upload_id, session)
             else:
-                session["last_update"] = now
-                session["chunk_size"] = chunk_size
-                if expected_hash and not session.get("expected_hash"):
-                    session["expected_hash"] = expected_hash
-                if expected_algo and not session.get("hash_algo"):
-                    session["hash_algo"] = _normalize_hash_algo(expected_algo)
+                session.last_update = now
+                session.chunk_size = chunk_size
+                if expected_hash and not session.expected_hash:
+                    session.expected_hash = expected_hash
+                if expected_algo and not session.hash_algo:
+                    session.hash_algo = _normalize_hash_algo(expected_algo)
+            # The temp file descriptor stays open until every writer has left;
+            # a session that is finalizing or closed takes no more chunks.
+            if not session.acquire_writer():
+                return web.json_response({"status": "error", "message": "上传正在完成，请稍后重试"}, status=409)
+            writer = session
 
         sleep_block_acquired = _acquire_transfer_sleep_block(plugin)
         try:
-            if not os.path.exists(temp_path):
-                with open(temp_path, 'wb') as f:
-                    if total_size > 0:
-                        f.truncate(total_size)
-            elif total_size > 0:
-                current_size = os.path.getsize(temp_path)
-                if current_size != total_size:
+            try:
+                current_size = os.stat(temp_path).st_size
+            except FileNotFoundError:
+                current_size = None
+            if current_size is None or (total_size > 0 and current_size != total_size):
+                if current_size is not None:
                     decky.logger.warning(
                         f"Temp file size mismatch, resetting temp: {temp_path}, current={current_size}, expected={total_size}"
                     )
-                    with open(temp_path, 'r+b') as f:
-                        f.truncate(total_size)
+                await asyncio.to_thread(_prepare_upload_temp, temp_path, total_size)
+        except OSError as temp_error:
+            if temp_error.errno != errno.ENOSPC:
+                decky.logger.error(f"Temp file prepare error: {temp_error}")
+                return web.json_response({"status": "error", "message": "无法准备分块临时文件"}, status=500)
+            decky.logger.warning(f"Not enough space for chunked upload {upload_id}: {total_size} bytes at {temp_path}")
+            if current_size is None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                async with lock:
+                    _drop_upload_session(plugin, sessions, upload_id)
+            return web.json_response({"status": "error", "message": "存储空间不足"}, status=507)
         except Exception as temp_error:
             decky.logger.error(f"Temp file prepare error: {temp_error}")
             return web.json_response({"status": "error", "message": "无法准备分块临时文件"}, status=500)
 
-        if not chunk_data:
-            return web.json_response({"status": "error", "message": "空分块数据"}, status=400)
+        expected_chunk_len = chunk_size
         if total_size > 0:
             remaining = max(total_size - chunk_offset, 0)
             expected_chunk_len = min(chunk_size, remaining)
             if expected_chunk_len <= 0:
                 return web.json_response({"status": "error", "message": "无效分块范围"}, status=400)
-            if len(chunk_data) != expected_chunk_len:
-                return web.json_response(
-                    {"status": "error", "message": f"分块大小不匹配: {len(chunk_data)} != {expected_chunk_len}"},
-                    status=400
-                )
 
+        # Stream the chunk body slice by slice, validating the length as bytes
+        # arrive so an oversized chunk is rejected before it touches its neighbour.
+        # The head-of-prefix chunk feeds the rolling file hash as it streams; an
+        # optional chunk_hash field is verified per chunk on the same pass.
+        # A chunk may be compressed on the wire; its decoded length must still
+        # match the chunk's slot in the file.
         try:
-            if hasattr(os, "pwrite"):
-                fd = os.open(temp_path, os.O_RDWR | os.O_CREAT)
-                try:
-                    os.pwrite(fd, chunk_data, chunk_offset)
-                finally:
-                    os.close(fd)
-            else:
-                with open(temp_path, 'r+b') as f:
-                    f.seek(chunk_offset)
-                    f.write(chunk_data)
-        except Exception as write_error:
-            decky.logger.error(f"Chunk write error: {write_error}")
-            return web.json_response({"status": "error", "message": "写入失败"}, status=500)
+            decoder = upload_encoding.make_decoder(
+                fields.get('content_encoding') or chunk_field.headers.get('Content-Encoding'),
+                expected_chunk_len
+            )
+        except upload_encoding.UnsupportedEncodingError as e:
+            return web.json_response({"status": "error", "message": f"不支持的内容编码: {e}"}, status=415)
+
+        # Bytes count towards progress as they are written; a rejected or
+        # duplicate chunk takes its bytes back.
+        progress = _get_progress_bus(plugin)
+        if upload_id not in progress:
+            progress.begin(
+                session.filename, session.total_size or total_size,
+                transfer_id=upload_id, transferred=session.received_bytes
+            )
+
+        rolling = session.rolling_hash
+        live_hasher = rolling.claim_live(chunk_index)
+        reserved = 0
+        buffer = None
+        if live_hasher is None and rolling.reserve(chunk_index, expected_chunk_len):
+            reserved = expected_chunk_len
+            buffer = bytearray()
+        expected_chunk_hash = fields.get('chunk_hash') or None
+        chunk_hasher = hashlib.new(rolling.algo) if expected_chunk_hash else None
+        hashers = [h for h in (live_hasher, chunk_hasher) if h is not None]
+        chunk_len = 0
+        accepted = False
+        stream_start = time.monotonic()
+        try:
+            try:
+                fd = session.open_fd()
+                while True:
+                    data = await chunk_field.read_chunk(size=_UPLOAD_STREAM_BUFFER_SIZE)
+                    if not data:
+                        break
+                    if decoder is None and chunk_len + len(data) > expected_chunk_len:
+                        return web.json_response(
+                            {"status": "error", "message": f"分块大小不匹配: > {expected_chunk_len}"},
+                            status=400
+                        )
+                    data = await _scheduled_write(
+                        ticket, _write_upload_slice, fd, data, chunk_offset + chunk_len, hashers, decoder
+                    )
+                    if buffer is not None:
+                        buffer += data
+                    chunk_len += len(data)
+                    progress.add(upload_id, len(data))
+                if decoder is not None:
+                    data = await _scheduled_write(
+                        ticket, _write_upload_slice, fd, b"", chunk_offset + chunk_len, hashers, decoder, True
+                    )
+                    if buffer is not None:
+                        buffer += data
+                    chunk_len += len(data)
+                    progress.add(upload_id, len(data))
+            except upload_encoding.UploadDecodeError as decode_error:
+                decky.logger.error(f"Compressed chunk rejected for upload_id={upload_id}: {decode_error}")
+                return web.json_response({"status": "error", "message": "压缩数据无效"}, status=400)
+            except Exception as write_error:
+                if session.closed:
+                    # Reset before the chunk opened the temp file
+                    return web.json_response({"status": "error", "message": "上传会话已失效，请重试"}, status=409)
+                decky.logger.error(f"Chunk write error: {write_error}")
+                return web.json_response({"status": "error", "message": "写入失败"}, status=500)
+
+            if chunk_len == 0:
+                return web.json_response({"status": "error", "message": "空分块数据"}, status=400)
+            if total_size > 0 and chunk_len != expected_chunk_len:
+                return web.json_response(
+                    {"status": "error", "message": f"分块大小不匹配: {chunk_len} != {expected_chunk_len}"},
+                    status=400
+                )
+            if chunk_hasher is not None and chunk_hasher.hexdigest().lower() != expected_chunk_hash.lower():
+                return web.json_response({"status": "error", "message": "分块校验失败"}, status=400)
+            accepted = True
+            _get_upload_tuner(plugin).record_transfer(request.remote, chunk_len, time.monotonic() - stream_start)
+        finally:
+            rolling.settle(chunk_index, accepted, chunk_len, live_hasher, buffer, reserved)
+            if not accepted:
+                progress.add(upload_id, -chunk_len)
 
         complete = False
         async with lock:
-            progress_now = time.time()
-            session = sessions.get(upload_id)
-            if session is None:
-                session = sessions.setdefault(upload_id, {
-                    "file_path": file_path,
-                    "expected_hash": expected_hash,
-                    "hash_algo": _normalize_hash_algo(expected_algo),
-                    "temp_path": temp_path,
-                    "total_chunks": total_chunks,
-                    "total_size": total_size,
-                    "chunk_size": chunk_size,
-                    "received": set(),
-                    "received_bytes": 0,
-                    "start_time": progress_now,
-                    "last_emit": 0.0,
-                    "last_update": progress_now,
-                    "filename": filename
-                })
-            session["last_update"] = progress_now
-            if chunk_index not in session["received"]:
-                session["received"].add(chunk_index)
-                session["received_bytes"] += len(chunk_data)
-
-            received_bytes = session["received_bytes"]
-            total_for_progress = session["total_size"] or total_size or received_bytes
-            elapsed = max(progress_now - session["start_time"], 0.001)
-            if session.get("last_emit", 0.0) <= 0.0 or progress_now - session["last_emit"] >= 0.5:
-                speed = received_bytes / elapsed
-                eta = 0
-                if speed > 0 and total_for_progress > received_bytes:
-                    eta = int((total_for_progress - received_bytes) / speed)
-                await _emit_decky(plugin, 
-                    "transfer_status",
-                    [
-                        session["filename"],
-                        total_for_progress,
-                        received_bytes,
-                        speed,
-                        eta
-                    ]
-                )
-                session["last_emit"] = progress_now
+            if sessions.get(upload_id) is not session:
+                # Reset or expired while the chunk was streaming; its bytes went
+                # to a temp file that no longer belongs to a live session.
+                return web.json_response({"status": "error", "message": "上传会话已失效，请重试"}, status=409)
+            session.last_update = time.time()
+            if session.mark_received(chunk_index, chunk_len):
+                _get_upload_journal(plugin).record(upload_id, session.to_journal_entry)
+            else:
+                progress.add(upload_id, -chunk_len)
 
-            complete = len(session["received"]) >= session["total_chunks"]
+            # Only one request finalizes, even if the last chunk is retried.
+            complete = session.is_complete() and not session.finalizing
+            if complete:
+                session.finalizing = True
+
+        if not complete:
+            session.rolling_hash.schedule_drain(session)
 
         if complete:
-            hash_algo = session.get("hash_algo") or "sha256"
-            expected = session.get("expected_hash")
+            # Duplicate chunks still streaming finish before the file is hashed
+            # and renamed; later ones are refused.
+            await session.wait_for_writers()
+            hash_algo = session.hash_algo or "sha256"
+            expected = session.expected_hash
             computed_hash = None
             try:
-                computed_hash = await _compute_file_hash_async(temp_path, hash_algo)
+                try:
+                    finalize_fd = session.open_fd()
+                    computed_hash = await session.rolling_hash.finish(session, total_size)
+                    # The client is only told the upload succeeded once it is on disk.
+                    await _scheduled_write(ticket, os.fdatasync, finalize_fd)
+                finally:
+                    session.close_fd()
                 if expected and computed_hash.lower() != expected.lower():
                     try:
                         os.remove(temp_path)
                     except Exception:
                         pass
                     async with lock:
-                        sessions.pop(upload_id, None)
+                        _drop_upload_session(plugin, sessions, upload_id)
                     return web.json_response({"status": "error", "message": "文件校验失败"}, status=400)
             except Exception as hash_error:
                 decky.logger.error(f"Hash compute error: {hash_error}")
                 if expected:
                     async with lock:
-                        sessions.pop(upload_id, None)
+                        _drop_upload_session(plugin, sessions, upload_id)
                     return web.json_response({"status": "error", "message": "文件校验出错"}, status=500)
 
             try:
@@ -7447,6 +7945,7 @@ async def handle_upload_chunk(request, plugin):
             except Exception:
                 if os.path.exists(temp_path):
                     os.replace(temp_path, file_path)
+            await asyncio.to_thread(utils.fsync_dir, os.path.dirname(file_path))
 
             actual_size = os.path.getsize(file_path)
             if total_size > 0 and actual_size != total_size:
@@ -7458,35 +7957,19 @@ async def handle_upload_chunk(request, plugin):
                 except Exception:
                     pass
                 async with lock:
-                    sessions.pop(upload_id, None)
+                    _drop_upload_session(plugin, sessions, upload_id)
                 return web.json_response({"status": "error", "message": "文件大小校验失败"}, status=400)
-            await _emit_decky(plugin, "transfer_status", [filename, actual_size, actual_size, 0, 0])
-            await _emit_decky(plugin, "transfer_complete", [filename])
-
-            try:
-                with open(plugin.text_file_path, "w") as f:
-                    f.write("")
-                decky.logger.info(f"Cleared text file after file transfer: {plugin.text_file_path}")
-            except Exception as e:
-                decky.logger.error(f"Error clearing text file: {e}")
-
-            notification_title = "文件传输完成"
-            notification_msg = f"文件 '{filename}' 已成功上传到 Steam Deck"
-            try:
-                await _emit_decky(plugin, "_show_notification", {
-                    "title": notification_title,
-                    "body": notification_msg,
-                    "duration": 5
-                })
-            except Exception as notify_error:
-                decky.logger.error(f"Failed to emit Decky notification for file upload: {notify_error}")
-            utils.send_system_notification(notification_title, notification_msg, 5)
-            utils.queue_notification(notification_title, notification_msg)
+            if computed_hash and session.rolling_hash.algo == "sha256":
+                _get_hash_store(plugin).remember(file_path, computed_hash)
+            progress.end(upload_id)
+            _get_completion_pipeline(plugin).submit(filename, actual_size)
 
+            result = {"status": "success", "complete": True, "filename": filename, "hash": computed_hash, "hash_algo": hash_algo}
             async with lock:
-                sessions.pop(upload_id, None)
+                _drop_upload_session(plugin, sessions, upload_id)
+                sessions.finish(upload_id, file_path, result)
 
-            return web.json_response({"status": "success", "complete": True, "filename": filename, "hash": computed_hash, "hash_algo": hash_algo})
+            return web.json_response(result)
 
         return web.json_response({"status": "success", "complete": False})
 
@@ -7494,45 +7977,335 @@ async def handle_upload_chunk(request, plugin):
         decky.logger.error(f"Chunk upload error: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
     finally:
+        if ticket is not None:
+            ticket.release()
+        if writer is not None:
+            writer.release_writer()
+        if lock is not None:
+            sessions.release(upload_id)
         if sleep_block_acquired:
             _release_transfer_sleep_block()
 
 
 
 async def handle_upload_status(request, plugin):
-    """Return received chunk info for resume"""
+    """Return received chunk info for resume
+
+    Body: {"upload_id": "...", "format": "list" | "ranges"}
+    The "ranges" format replaces the per-chunk "received" list with inclusive
+    [first, last] runs ("received_ranges", "missing_ranges"), so the response
+    stays small however many chunks the file has.
+    """
     try:
         data = await request.json()
         upload_id = (data.get('upload_id') or '').strip()
         if not upload_id:
             return web.json_response({"status": "error", "message": "Missing upload_id"}, status=400)
-        sessions, lock = _get_upload_session_store(plugin)
-        async with lock:
+        use_ranges = (data.get('format') or 'list') == 'ranges'
+        sessions = _get_upload_session_store(plugin)
+        async with sessions.locked(upload_id):
             session = sessions.get(upload_id)
             if not session:
-                return web.json_response({
+                response = {
                     "status": "success",
                     "found": False,
-                    "received": [],
                     "total_chunks": int(data.get('total_chunks') or 0),
                     "total_size": int(data.get('total_size') or 0),
                     "received_bytes": 0
-                })
-            received = list(session.get('received', set()))
-            received.sort()
-            return web.json_response({
+                }
+                if use_ranges:
+                    response["received_ranges"] = []
+                    response["missing_ranges"] = []
+                else:
+                    response["received"] = []
+                return web.json_response(response)
+            response = {
                 "status": "success",
                 "found": True,
-                "received": received,
-                "total_chunks": session.get('total_chunks', 0),
-                "total_size": session.get('total_size', 0),
-                "received_bytes": session.get('received_bytes', 0)
-            })
+                "total_chunks": session.total_chunks,
+                "total_size": session.total_size,
+                "received_bytes": session.received_bytes,
+                "missing_ranges": session.missing_ranges()
+            }
+            if use_ranges:
+                response["received_ranges"] = session.received_ranges()
+            else:
+                response["received"] = session.received_indexes()
+            return web.json_response(response)
     except Exception as e:
         decky.logger.error(f"Upload status error: {e}")
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+def _resolve_upload_dir(plugin, dest_path):
+    """Resolve an upload destination directory (the default one if dest_path is empty).
+
+    Returns:
+        tuple: (directory, None) on success, (None, error message) otherwise
+    """
+    if not dest_path:
+        return plugin.downloads_dir, None
+    if "\x00" in dest_path:
+        return None, "目录路径包含非法字符"
+    resolved = os.path.realpath(os.path.expanduser(dest_path))
+    if not resolved:
+        return None, "无效的目录路径"
+    if os.path.exists(resolved) and not os.path.isdir(resolved):
+        return None, "目标路径不是文件夹"
+    return resolved, None
+
+
+def _safe_upload_relative_path(relative_path, filename):
+    """Sanitize an uploaded file's name and optional relative path.
+
+    Returns:
+        tuple: (relative file path, None) on success, (None, error message) otherwise
+    """
+    raw_filename = (filename or '').replace('\x00', '')
+    safe_filename = os.path.basename(raw_filename.replace('\\', '/')).strip()
+    if safe_filename in ("", ".", ".."):
+        safe_filename = f"upload_{int(time.time())}"
+    if not relative_path:
+        return safe_filename, None
+    cleaned = relative_path.replace('\x00', '').replace('\\', '/').lstrip('/')
+    normalized = os.path.normpath(cleaned)
+    if normalized.startswith("..") or os.path.isabs(normalized):
+        return None, "无效的相对路径"
+    rel_dir = os.path.dirname(normalized)
+    safe_base = os.path.basename(normalized).strip()
+    if safe_base in ("", ".", ".."):
+        safe_base = safe_filename
+    return (os.path.join(rel_dir, safe_base) if rel_dir else safe_base), None
+
+
+def _resolve_upload_file_path(plugin, dest_path, relative_path, filename):
+    """Resolve where an upload named ``filename`` lands, creating its directory.
+
+    Returns:
+        tuple: (file_path, None) on success, (None, error_response) otherwise
+    """
+    upload_dir, error = _resolve_upload_dir(plugin, dest_path)
+    if error is None:
+        rel_path, error = _safe_upload_relative_path(relative_path, filename)
+    if error is not None:
+        return None, web.json_response({"status": "error", "message": error}, status=400)
+
+    file_path = os.path.join(upload_dir, rel_path)
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    except Exception:
+        return None, web.json_response({"status": "error", "message": "无法创建目标目录"}, status=400)
+    return file_path, None
+
+
+async def handle_upload_instant(request, plugin):
+    """Satisfy an upload from a file the Deck already has, without transferring it
+
+    Body: {"file_hash": "...", "hash_algo": "SHA-256", "size": 0, "filename": "...",
+           "dest_path": "...", "relative_path": "...", "allow_hardlink": false}
+    On a hash store hit the file is created by reflink, hardlink (only with
+    allow_hardlink, since both names then share one inode) or a local copy.
+    A miss returns {"hit": false} and the client uploads normally.
+    """
+    try:
+        data = await request.json()
+        file_hash = (data.get('file_hash') or '').strip().lower()
+        if not file_hash:
+            return web.json_response({"status": "error", "message": "Missing file_hash"}, status=400)
+        if _normalize_hash_algo(data.get('hash_algo')) != "sha256":
+            return web.json_response({"status": "success", "hit": False})
+        try:
+            size = int(data.get('size') or 0)
+        except (TypeError, ValueError):
+            return web.json_response({"status": "error", "message": "无效的文件大小"}, status=400)
+
+        store = _get_hash_store(plugin)
+        source_path = store.lookup(file_hash, size)
+        if source_path is None:
+            return web.json_response({"status": "success", "hit": False})
+
+        file_path, error_response = _resolve_upload_file_path(
+            plugin,
+            (data.get('dest_path') or '').strip() or None,
+            (data.get('relative_path') or '').strip() or None,
+            data.get('filename') or os.path.basename(source_path),
+        )
+        if error_response is not None:
+            return error_response
+        filename = os.path.basename(file_path)
+
+        if os.path.abspath(file_path) == source_path:
+            method = "existing"
+        else:
+            try:
+                method = await asyncio.to_thread(
+                    hash_store.materialize, source_path, file_path, bool(data.get('allow_hardlink'))
+                )
+            except Exception as copy_error:
+                decky.logger.error(f"Instant upload failed for {file_path}: {copy_error}")
+                return web.json_response({"status": "success", "hit": False})
+            # A hardlink shares the source's identity, which is already stored.
+            if method != "hardlink":
+                store.remember(file_path, file_hash)
+        decky.logger.info(f"Instant upload ({method}) from {source_path} to {file_path}")
+
+        _get_completion_pipeline(plugin).submit(filename, size)
+
+        return web.json_response({
+            "status": "success",
+            "hit": True,
+            "method": method,
+            "filename": filename,
+            "hash": file_hash,
+            "hash_algo": "sha256"
+        })
+    except Exception as e:
+        decky.logger.error(f"Instant upload error: {e}")
+        return web.json_response({"status": "error", "message": str(e)}, status=500)
+
+
+def _write_batch_file(path, fd, data, offset):
+    """Write the tail of a batched file (opening it if nothing was flushed yet) and close it."""
+    if fd is None:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if data:
+            _pwrite_all(fd, data, offset)
+    finally:
+        os.close(fd)
+
+
+async def handle_upload_batch(request, plugin):
+    """Handle many small files in one multipart request
+
+    Fields, in order: an optional dest_path, then for every file an optional
+    relative_path field followed by its file part. The destination is resolved
+    once and directories created once per batch; progress, completion and
+    notifications are sent once for the whole batch instead of per file.
+    A file that cannot be written is reported in "failed" and the rest of the
+    batch continues.
+    """
+    sleep_block_acquired = False
+    progress_id = None
+    ticket = None
+    try:
+        reader = await request.multipart()
+        upload_dir = plugin.downloads_dir
+        created_dirs = set()
+        pending_relative_path = None
+        failed = []
+        count = 0
+        index = -1
+        received = 0
+        first_filename = None
+        try:
+            content_length = int(request.headers.get('Content-Length', '0'))
+        except ValueError:
+            content_length = 0
+        sleep_block_acquired = _acquire_transfer_sleep_block(plugin)
+        progress = _get_progress_bus(plugin)
+
+        while True:
+            field = await reader.next()
+            if field is None:
+                break
+            if field.name == 'dest_path' and index < 0:
+                upload_dir, error = _resolve_upload_dir(plugin, (await field.text()).strip())
+                if error is not None:
+                    return web.json_response({"status": "error", "message": error}, status=400)
+                continue
+            if field.name == 'relative_path':
+                pending_relative_path = (await field.text()).strip() or None
+                continue
+            if field.name != 'file' or not field.filename:
+                await field.release()
+                continue
+
+            index += 1
+            if ticket is None:
+                # The whole batch is one upload stream for admission purposes
+                try:
+                    ticket = _get_io_scheduler(plugin).admit(upload_dir, request.remote)
+                except io_scheduler.UploadBusyError as busy:
+                    return _upload_busy_response(busy)
+            if progress_id is None:
+                progress_id = progress.begin(field.filename, content_length)
+            rel_path, error = _safe_upload_relative_path(pending_relative_path, field.filename)
+            pending_relative_path = None
+            if error is not None:
+                failed.append({"index": index, "filename": field.filename, "message": error})
+                await field.release()
+                continue
+            file_path = os.path.join(upload_dir, rel_path)
+            parent = os.path.dirname(file_path)
+
+            fd = None
+            written = 0
+            pending = bytearray()
+            try:
+                if parent not in created_dirs:
+                    await asyncio.to_thread(os.makedirs, parent, exist_ok=True)
+                    created_dirs.add(parent)
+                # Small files are written with a single worker-thread hop; only
+                # files larger than the stream buffer are flushed as they arrive.
+                while True:
+                    data = await field.read_chunk(size=_UPLOAD_STREAM_BUFFER_SIZE)
+                    if not data:
+                        break
+                    pending += data
+                    received += len(data)
+                    progress.update(progress_id, received)
+                    if len(pending) >= _UPLOAD_STREAM_BUFFER_SIZE:
+                        if fd is None:
+                            fd = await asyncio.to_thread(
+                                os.open, file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644
+                            )
+                        await _scheduled_write(ticket, _pwrite_all, fd, pending, written)
+                        written += len(pending)
+                        pending = bytearray()
+                await _scheduled_write(ticket, _write_batch_file, file_path, fd, pending, written)
+                fd = None
+            except Exception as write_error:
+                decky.logger.error(f"Batch upload write error for {file_path}: {write_error}")
+                if fd is not None:
+                    os.close(fd)
+                await field.release()
+                failed.append({"index": index, "filename": field.filename, "message": "写入失败"})
+                continue
+
+            count += 1
+            if first_filename is None:
+                first_filename = os.path.basename(file_path)
+            label = first_filename if count == 1 else f"{first_filename} 等 {count} 个文件"
+            progress.update(progress_id, received, label=label)
+
+        decky.logger.info(
+            f"Batch upload completed: {count} file(s), {received} bytes, {len(failed)} failed, into {upload_dir}"
+        )
+        if count:
+            # One filesystem-wide flush makes the whole batch durable at once
+            await asyncio.to_thread(utils.sync_filesystem, upload_dir)
+            progress.end(progress_id)
+            _get_completion_pipeline(plugin).submit(label, received, count)
+
+        return web.json_response({
+            "status": "success",
+            "count": count,
+            "bytes": received,
+            "failed": failed
+        })
+    except Exception as e:
+        decky.logger.error(f"Batch upload error: {e}")
+        return web.json_response({"status": "error", "message": str(e)}, status=500)
+    finally:
+        if progress_id is not None:
+            _end_transfer_progress(plugin, progress_id)
+        if ticket is not None:
+            ticket.release()
+        if sleep_block_acquired:
+            _release_transfer_sleep_block()
+
+
 def _safe_read_text(path):
     try:
         with open(path, "r", encoding="utf-8", errors="ignore") as f:
@@ -7706,7 +8479,6 @@ def _request_suspend():
     return False, last_error or "Suspend command unavailable"
 
 
-<<<<<<< HEAD
 def _run_terminal_command(command, timeout_seconds=20):
     cmd = (command or "").strip()
     if not cmd:
@@ -7975,8 +8747,6 @@ def _stop_terminal_session(session_id):
     return True
 
 
-=======
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
 async def _deferred_stop_server(plugin):
     await asyncio.sleep(0.2)
     try:
@@ -8030,7 +8800,6 @@ async def handle_system_control(request, plugin):
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
-<<<<<<< HEAD
 async def handle_terminal_exec(request, plugin):
     """Execute a terminal command on Steam Deck and return stdout/stderr."""
     try:
@@ -8133,8 +8902,6 @@ async def handle_terminal_stop(request, plugin):
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
-=======
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
 async def handle_text_upload(request, plugin):
     """Handle text upload request
     
@@ -0,0 +1,175 @@
+# io_scheduler.py - Upload admission control and disk write scheduling for decky-send
+#
+# This module keeps concurrent uploads from collapsing each other's throughput
+# on slow storage (microSD):
+# - Admission: a cap on upload streams per filesystem and per client; beyond
+#   it the caller answers 503 with Retry-After
+# - Write slots: a small number of concurrent disk writers per filesystem
+# - Fair share: waiting writes are granted round-robin across clients, so a
+#   client with many parallel streams does not starve one with a single stream
+
+import os
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+
+
+class UploadBusyError(Exception):
+    """Raised by admit() when a filesystem or client has too many uploads."""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _device_of(path):
+    """st_dev of path, or of its nearest existing parent if not created yet."""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+
+class _FilesystemState:
+    __slots__ = ("streams", "client_streams", "writers", "waiters")
+
+    def __init__(self):
+        self.streams = 0
+        self.client_streams = {}
+        self.writers = 0
+        # client -> deque of futures waiting for a write slot
+        self.waiters = OrderedDict()
+
+
+class UploadTicket:
+    """An admitted upload stream; release() it when the request ends."""
+
+    __slots__ = ("_scheduler", "_entry", "client", "_released")
+
+    def __init__(self, scheduler, entry, client):
+        self._scheduler = scheduler
+        self._entry = entry
+        self.client = client
+        self._released = False
+
+    @asynccontextmanager
+    async def write_slot(self):
+        """Hold one of the filesystem's write slots for a single disk write."""
+        await self._scheduler._acquire(self._entry, self.client)
+        try:
+            yield
+        finally:
+            self._scheduler._release(self._entry)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._scheduler._leave(self._entry, self.client)
+
+
+class IOScheduler:
+    """Per-filesystem upload admission and fair write scheduling.
+
+    Filesystems are told apart by st_dev of the destination directory. State
+    for a filesystem is dropped once its last stream leaves.
+    """
+
+    def __init__(self, max_writers=None, max_streams=None, max_client_streams=None, retry_after=None):
+        self.max_writers = max_writers or config.UPLOAD_MAX_WRITERS_PER_FS
+        self.max_streams = max_streams or config.UPLOAD_MAX_STREAMS_PER_FS
+        self.max_client_streams = max_client_streams or config.UPLOAD_MAX_STREAMS_PER_CLIENT
+        self.retry_after = retry_after or config.UPLOAD_BUSY_RETRY_AFTER
+        self._filesystems = {}
+
+    def admit(self, directory, client):
+        """Admit one upload stream writing into ``directory``.
+
+        Returns:
+            UploadTicket
+        Raises:
+            UploadBusyError: the filesystem or this client is at its stream limit
+        """
+        device = _device_of(directory)
+        state = self._filesystems.get(device)
+        if state is None:
+            state = self._filesystems[device] = _FilesystemState()
+        if state.streams >= self.max_streams:
+            raise UploadBusyError(self.retry_after, "filesystem busy")
+        if state.client_streams.get(client, 0) >= self.max_client_streams:
+            raise UploadBusyError(self.retry_after, "too many uploads from client")
+        state.streams += 1
+        state.client_streams[client] = state.client_streams.get(client, 0) + 1
+        return UploadTicket(self, (device, state), client)
+
+    def _leave(self, entry, client):
+        device, state = entry
+        state.streams -= 1
+        remaining = state.client_streams.get(client, 0) - 1
+        if remaining > 0:
+            state.client_streams[client] = remaining
+        else:
+            state.client_streams.pop(client, None)
+        if state.streams <= 0 and self._filesystems.get(device) is state:
+            del self._filesystems[device]
+
+    async def _acquire(self, entry, client):
+        state = entry[1]
+        if state.writers < self.max_writers and not state.waiters:
+            state.writers += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.setdefault(client, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancel; pass it on.
+                self._release(entry)
+            else:
+                queue = state.waiters.get(client)
+                if queue is not None:
+                    try:
+                        queue.remove(future)
+                    except ValueError:
+                        pass
+                    if not queue:
+                        del state.waiters[client]
+            raise
+
+    def _release(self, entry):
+        state = entry[1]
+        # Hand the slot straight to the next client in round-robin order; the
+        # writer count only drops when nobody is waiting.
+        while state.waiters:
+            client, queue = next(iter(state.waiters.items()))
+            future = queue.popleft()
+            if queue:
+                state.waiters.move_to_end(client)
+            else:
+                del state.waiters[client]
+            if not future.done():
+                future.set_result(None)
+                return
+        state.writers -= 1
+
+    def stats(self):
+        """Return active streams, writers and waiting writes per filesystem."""
+        return {
+            str(device): {
+                "streams": state.streams,
+                "clients": len(state.client_streams),
+                "writers": state.writers,
+                "waiting": sum(len(queue) for queue in state.waiters.values()),
+            }
+            for device, state in self._filesystems.items()
+        }
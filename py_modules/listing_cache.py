@@ -0,0 +1,268 @@
+# listing_cache.py - Directory listing cache for decky-send
+#
+# This module keeps recent directory listings in memory so repeat navigation
+# does not re-stat whole folders:
+# - LRU of listings keyed by path, bounded by entry and total row counts
+# - Invalidation by inotify watches on the cached directories (via ctypes);
+#   pending events are drained on every lookup, no extra thread
+# - Fallback to directory mtime validation when inotify is unavailable or
+#   the watch limit is reached
+# - Hit/miss/invalidation counters for monitoring
+
+import os
+import time
+import errno
+import ctypes
+import struct
+import threading
+from collections import OrderedDict
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import utils
+
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+# Anything that changes a listing row: entries added, removed, renamed,
+# written or re-attributed, and the directory itself going away.
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+# A directory modified this recently may change again within the same mtime
+# tick (1-2 s on FAT/exFAT), so an mtime-validated entry stored that close to
+# its mtime is not trusted.
+_RACY_MTIME_SECONDS = 2.0
+
+
+class Inotify:
+    """Minimal non-blocking inotify instance."""
+
+    def __init__(self):
+        self._libc = utils.get_libc()
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Yield (wd, mask) for every pending event."""
+        while True:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size + length
+                yield wd, mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Entry:
+    __slots__ = ("rows", "wd", "mtime_ns", "inode")
+
+    def __init__(self, rows, wd, st):
+        self.rows = rows
+        self.wd = wd
+        # Only consulted for entries without a watch
+        self.mtime_ns = st.st_mtime_ns
+        self.inode = (st.st_dev, st.st_ino)
+
+
+class ListingCache:
+    """LRU cache of directory listings. Thread-safe; get() blocks.
+
+    Cached rows are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_entries=None, max_rows=None, max_watches=None):
+        self.max_entries = max_entries or config.LISTING_CACHE_MAX_ENTRIES
+        self.max_rows = max_rows or config.LISTING_CACHE_MAX_ROWS
+        self.max_watches = max_watches or config.LISTING_CACHE_MAX_WATCHES
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._wd_paths = {}
+        # path -> (loads in progress, token of the newest load)
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "mtime_fallbacks": 0, "overflows": 0}
+        try:
+            self._inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            config.logger.info(f"inotify unavailable, listing cache validates by mtime: {e}")
+            self._inotify = None
+
+    def get(self, path, loader):
+        """Return the listing of ``path``, calling ``loader(path)`` on a miss."""
+        with self._lock:
+            self._drain_events()
+            entry = self._entries.get(path)
+            if entry is not None and self._valid(path, entry):
+                self._entries.move_to_end(path)
+                self._stats["hits"] += 1
+                return entry.rows
+            if entry is not None:
+                self._drop(path)
+            self._stats["misses"] += 1
+            # Watch before listing so changes made while listing are seen
+            wd = self._watch(path)
+            token = object()
+            count, _ = self._loading.get(path, (0, None))
+            self._loading[path] = (count + 1, token)
+
+        try:
+            # Stat before listing: a change during the listing makes the
+            # stored mtime stale, never the other way round.
+            st = os.stat(path)
+            rows = loader(path)
+        except BaseException:
+            with self._lock:
+                self._finish_loading(path, wd)
+            raise
+
+        with self._lock:
+            self._drain_events()
+            # Invalidated while loading, or superseded by a newer load
+            current = self._loading[path][1] is token
+            if current and len(rows) <= self.max_rows and (wd is not None or self._mtime_settled(st)):
+                self._store(path, _Entry(rows, wd, st))
+            self._finish_loading(path, wd)
+        return rows
+
+    # -------------------------------------------------------------------------
+    # Validation and invalidation
+    # -------------------------------------------------------------------------
+
+    def _valid(self, path, entry):
+        if entry.wd is not None:
+            # Watched entries are dropped as soon as an event arrives
+            return True
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return (st.st_dev, st.st_ino) == entry.inode and st.st_mtime_ns == entry.mtime_ns
+
+    @staticmethod
+    def _mtime_settled(st):
+        return time.time() - st.st_mtime >= _RACY_MTIME_SECONDS
+
+    def _drain_events(self):
+        if self._inotify is None:
+            return
+        for wd, mask in self._inotify.read_events():
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost; nothing watched can be trusted
+                self._stats["overflows"] += 1
+                for path in [p for p, e in self._entries.items() if e.wd is not None]:
+                    self._invalidate(path)
+                continue
+            for path in list(self._wd_paths.get(wd, ())):
+                self._invalidate(path)
+            if mask & _IN_IGNORED:
+                # Watch removed by the kernel (directory deleted, unmounted)
+                self._wd_paths.pop(wd, None)
+
+    def _invalidate(self, path):
+        # A listing of this path still being loaded is stale as well
+        if path in self._loading:
+            self._loading[path] = (self._loading[path][0], None)
+        if path in self._entries:
+            self._stats["invalidations"] += 1
+            self._drop(path)
+
+    def _drop(self, path):
+        entry = self._entries.pop(path)
+        self._rows -= len(entry.rows)
+        if entry.wd is not None and path not in self._loading:
+            self._unwatch(entry.wd, path)
+
+    def _finish_loading(self, path, wd):
+        count, token = self._loading.pop(path)
+        if count > 1:
+            self._loading[path] = (count - 1, token)
+        elif wd is not None and path not in self._entries:
+            self._unwatch(wd, path)
+
+    def _store(self, path, entry):
+        if path in self._entries:
+            self._drop(path)
+        if entry.wd is None:
+            self._stats["mtime_fallbacks"] += 1
+        self._entries[path] = entry
+        self._rows += len(entry.rows)
+        while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+            self._drop(next(iter(self._entries)))
+
+    # -------------------------------------------------------------------------
+    # Watches
+    # -------------------------------------------------------------------------
+
+    def _watch(self, path):
+        """Watch ``path``; returns the watch descriptor or None (mtime fallback)."""
+        if self._inotify is None:
+            return None
+        if len(self._wd_paths) >= self.max_watches:
+            return None
+        try:
+            wd = self._inotify.add_watch(path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                config.logger.info("inotify watch limit reached, listing cache validates by mtime")
+            return None
+        self._wd_paths.setdefault(wd, set()).add(path)
+        return wd
+
+    def _unwatch(self, wd, path):
+        paths = self._wd_paths.get(wd)
+        if paths is None:
+            return
+        paths.discard(path)
+        if not paths:
+            del self._wd_paths[wd]
+            self._inotify.rm_watch(wd)
+
+    def stats(self):
+        with self._lock:
+            self._drain_events()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else None,
+                entries=len(self._entries),
+                rows=self._rows,
+                watches=len(self._wd_paths),
+                inotify=self._inotify is not None,
+                max_entries=self.max_entries,
+                max_rows=self.max_rows,
+                max_watches=self.max_watches,
+            )
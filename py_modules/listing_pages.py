@@ -0,0 +1,197 @@
+# listing_pages.py - Cursor-paginated directory listings for decky-send
+#
+# This module serves large directories page by page:
+# - Server-side cursors holding a listing between page requests
+# - Unsorted listings stream from an open os.scandir iterator, so the first
+#   page costs O(page size) however large the directory is
+# - Sorted listings (name, size, mtime, type) are built once per cursor
+# - Name prefix and glob filters applied before any stat call
+# - Compact rows: names relative to the listed directory, no absolute paths
+
+import os
+import stat
+import time
+import uuid
+import fnmatch
+import threading
+from collections import OrderedDict
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+
+# Row layout of every page ("fields" in the response)
+FIELDS = ("name", "is_dir", "size", "mtime", "created_at", "is_symlink")
+SORT_KEYS = ("none", "name", "size", "mtime", "type")
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 2000
+
+
+class CursorExpiredError(LookupError):
+    """Raised for a cursor that is unknown, expired or malformed."""
+
+
+def _row(entry):
+    """Compact row for a DirEntry (one stat call; follows symlinks)."""
+    st = entry.stat()
+    is_dir = stat.S_ISDIR(st.st_mode)
+    return [
+        entry.name,
+        is_dir,
+        0 if is_dir else st.st_size,
+        st.st_mtime,
+        getattr(st, 'st_birthtime', st.st_ctime),
+        entry.is_symlink(),
+    ]
+
+
+def _sort_key(sort):
+    if sort == "size":
+        return lambda row: (row[2], row[0].casefold(), row[0])
+    if sort == "mtime":
+        return lambda row: (row[3], row[0].casefold(), row[0])
+    if sort == "type":
+        return lambda row: (os.path.splitext(row[0])[1].casefold(), row[0].casefold(), row[0])
+    return lambda row: (row[0].casefold(), row[0])
+
+
+class _Listing:
+    """Rows of one directory listing, filled lazily for unsorted cursors."""
+
+    def __init__(self, path, sort, descending, dirs_first, prefix, glob):
+        self.path = path
+        self.sort = sort
+        self.descending = descending
+        self.dirs_first = dirs_first
+        self.prefix = prefix.casefold() if prefix else None
+        self.glob = glob.casefold() if glob else None
+        self.rows = []
+        self.complete = False
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        # Raises FileNotFoundError / NotADirectoryError for a bad path
+        self._entries = os.scandir(path)
+
+    def _matches(self, name):
+        folded = name.casefold()
+        if self.prefix and not folded.startswith(self.prefix):
+            return False
+        if self.glob and not fnmatch.fnmatchcase(folded, self.glob):
+            return False
+        return True
+
+    def _fill(self, count):
+        """Read entries until ``count`` rows are available or the directory ends."""
+        while not self.complete and (count is None or len(self.rows) < count):
+            entry = next(self._entries, None)
+            if entry is None:
+                self.close()
+                break
+            if not self._matches(entry.name):
+                continue
+            try:
+                self.rows.append(_row(entry))
+            except OSError as e:
+                # Vanished during traversal, broken symlink, permission denied
+                config.logger.debug(f"Skipping file {entry.path}: {e}")
+
+    def page(self, offset, limit):
+        """Return (rows, has_more) for ``limit`` rows starting at ``offset``. Blocking."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            if self.sort == "none":
+                # One extra row tells whether another page exists.
+                self._fill(offset + limit + 1)
+            elif not self.complete:
+                self._fill(None)
+                self.rows.sort(key=_sort_key(self.sort), reverse=self.descending)
+                if self.dirs_first:
+                    self.rows.sort(key=lambda row: not row[1])
+            rows = self.rows[offset:offset + limit]
+            return rows, offset + limit < len(self.rows)
+
+    def close(self):
+        self.complete = True
+        if self._entries is not None:
+            self._entries.close()
+            self._entries = None
+
+
+class ListingCursorStore:
+    """Open listings addressed by opaque cursors.
+
+    A cursor token is ``<listing id>.<offset>``, so re-requesting a page
+    (a retry, or paging back) returns the same rows. Listings idle for
+    ``ttl`` seconds, and the least recently used beyond ``max_cursors``, are
+    closed; a sorted listing of a huge folder holds all of its rows, so only
+    a few are kept.
+    """
+
+    def __init__(self, ttl=120.0, max_cursors=8):
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, path, sort="none", descending=False, dirs_first=True, prefix=None, glob=None):
+        """Start a listing and return its cursor for offset 0. Blocking."""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unsupported sort: {sort}")
+        listing = _Listing(path, sort, descending, dirs_first, prefix, glob)
+        listing_id = uuid.uuid4().hex
+        with self._lock:
+            self._listings[listing_id] = listing
+            evicted = self._evict()
+        self._close(evicted)
+        return f"{listing_id}.0"
+
+    def _lookup(self, cursor):
+        try:
+            listing_id, offset = str(cursor).rsplit(".", 1)
+            offset = int(offset)
+        except ValueError:
+            raise CursorExpiredError(cursor)
+        with self._lock:
+            evicted = self._evict()
+            listing = self._listings.get(listing_id)
+            if listing is not None:
+                self._listings.move_to_end(listing_id)
+        self._close(evicted)
+        if listing is None or offset < 0:
+            raise CursorExpiredError(cursor)
+        return listing_id, listing, offset
+
+    def read(self, cursor, limit=DEFAULT_PAGE_SIZE):
+        """Return a page for ``cursor``. Blocking; run it in a worker thread.
+
+        Returns:
+            dict: path, rows, next_cursor (None on the last page), total
+            (None while an unsorted listing has not reached the end)
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        listing_id, listing, offset = self._lookup(cursor)
+        rows, has_more = listing.page(offset, limit)
+        return {
+            "path": listing.path,
+            "rows": rows,
+            "next_cursor": f"{listing_id}.{offset + len(rows)}" if has_more else None,
+            "total": len(listing.rows) if listing.complete else None,
+        }
+
+    def _evict(self):
+        """Unregister stale listings (store lock held); returns them for _close."""
+        now = time.monotonic()
+        evicted = [
+            self._listings.pop(listing_id)
+            for listing_id in [k for k, v in self._listings.items() if now - v.last_used > self.ttl]
+        ]
+        while len(self._listings) > self.max_cursors:
+            evicted.append(self._listings.popitem(last=False)[1])
+        return evicted
+
+    @staticmethod
+    def _close(listings):
+        # Outside the store lock: waits for a page that is still being read
+        for listing in listings:
+            with listing.lock:
+                listing.close()
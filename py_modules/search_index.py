@@ -0,0 +1,475 @@
+# search_index.py - Persistent filename search index for decky-send
+#
+# This module makes file names searchable without walking folders:
+# - SQLite database of directories and entries with an FTS5 trigram index
+#   on names (substring matches); plain LIKE scans when FTS5 is unavailable
+# - Built in a background thread at idle CPU and I/O priority
+# - Kept current by inotify events on the shallowest directories and by
+#   periodic rescans of directories whose mtime changed
+# - Ranked results: exact name, then name prefix, then substring; shorter
+#   names and shallower paths first
+
+import os
+import stat
+import time
+import select
+import sqlite3
+import platform
+import threading
+from collections import deque
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import utils
+import listing_cache
+
+MAX_RESULTS = 500
+
+# inotify event for a watch removed by the kernel (directory deleted)
+_IN_IGNORED = 0x00008000
+
+# ioprio_set(2): no glibc wrapper, called through syscall(2)
+_SYS_IOPRIO_SET = {"x86_64": 251, "aarch64": 30}.get(platform.machine())
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    dir_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    UNIQUE (dir_id, name)
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+    name, content='files', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO names(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO names(names, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+"""
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _subtree_bounds(path):
+    # Every path below ``path`` sorts between "path/" and "path0" ("0" follows "/")
+    base = path.rstrip("/")
+    return base + "/", base + "0"
+
+
+def _lower_thread_priority():
+    """Run the calling thread at nice 19 and idle I/O priority (best effort)."""
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+    except OSError as e:
+        config.logger.debug(f"Search index could not lower CPU priority: {e}")
+    if _SYS_IOPRIO_SET is not None:
+        try:
+            utils.get_libc().syscall(_SYS_IOPRIO_SET, _IOPRIO_WHO_PROCESS, tid, _IOPRIO_CLASS_IDLE << 13)
+        except (OSError, AttributeError) as e:
+            config.logger.debug(f"Search index could not lower I/O priority: {e}")
+
+
+class SearchIndex:
+    """Filename index of a few root directories, maintained by one thread.
+
+    ``roots`` is a callable returning the directories to index; it is
+    re-evaluated on every rescan so an SD card inserted later is picked up.
+    Entries under a root that is not currently available are kept (the card
+    may come back) and filtered out of search results.
+    """
+
+    def __init__(self, roots, path=None, rescan_interval=None, max_entries=None, max_watches=None):
+        self.roots = roots
+        self.path = path or config.SEARCH_INDEX_PATH
+        self.rescan_interval = rescan_interval or config.SEARCH_INDEX_RESCAN_INTERVAL
+        self.max_entries = max_entries or config.SEARCH_INDEX_MAX_ENTRIES
+        self.max_watches = max_watches or config.SEARCH_INDEX_MAX_WATCHES
+        self.skip_dirs = frozenset(config.SEARCH_INDEX_SKIP_DIRS)
+        self.fts = False
+        self.state = "stopped"
+        self.entries = 0
+        self.last_rescan = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake_r, self._wake_w = None, None
+        self._local = threading.local()
+        self._inotify = None
+        self._wd_paths = {}
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            if self._thread.is_alive():
+                # Running, or a timed-out stop() has not finished yet: never
+                # run two indexer threads on one database
+                return
+            self._close_wake_pipe()
+        self._stop.clear()
+        self._wake_r, self._wake_w = os.pipe()
+        self.state = "starting"
+        self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        if thread.is_alive():
+            try:
+                os.write(self._wake_w, b"x")
+            except OSError:
+                pass
+            thread.join(timeout)
+        if thread.is_alive():
+            # Still inside a scan or a database write. Its wake pipe stays open
+            # until the thread is gone; the next start() or stop() tears it down.
+            config.logger.warning("Search index thread did not stop in time")
+            self.state = "stopping"
+            return
+        self._thread = None
+        self._close_wake_pipe()
+        self.state = "stopped"
+
+    def _close_wake_pipe(self):
+        for fd in (self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._wake_r, self._wake_w = None, None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _open_database(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            conn = self._connect()
+            conn.executescript(_SCHEMA)
+        except sqlite3.DatabaseError as e:
+            # A damaged index is only a cache: start over
+            config.logger.warning(f"Rebuilding unreadable search index {self.path}: {e}")
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.path + suffix)
+                except FileNotFoundError:
+                    pass
+            conn = self._connect()
+            conn.executescript(_SCHEMA)
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            config.logger.info(f"FTS5 trigram unavailable, search falls back to LIKE scans: {e}")
+        self.entries = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return conn
+
+    def _run(self):
+        _lower_thread_priority()
+        try:
+            conn = self._open_database()
+        except Exception as e:
+            config.logger.error(f"Search index disabled: {e}")
+            self.state = "disabled"
+            return
+        try:
+            self._inotify = listing_cache.Inotify()
+        except (OSError, AttributeError) as e:
+            config.logger.info(f"inotify unavailable, search index relies on rescans: {e}")
+        try:
+            while not self._stop.is_set():
+                self.state = "indexing"
+                started = time.monotonic()
+                self._rescan(conn)
+                self.last_rescan = time.time()
+                self.state = "ready"
+                config.logger.info(
+                    f"Search index rescan: {self.entries} entries, {len(self._wd_paths)} watches, "
+                    f"{time.monotonic() - started:.1f}s"
+                )
+                self._follow_events(conn, time.monotonic() + self.rescan_interval)
+        except Exception as e:
+            config.logger.error(f"Search index stopped: {e}")
+            self.state = "error"
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+            self._wd_paths.clear()
+            conn.close()
+
+    # -------------------------------------------------------------------------
+    # Indexing
+    # -------------------------------------------------------------------------
+
+    def _available_roots(self):
+        roots = []
+        for root in self.roots():
+            if root and os.path.isdir(root):
+                roots.append(os.path.realpath(root))
+        return roots
+
+    def _rescan(self, conn):
+        """Crawl new roots and re-list every directory whose mtime changed."""
+        for root in self._available_roots():
+            dev = os.stat(root).st_dev
+            known = conn.execute("SELECT id, mtime_ns FROM dirs WHERE path = ?", (root,)).fetchone()
+            queue = [root]
+            if known is not None:
+                low, high = _subtree_bounds(root)
+                rows = conn.execute(
+                    "SELECT id, path, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                    (root, low, high),
+                ).fetchall()
+                queue = []
+                for dir_id, path, mtime_ns in rows:
+                    if self._stop.is_set():
+                        return
+                    self._watch(path)
+                    try:
+                        st = os.lstat(path)
+                    except OSError:
+                        self._delete_subtree(conn, path)
+                        continue
+                    if st.st_mtime_ns != mtime_ns:
+                        queue.extend(self._sync_dir(conn, path, dev))
+            self._crawl(conn, queue, dev)
+            conn.commit()
+
+    def _crawl(self, conn, queue, dev):
+        """Index the directories in ``queue`` and everything below them."""
+        queue = deque(queue)
+        pending = 0
+        while queue and not self._stop.is_set():
+            path = queue.popleft()
+            self._watch(path)
+            queue.extend(self._sync_dir(conn, path, dev))
+            pending += 1
+            if pending >= 200:
+                conn.commit()
+                pending = 0
+        conn.commit()
+
+    def _sync_dir(self, conn, path, dev):
+        """Bring the rows of one directory up to date.
+
+        Returns:
+            list: subdirectories not indexed before (to crawl)
+        """
+        try:
+            st = os.lstat(path)
+            if not stat.S_ISDIR(st.st_mode):
+                raise NotADirectoryError(path)
+            scanned = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        est = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    is_dir = stat.S_ISDIR(est.st_mode)
+                    scanned.append((entry.name, is_dir, 0 if is_dir else est.st_size, est.st_mtime, est.st_dev))
+        except OSError:
+            self._delete_subtree(conn, path)
+            return []
+
+        row = conn.execute("SELECT id FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            dir_id = conn.execute(
+                "INSERT INTO dirs (path, mtime_ns) VALUES (?, ?)", (path, st.st_mtime_ns)
+            ).lastrowid
+            existing = {}
+        else:
+            dir_id = row[0]
+            conn.execute("UPDATE dirs SET mtime_ns = ? WHERE id = ?", (st.st_mtime_ns, dir_id))
+            existing = {
+                name: (file_id, is_dir, size, mtime)
+                for file_id, name, is_dir, size, mtime in conn.execute(
+                    "SELECT id, name, is_dir, size, mtime FROM files WHERE dir_id = ?", (dir_id,)
+                )
+            }
+
+        new_dirs = []
+        for name, is_dir, size, mtime, entry_dev in scanned:
+            old = existing.pop(name, None)
+            if old is not None and bool(old[1]) == is_dir:
+                if old[2] != size or old[3] != mtime:
+                    conn.execute("UPDATE files SET size = ?, mtime = ? WHERE id = ?", (size, mtime, old[0]))
+                continue
+            if old is not None:
+                self._delete_entry(conn, path, name, old)
+            if self.entries >= self.max_entries:
+                continue
+            conn.execute(
+                "INSERT INTO files (dir_id, name, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                (dir_id, name, int(is_dir), size, mtime),
+            )
+            self.entries += 1
+            # Other filesystems (a mounted SD card under home) are roots of their own
+            if is_dir and entry_dev == dev and name not in self.skip_dirs:
+                new_dirs.append(os.path.join(path, name))
+        for name, old in existing.items():
+            self._delete_entry(conn, path, name, old)
+        return new_dirs
+
+    def _delete_entry(self, conn, parent, name, old):
+        conn.execute("DELETE FROM files WHERE id = ?", (old[0],))
+        self.entries -= 1
+        if old[1]:
+            self._delete_subtree(conn, os.path.join(parent, name))
+
+    def _delete_subtree(self, conn, path):
+        low, high = _subtree_bounds(path)
+        where = "path = ? OR (path >= ? AND path < ?)"
+        removed = conn.execute(
+            f"DELETE FROM files WHERE dir_id IN (SELECT id FROM dirs WHERE {where})", (path, low, high)
+        ).rowcount
+        self.entries -= max(removed, 0)
+        conn.execute(f"DELETE FROM dirs WHERE {where}", (path, low, high))
+
+    # -------------------------------------------------------------------------
+    # inotify
+    # -------------------------------------------------------------------------
+
+    def _watch(self, path):
+        # Directories are watched in crawl order, so the budget goes to the
+        # shallowest ones; deeper changes are found by the periodic rescan.
+        if self._inotify is None or len(self._wd_paths) >= self.max_watches:
+            return
+        try:
+            wd = self._inotify.add_watch(path)
+        except OSError:
+            return
+        self._wd_paths[wd] = path
+
+    def _follow_events(self, conn, deadline):
+        """Re-list watched directories as they change, until ``deadline``."""
+        fds = [self._wake_r]
+        if self._inotify is not None:
+            fds.append(self._inotify.fd)
+        dirty = set()
+        while not self._stop.is_set():
+            # Changes arrive in bursts (a copy, an extraction): settle first
+            timeout = 1.0 if dirty else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select(fds, [], [], timeout)
+            if self._wake_r in readable:
+                return
+            if readable:
+                for wd, mask in self._inotify.read_events():
+                    path = self._wd_paths.get(wd)
+                    if path is not None:
+                        dirty.add(path)
+                    if mask & _IN_IGNORED:
+                        self._wd_paths.pop(wd, None)
+                continue
+            if dirty:
+                self._sync_dirty(conn, dirty)
+                dirty.clear()
+            if time.monotonic() >= deadline:
+                return
+
+    def _sync_dirty(self, conn, dirty):
+        devices = {}
+        for root in self._available_roots():
+            try:
+                devices[root] = os.stat(root).st_dev
+            except OSError:
+                continue
+        for path in sorted(dirty):
+            root = next((r for r in devices if path == r or path.startswith(r.rstrip("/") + "/")), None)
+            if root is not None:
+                self._crawl(conn, self._sync_dir(conn, path, devices[root]), devices[root])
+
+    # -------------------------------------------------------------------------
+    # Search
+    # -------------------------------------------------------------------------
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def search(self, query, limit=50, under=None):
+        """Return ranked entries whose name contains every term of ``query``. Blocking."""
+        terms = query.split()
+        if not terms:
+            return []
+        limit = max(1, min(int(limit), MAX_RESULTS))
+        phrase = " ".join(terms)
+        sql = ["SELECT d.path, f.name, f.is_dir, f.size, f.mtime FROM files f JOIN dirs d ON d.id = f.dir_id"]
+        where = []
+        params = []
+        # Trigrams need three characters; shorter terms are matched by LIKE
+        fts_terms = [t for t in terms if len(t) >= 3] if self.fts else []
+        if fts_terms:
+            sql.append("JOIN names n ON n.rowid = f.id")
+            where.append("names MATCH ?")
+            params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in fts_terms))
+        for term in terms:
+            if term not in fts_terms:
+                where.append("f.name LIKE ? ESCAPE '\\'")
+                params.append(f"%{_like_escape(term)}%")
+        if under:
+            low, high = _subtree_bounds(under)
+            where.append("(d.path = ? OR (d.path >= ? AND d.path < ?))")
+            params.extend((under.rstrip("/") or "/", low, high))
+        sql.append("WHERE " + " AND ".join(where))
+        sql.append(
+            "ORDER BY CASE WHEN f.name = ? COLLATE NOCASE THEN 0 "
+            "WHEN f.name LIKE ? ESCAPE '\\' THEN 1 ELSE 2 END, length(f.name), length(d.path) LIMIT ?"
+        )
+        # Over-fetch: entries under an unmounted card or deleted since the
+        # last rescan are dropped below
+        params.extend((phrase, f"{_like_escape(phrase)}%", limit * 2))
+
+        try:
+            rows = self._reader().execute(" ".join(sql), params).fetchall()
+        except sqlite3.OperationalError as e:
+            # Index not created yet (first start still opening the database)
+            config.logger.debug(f"Search unavailable: {e}")
+            return []
+        results = []
+        for parent, name, is_dir, size, mtime in rows:
+            path = os.path.join(parent, name)
+            if not os.path.lexists(path):
+                continue
+            results.append({"name": name, "path": path, "is_dir": bool(is_dir), "size": size, "mtime": mtime})
+            if len(results) >= limit:
+                break
+        return results
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "entries": self.entries,
+            "watches": len(self._wd_paths),
+            "fts": self.fts,
+            "last_rescan": self.last_rescan,
+        }
@@ -250,6 +250,9 @@ async def start_server_async(plugin):
             plugin.runner = None
             plugin.site = None
         
+        # Rebuild chunked upload sessions from the journal on this server loop
+        html_templates.reset_upload_sessions(plugin)
+        
         # Create aiohttp application with CORS middleware
         # Allow very large uploads (default is 1MB in aiohttp)
         plugin.app = web.Application(
@@ -269,6 +272,9 @@ async def start_server_async(plugin):
         config.logger.info(f"HTTP server started on {plugin.server_host}:{plugin.server_port}")
         plugin.server_running = True
         
+        # Filename index builds at idle priority while the server runs
+        file_operations.start_search_index()
+        
     except Exception as e:
         config.logger.error(f"Failed to start server: {e}")
         plugin.server_running = False
@@ -310,6 +316,17 @@ def start_server_thread(plugin):
     except Exception as e:
         config.logger.error(f"Server thread error: {e}")
     finally:
+        try:
+            file_operations.stop_search_index()
+        except Exception as e:
+            config.logger.error(f"Error stopping search index: {e}")
+        
+        # Persist resumable upload state before pending tasks are cancelled
+        try:
+            loop.run_until_complete(html_templates.close_upload_sessions(plugin))
+        except Exception as e:
+            config.logger.error(f"Error closing upload sessions: {e}")
+        
         # Clean up the loop properly
         try:
             pending = asyncio.all_tasks(loop)
@@ -722,7 +739,6 @@ async def load_settings(plugin):
             config.logger.error(f"Failed to create downloads directory: {e}")
         
         config.logger.info(
-<<<<<<< HEAD
             "Loaded settings: running=%s, port=%s, downloads_dir=%s, auto_copy_text=%s, prompt_upload_path=%s, prevent_sleep_during_transfer=%s, language=%s",
             plugin.server_running,
             plugin.server_port,
@@ -730,14 +746,6 @@ async def load_settings(plugin):
             plugin.auto_copy_text_enabled,
             plugin.prompt_upload_path_enabled,
             plugin.prevent_sleep_during_transfer_enabled,
-=======
-            "Loaded settings: running=%s, port=%s, downloads_dir=%s, auto_copy_text=%s, prompt_upload_path=%s, language=%s",
-            plugin.server_running,
-            plugin.server_port,
-            plugin.downloads_dir,
-            plugin.auto_copy_text_enabled,
-            plugin.prompt_upload_path_enabled,
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
             plugin.language_preference,
         )
         
@@ -757,12 +765,9 @@ async def save_settings(plugin):
         plugin.SETTING_DOWNLOAD_DIR: plugin.downloads_dir,
         plugin.SETTING_AUTO_COPY_TEXT: bool(plugin.auto_copy_text_enabled),
         plugin.SETTING_PROMPT_UPLOAD_PATH: bool(plugin.prompt_upload_path_enabled),
-<<<<<<< HEAD
         plugin.SETTING_PREVENT_SLEEP_DURING_TRANSFER: bool(
             plugin.prevent_sleep_during_transfer_enabled
         ),
-=======
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
         plugin.SETTING_LANGUAGE: getattr(plugin, "language_preference", "auto"),
     }
 
@@ -844,12 +849,18 @@ def setup_main_server_routes(app, plugin):
     # Upload endpoints (need plugin for paths)
     app.router.add_post('/upload', lambda request: html_templates.handle_upload(request, plugin))
     app.router.add_post('/upload-chunk', lambda request: html_templates.handle_upload_chunk(request, plugin))
+    app.router.add_post('/upload-batch', lambda request: html_templates.handle_upload_batch(request, plugin))
     app.router.add_post('/upload-status', lambda request: html_templates.handle_upload_status(request, plugin))
+    app.router.add_post('/api/upload/plan', lambda request: html_templates.handle_upload_plan(request, plugin))
+    app.router.add_post('/api/upload/instant', lambda request: html_templates.handle_upload_instant(request, plugin))
     app.router.add_post('/upload-text', lambda request: html_templates.handle_text_upload(request, plugin))
     app.router.add_get('/api/settings/upload-options', lambda request: html_templates.handle_upload_options(request, plugin))
     
     # File management routes
     app.router.add_post('/api/files/list', file_operations.get_file_list)
+    app.router.add_post('/api/files/list-page', file_operations.get_file_list_page)
+    app.router.add_get('/api/files/search', file_operations.search_files)
+    app.router.add_get('/api/files/list-cache', file_operations.get_listing_cache_stats)
     app.router.add_post('/api/files/read', file_operations.read_file)
     app.router.add_post('/api/files/write', file_operations.write_file)
     app.router.add_post('/api/files/create', file_operations.create_file)
@@ -857,11 +868,16 @@ def setup_main_server_routes(app, plugin):
     app.router.add_post('/api/files/copy', file_operations.copy_file)
     app.router.add_post('/api/files/move', file_operations.move_file)
     app.router.add_post('/api/files/delete', file_operations.delete_file)
+    app.router.add_get('/api/jobs', file_operations.list_jobs)
+    app.router.add_get('/api/jobs/status', file_operations.get_job)
+    app.router.add_post('/api/jobs/cancel', file_operations.control_job)
+    app.router.add_post('/api/jobs/pause', file_operations.control_job)
+    app.router.add_post('/api/jobs/resume', file_operations.control_job)
     app.router.add_get('/api/files/download', file_operations.download_file)
     app.router.add_post('/api/files/unpack', file_operations.unpack_archive)
     app.router.add_post('/api/files/add-to-steam', file_operations.add_file_to_steam)
     app.router.add_get('/api/system/sdcard', file_operations.get_sdcard_info)
-<<<<<<< HEAD
+    app.router.add_post('/api/storage/usage', file_operations.get_storage_usage)
     app.router.add_get('/api/system/overview', lambda request: html_templates.handle_system_overview(request, plugin))
     app.router.add_post('/api/system/control', lambda request: html_templates.handle_system_control(request, plugin))
     app.router.add_post('/api/system/exec', lambda request: html_templates.handle_terminal_exec(request, plugin))
@@ -869,13 +885,6 @@ def setup_main_server_routes(app, plugin):
     app.router.add_post('/api/system/terminal/poll', lambda request: html_templates.handle_terminal_poll(request, plugin))
     app.router.add_post('/api/system/terminal/input', lambda request: html_templates.handle_terminal_input(request, plugin))
     app.router.add_post('/api/system/terminal/stop', lambda request: html_templates.handle_terminal_stop(request, plugin))
-=======
-<<<<<<< HEAD
-    app.router.add_get('/api/system/overview', lambda request: html_templates.handle_system_overview(request, plugin))
-    app.router.add_post('/api/system/control', lambda request: html_templates.handle_system_control(request, plugin))
-=======
->>>>>>> 1cd76c3b78047290c21b4583356660f20db1365f
->>>>>>> a644f870110fc23700a2b5ac7bc22c0ea9171992
     app.router.add_get('/api/media/list', file_operations.get_media_list)
     app.router.add_get('/api/media/preview', file_operations.get_media_preview)
     app.router.add_get('/api/settings/language', lambda request: html_templates.handle_language_settings(request, plugin))
@@ -0,0 +1,279 @@
+# storage_analyzer.py - Recursive directory sizes for decky-send
+#
+# This module finds what is filling a drive:
+# - Recursive disk usage computed in a thread pool over os.scandir, one lstat
+#   per entry, staying on the filesystem of the analyzed directory (du -x)
+# - Per-directory results cached and reused while the directory mtime is
+#   unchanged, so drilling into an analyzed tree does not rescan it
+# - Scans run in the background; callers poll for progress
+# - Top-N largest children (subdirectories and files) at any level
+#
+# Reuse is per directory: a file growing in place does not change its parent's
+# mtime, so such changes are picked up by a refresh (full rescan).
+
+import os
+import stat
+import time
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+
+MAX_TOP = 200
+
+
+class _DirNode:
+    """Cached scan of one directory plus the recursive totals of its subtree."""
+
+    __slots__ = (
+        "mtime_ns", "inode", "checked_at",
+        "own_size", "own_apparent", "own_files", "file_size", "file_apparent",
+        "subdirs", "mounts", "top_files", "errors",
+        "size", "apparent_size", "files", "dirs", "total_errors", "totaled_at",
+    )
+
+    def __init__(self, st):
+        self.mtime_ns = st.st_mtime_ns
+        self.inode = (st.st_dev, st.st_ino)
+        self.checked_at = time.monotonic()
+        self.own_size = 0
+        self.own_apparent = 0
+        self.own_files = 0
+        # Direct files only: own_size also holds the directory's own blocks
+        self.file_size = 0
+        self.file_apparent = 0
+        self.subdirs = ()
+        self.mounts = ()
+        # Largest direct files as (size, apparent_size, name)
+        self.top_files = ()
+        self.errors = 0
+        self.size = 0
+        self.apparent_size = 0
+        self.files = 0
+        self.dirs = 0
+        self.total_errors = 0
+        self.totaled_at = None
+
+
+def _scan_dir(path, st, top_files):
+    """List one directory (no recursion). Blocking."""
+    node = _DirNode(st)
+    # The directory's own blocks count too, as in du
+    node.own_size = st.st_blocks * 512
+    node.own_apparent = st.st_size
+    subdirs = []
+    mounts = []
+    largest = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    est = entry.stat(follow_symlinks=False)
+                except OSError:
+                    node.errors += 1
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if est.st_dev == st.st_dev:
+                        subdirs.append(entry.name)
+                    else:
+                        mounts.append(entry.name)
+                    continue
+                # Allocated blocks, like du: sparse files count what they use
+                size = est.st_blocks * 512
+                node.file_size += size
+                node.file_apparent += est.st_size
+                node.own_files += 1
+                item = (size, est.st_size, entry.name)
+                if len(largest) < top_files:
+                    heapq.heappush(largest, item)
+                elif item > largest[0]:
+                    heapq.heapreplace(largest, item)
+    except OSError as e:
+        # Permission denied, or removed while scanning
+        config.logger.debug(f"Storage scan skipped {path}: {e}")
+        node.errors += 1
+    node.own_size += node.file_size
+    node.own_apparent += node.file_apparent
+    node.subdirs = tuple(subdirs)
+    node.mounts = tuple(mounts)
+    node.top_files = tuple(sorted(largest, reverse=True))
+    return node
+
+
+class StorageAnalyzer:
+    """Background recursive size analysis with a per-directory cache."""
+
+    def __init__(self, workers=None, revalidate_after=None, max_cached_dirs=None, top_files=None):
+        self.revalidate_after = revalidate_after or config.STORAGE_REVALIDATE_AFTER
+        self.max_cached_dirs = max_cached_dirs or config.STORAGE_MAX_CACHED_DIRS
+        self.top_files = top_files or config.STORAGE_TOP_FILES_PER_DIR
+        self._nodes = {}
+        self._scans = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or config.STORAGE_SCAN_WORKERS, thread_name_prefix="storage-scan"
+        )
+        # Coordinators wait on the pool, so they must not run inside it
+        self._coordinators = ThreadPoolExecutor(max_workers=2, thread_name_prefix="storage-analyze")
+
+    def start(self, path, refresh=False):
+        """Start (or join) an analysis of ``path``.
+
+        Returns:
+            (concurrent.futures.Future, dict): the analysis, done when the
+            totals of ``path`` are available, and its live progress counters
+        """
+        path = os.path.realpath(path)
+        with self._lock:
+            running = self._scans.get(path)
+            if running is not None:
+                return running
+            node = self._nodes.get(path)
+            if not refresh and node is not None and node.totaled_at is not None \
+                    and time.monotonic() - node.totaled_at < self.revalidate_after:
+                done = Future()
+                done.set_result(path)
+                return done, {"dirs": node.dirs + 1, "scanned": 0}
+            progress = {"dirs": 0, "scanned": 0}
+            future = self._coordinators.submit(self._analyze, path, refresh, progress)
+            self._scans[path] = (future, progress)
+        future.add_done_callback(lambda _: self._finish(path))
+        return future, progress
+
+    def _finish(self, path):
+        with self._lock:
+            self._scans.pop(path, None)
+
+    def _visit(self, path, refresh):
+        """Return (node, scanned) for ``path``, scanning only when the cache is stale."""
+        node = self._nodes.get(path)
+        if node is not None and not refresh:
+            if time.monotonic() - node.checked_at < self.revalidate_after:
+                return node, False
+            try:
+                st = os.lstat(path)
+            except OSError:
+                st = None
+            if st is not None and st.st_mtime_ns == node.mtime_ns and (st.st_dev, st.st_ino) == node.inode:
+                node.checked_at = time.monotonic()
+                return node, False
+        try:
+            st = os.lstat(path)
+        except OSError as e:
+            config.logger.debug(f"Storage scan skipped {path}: {e}")
+            with self._lock:
+                self._nodes.pop(path, None)
+            return None, False
+        node = _scan_dir(path, st, self.top_files)
+        with self._lock:
+            self._nodes[path] = node
+        return node, True
+
+    def _analyze(self, root, refresh, progress):
+        # Raises FileNotFoundError / NotADirectoryError for a bad path
+        if not stat.S_ISDIR(os.stat(root).st_mode):
+            raise NotADirectoryError(root)
+        started = time.monotonic()
+        visited = []
+        pending = {self._pool.submit(self._visit, root, refresh): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                node, scanned = future.result()
+                if node is None:
+                    continue
+                visited.append((path, node))
+                progress["dirs"] += 1
+                progress["scanned"] += scanned
+                for name in node.subdirs:
+                    child = os.path.join(path, name)
+                    pending[self._pool.submit(self._visit, child, refresh)] = child
+
+        # Totals bottom-up: deepest directories first
+        visited.sort(key=lambda item: item[0].count(os.sep), reverse=True)
+        now = time.monotonic()
+        for path, node in visited:
+            node.size = node.own_size
+            node.apparent_size = node.own_apparent
+            node.files = node.own_files
+            node.dirs = 0
+            node.total_errors = node.errors
+            for name in node.subdirs:
+                child = self._nodes.get(os.path.join(path, name))
+                if child is None:
+                    continue
+                node.size += child.size
+                node.apparent_size += child.apparent_size
+                node.files += child.files
+                node.dirs += child.dirs + 1
+                node.total_errors += child.total_errors
+            node.totaled_at = now
+        config.logger.info(
+            f"Storage analysis of {root}: {progress['dirs']} dirs, {progress['scanned']} scanned, "
+            f"{time.monotonic() - started:.2f}s"
+        )
+        self._prune(root)
+        return root
+
+    def _prune(self, root):
+        """Keep the cache within max_cached_dirs, preferring the latest tree."""
+        prefix = root.rstrip(os.sep) + os.sep
+        # Scan workers of another analysis may be adding nodes meanwhile
+        with self._lock:
+            if len(self._nodes) <= self.max_cached_dirs:
+                return
+            for path in [p for p in self._nodes if p != root and not p.startswith(prefix)]:
+                del self._nodes[path]
+
+    def usage(self, path, top=20):
+        """Return the totals of an analyzed ``path`` and its ``top`` largest children.
+
+        Children are subdirectories and the largest direct files; the
+        remaining direct files are summed into ``other_files``. Directories
+        on another filesystem are listed with ``mount: true`` and no size.
+        """
+        path = os.path.realpath(path)
+        top = max(1, min(int(top), MAX_TOP))
+        node = self._nodes.get(path)
+        if node is None or node.totaled_at is None:
+            return None
+        children = []
+        for name in node.subdirs:
+            child = self._nodes.get(os.path.join(path, name))
+            if child is None:
+                continue
+            children.append({
+                "name": name, "is_dir": True, "size": child.size, "apparent_size": child.apparent_size,
+                "files": child.files, "dirs": child.dirs,
+            })
+        for size, apparent, name in node.top_files:
+            children.append({"name": name, "is_dir": False, "size": size, "apparent_size": apparent})
+        children.sort(key=lambda child: child["size"], reverse=True)
+        children = children[:top]
+        # Files cut by ``top`` are counted in other_files with the rest
+        listed = [child for child in children if not child["is_dir"]]
+        listed_size = sum(child["size"] for child in listed)
+        listed_apparent = sum(child["apparent_size"] for child in listed)
+        children.extend(
+            {"name": name, "is_dir": True, "mount": True, "size": None, "apparent_size": None}
+            for name in node.mounts
+        )
+        other_count = node.own_files - len(listed)
+        return {
+            "path": path,
+            "size": node.size,
+            "apparent_size": node.apparent_size,
+            "files": node.files,
+            "dirs": node.dirs,
+            "errors": node.total_errors,
+            "children": children,
+            "other_files": {
+                "count": other_count,
+                "size": node.file_size - listed_size,
+                "apparent_size": node.file_apparent - listed_apparent,
+            } if other_count else None,
+            "age": round(time.monotonic() - node.totaled_at, 1),
+        }
@@ -0,0 +1,279 @@
+# text_reader.py - Ranged reads of large text files for decky-send
+#
+# This module serves parts of files too large to send whole (system logs,
+# Proton logs) with bounded memory:
+# - Text / binary detection from the first few KB only
+# - Byte ranges, line ranges and tail reads, cut at UTF-8 character boundaries
+# - A sparse line index (newlines counted per 1 MiB block) built lazily, only
+#   as far as the requested line, and cached per file identity (inode, size,
+#   mtime); a line is then found by reading at most one block before it
+
+import os
+import bisect
+import codecs
+import threading
+from array import array
+from collections import OrderedDict
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import file_writer
+
+_SNIFF_BYTES = 8192
+_BLOCK = 1024 * 1024
+
+# Control bytes allowed in text: tab, newline, form feed, carriage return, escape (ANSI colors)
+_TEXT_CONTROLS = b"\t\n\f\r\x1b"
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in _TEXT_CONTROLS)
+
+
+class BinaryFileError(ValueError):
+    """The file does not look like text."""
+
+
+def is_text(head):
+    """Guess from the first bytes of a file whether it is text."""
+    if not head:
+        return True
+    if b"\0" in head:
+        return False
+    try:
+        # A multi-byte character cut off at the end of the sample is fine
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return True
+    except UnicodeDecodeError:
+        pass
+    # Legacy 8-bit text (latin-1 / GBK logs) is shown with replacement characters
+    controls = len(head) - len(head.translate(None, _CONTROL_BYTES))
+    return controls / len(head) < 0.05
+
+
+def _decode(data, at_eof):
+    """Decode ``data`` as UTF-8 without splitting characters.
+
+    Returns:
+        (str, int, int): text, bytes skipped at the start (continuation bytes
+        of a character that began before the range), bytes consumed in total
+    """
+    skip = 0
+    while skip < min(3, len(data)) and 0x80 <= data[skip] <= 0xBF:
+        skip += 1
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = decoder.decode(data[skip:], final=at_eof)
+    pending = len(decoder.getstate()[0])
+    return text, skip, len(data) - pending
+
+
+class _LineIndex:
+    """Newline counts at every _BLOCK boundary of one version of a file."""
+
+    __slots__ = ("identity", "counts", "newlines", "lock")
+
+    def __init__(self, identity):
+        self.identity = identity
+        # Serializes extend() for this file only; other files are not held up
+        self.lock = threading.Lock()
+        # counts[i] = newlines in bytes [0, i * _BLOCK)
+        self.counts = array("q", [0])
+        # Total newlines once the whole file has been counted
+        self.newlines = None
+
+    def extend(self, fd, until_newlines=None):
+        """Count blocks until ``until_newlines`` newlines are passed, or to the end."""
+        while self.newlines is None and (until_newlines is None or self.counts[-1] <= until_newlines):
+            offset = (len(self.counts) - 1) * _BLOCK
+            data = os.pread(fd, _BLOCK, offset)
+            if len(data) < _BLOCK:
+                self.newlines = self.counts[-1] + data.count(b"\n")
+            else:
+                self.counts.append(self.counts[-1] + data.count(b"\n"))
+
+    def line_start(self, fd, line):
+        """Byte offset where 1-based ``line`` starts, or None past the end."""
+        if line <= 1:
+            return 0
+        self.extend(fd, line - 1)
+        # The block holding the (line - 1)th newline: the last one that starts
+        # with fewer newlines before it, so at least one is found inside it
+        block = bisect.bisect_left(self.counts, line - 1) - 1
+        offset = block * _BLOCK
+        skip = line - 1 - self.counts[block]
+        data = os.pread(fd, _BLOCK, offset)
+        pos = -1
+        for _ in range(skip):
+            pos = data.find(b"\n", pos + 1)
+            if pos < 0:
+                return None
+        return offset + pos + 1
+
+    def total_lines(self, size, ends_with_newline):
+        if self.newlines is None:
+            return None
+        return self.newlines + (1 if size and not ends_with_newline else 0)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _line_index(st):
+    """Cached index for this version of the file.
+
+    Only the cache lookup holds _indexes_lock; counting newlines happens under
+    the index's own lock, so a slow file never blocks reads of other files.
+    """
+    key = (st.st_dev, st.st_ino)
+    identity = (st.st_size, st.st_mtime_ns)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or index.identity != identity:
+            index = _LineIndex(identity)
+            _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > config.READ_LINE_INDEX_CACHE_ENTRIES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _read_lines_from(fd, offset, size, max_lines, max_bytes):
+    """Read up to ``max_lines`` lines from ``offset``; returns (bytes, lines)."""
+    parts = []
+    total = 0
+    lines = 0
+    while offset < size and lines < max_lines and total < max_bytes:
+        data = os.pread(fd, min(_BLOCK, max_bytes - total), offset)
+        if not data:
+            break
+        pos = -1
+        while lines < max_lines:
+            pos = data.find(b"\n", pos + 1)
+            if pos < 0:
+                break
+            lines += 1
+        if lines == max_lines and pos >= 0:
+            data = data[:pos + 1]
+        parts.append(data)
+        total += len(data)
+        offset += len(data)
+    data = b"".join(parts)
+    if data and not data.endswith(b"\n"):
+        # A last line without its newline (end of file, or the byte limit)
+        lines += 1
+    return data, lines
+
+
+def _tail_start(fd, size, max_lines, max_bytes):
+    """Byte offset of the last ``max_lines`` lines (or of the last max_bytes)."""
+    limit = max(size - max_bytes, 0)
+    end = size
+    # A trailing newline ends the last line rather than starting an empty one
+    if size and os.pread(fd, 1, size - 1) == b"\n":
+        end -= 1
+    wanted = max_lines
+    while end > limit:
+        start = max(end - _BLOCK, limit)
+        data = os.pread(fd, end - start, start)
+        pos = len(data)
+        while True:
+            pos = data.rfind(b"\n", 0, pos)
+            if pos < 0:
+                break
+            wanted -= 1
+            if wanted == 0:
+                return start + pos + 1
+        end = start
+    if limit == 0:
+        return 0
+    # Cut by max_bytes: start at the first whole line
+    pos = os.pread(fd, min(_BLOCK, size - limit), limit).find(b"\n")
+    return limit + pos + 1 if pos >= 0 else limit
+
+
+def read_range(path, offset=None, length=None, line=None, lines=None, tail=None):
+    """Read part of a text file. Blocking.
+
+    Exactly one mode applies: ``tail`` (last N lines), ``line`` (``lines``
+    lines from 1-based ``line``) or ``offset`` (``length`` bytes). Responses
+    are capped at config.READ_RANGE_MAX_BYTES; ``next_offset`` is where to
+    continue. ``line`` and ``total_lines`` are None until the line index has
+    reached them.
+
+    Raises:
+        BinaryFileError: the file does not look like text
+        OSError: the file cannot be opened or read
+    """
+    max_bytes = config.READ_RANGE_MAX_BYTES
+    max_lines = config.READ_RANGE_MAX_LINES
+    with open(path, "rb") as f:
+        fd = f.fileno()
+        st = os.fstat(fd)
+        size = st.st_size
+        if not is_text(os.pread(fd, _SNIFF_BYTES, 0)):
+            raise BinaryFileError(path)
+        ends_with_newline = size > 0 and os.pread(fd, 1, size - 1) == b"\n"
+        start_line = None
+        index = _line_index(st)
+        if size <= _BLOCK:
+            # One read: small files always report line numbers
+            with index.lock:
+                index.extend(fd)
+        if tail is not None:
+            count = max(1, min(int(tail), max_lines))
+            start = _tail_start(fd, size, count, max_bytes)
+            data, returned = _read_lines_from(fd, start, size, count, max_bytes)
+            total = index.total_lines(size, ends_with_newline)
+            if start == 0:
+                start_line = 1
+            elif total is not None:
+                start_line = total - returned + 1
+        elif line is not None:
+            start_line = max(1, int(line))
+            count = max(1, min(int(lines or max_lines), max_lines))
+            with index.lock:
+                start = index.line_start(fd, start_line)
+            if start is None:
+                start, data, returned = size, b"", 0
+            else:
+                data, returned = _read_lines_from(fd, start, size, count, max_bytes)
+            total = index.total_lines(size, ends_with_newline)
+        else:
+            start = max(0, min(int(offset or 0), size))
+            count = max(0, min(int(max_bytes if length is None else length), max_bytes))
+            data = os.pread(fd, count, start)
+            returned = None
+            total = index.total_lines(size, ends_with_newline)
+    text, skipped, consumed = _decode(data, start + len(data) >= size)
+    return {
+        "content": text,
+        "encoding": "utf-8",
+        "size": size,
+        "offset": start + skipped,
+        "next_offset": start + consumed,
+        "eof": start + consumed >= size,
+        "line": start_line,
+        "lines": returned,
+        "total_lines": total,
+        "version": file_writer.version_token(st),
+    }
+
+
+def read_whole(path):
+    """Read a whole text file for editing. Blocking.
+
+    Returns:
+        (str | None, str): the content, or None if the file exceeds
+        config.READ_WHOLE_MAX_BYTES (the caller asks for a range instead),
+        and the version to base edits on (see file_writer)
+
+    Raises:
+        BinaryFileError: the file does not look like text
+        UnicodeDecodeError: the file is not valid UTF-8
+    """
+    with open(path, "rb") as f:
+        fd = f.fileno()
+        if not is_text(os.pread(fd, _SNIFF_BYTES, 0)):
+            raise BinaryFileError(path)
+        st = os.fstat(fd)
+        if st.st_size > config.READ_WHOLE_MAX_BYTES:
+            return None, file_writer.version_token(st)
+        return f.read().decode("utf-8"), file_writer.version_token(st)
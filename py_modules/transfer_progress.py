@@ -0,0 +1,182 @@
+# transfer_progress.py - Aggregated transfer progress for decky-send
+#
+# This module replaces per-request progress emits with one publisher:
+# - Upload handlers update byte counters synchronously (no await, no event)
+# - A single task publishes a coalesced snapshot of all active transfers at a
+#   fixed rate, only when something changed
+# - The legacy transfer_status event is derived from the same snapshot
+
+import time
+import asyncio
+import itertools
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+
+# Weight of the newest interval in the smoothed per-transfer speed
+_SPEED_SMOOTHING = 0.5
+
+
+class _Transfer:
+    __slots__ = ("label", "total", "transferred", "start_time", "sample_time", "sample_bytes", "speed")
+
+    def __init__(self, label, total, now):
+        self.label = label
+        self.total = total
+        self.transferred = 0
+        self.start_time = now
+        self.sample_time = now
+        self.sample_bytes = 0
+        self.speed = 0.0
+
+
+class ProgressBus:
+    """Collects progress of all active transfers and publishes it periodically.
+
+    Each publish calls ``publish(events)`` once with a list of
+    ``(event, payload)`` pairs:
+
+    - ``transfer_progress``: ``[{"id", "label", "total", "transferred",
+      "speed", "eta"}, ...]`` for every active transfer
+    - ``transfer_status``: ``[label, total, transferred, speed, eta]``, the
+      single transfer or the sum of all of them, for existing listeners
+    """
+
+    def __init__(self, publish, interval=0.5):
+        """
+        Args:
+            publish: Coroutine function taking a list of (event, payload)
+            interval: Seconds between snapshots while transfers are active
+        """
+        self._publish = publish
+        self.interval = interval
+        self._transfers = {}
+        self._ids = itertools.count(1)
+        self._changed = False
+        self._task = None
+
+    def begin(self, label, total=0, transfer_id=None, transferred=0):
+        """Register a transfer and return its id.
+
+        Args:
+            label: Name shown for the transfer
+            total: Expected size in bytes (0 if unknown)
+            transfer_id: Caller-chosen id, e.g. a chunked upload id; a new one
+                is generated if omitted
+            transferred: Bytes already transferred (resumed uploads)
+        """
+        if transfer_id is None:
+            transfer_id = next(self._ids)
+        transfer = _Transfer(label, total, time.monotonic())
+        transfer.transferred = transfer.sample_bytes = transferred
+        self._transfers[transfer_id] = transfer
+        self._changed = True
+        self._ensure_publisher()
+        return transfer_id
+
+    def add(self, transfer_id, nbytes):
+        """Count ``nbytes`` more (or, if negative, fewer) transferred bytes."""
+        transfer = self._transfers.get(transfer_id)
+        if transfer is not None:
+            transfer.transferred += nbytes
+            self._changed = True
+
+    def update(self, transfer_id, transferred, total=None, label=None):
+        """Record the bytes transferred so far; never blocks or awaits."""
+        transfer = self._transfers.get(transfer_id)
+        if transfer is None:
+            return
+        transfer.transferred = transferred
+        if total is not None:
+            transfer.total = total
+        if label is not None:
+            transfer.label = label
+        self._changed = True
+
+    def end(self, transfer_id):
+        """Forget a finished or failed transfer."""
+        if self._transfers.pop(transfer_id, None) is not None:
+            self._changed = True
+
+    def __contains__(self, transfer_id):
+        return transfer_id in self._transfers
+
+    def __len__(self):
+        return len(self._transfers)
+
+    # -------------------------------------------------------------------------
+    # Publishing
+    # -------------------------------------------------------------------------
+
+    def _ensure_publisher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        # The first snapshot goes out right away so a new transfer is visible
+        # before the first interval has passed; once the last transfer ends,
+        # one more (empty) snapshot is published.
+        while True:
+            if self._changed:
+                self._changed = False
+                try:
+                    await self._publish(self.snapshot_events())
+                except Exception as e:
+                    config.logger.error(f"Progress publish failed: {e}")
+            if not self._transfers:
+                break
+            await asyncio.sleep(self.interval)
+
+    def snapshot(self):
+        """Return the current state of every active transfer."""
+        now = time.monotonic()
+        snapshot = []
+        for transfer_id, transfer in self._transfers.items():
+            elapsed = now - transfer.sample_time
+            # A stalled transfer decays towards zero once it has a first sample
+            first_sample = transfer.sample_time == transfer.start_time
+            if elapsed > 0 and (transfer.transferred != transfer.sample_bytes or not first_sample):
+                rate = max(transfer.transferred - transfer.sample_bytes, 0) / elapsed
+                if first_sample:
+                    transfer.speed = rate
+                else:
+                    transfer.speed += _SPEED_SMOOTHING * (rate - transfer.speed)
+                transfer.sample_time = now
+                transfer.sample_bytes = transfer.transferred
+            total = max(transfer.total, transfer.transferred)
+            eta = 0
+            if transfer.speed > 0 and total > transfer.transferred:
+                eta = int((total - transfer.transferred) / transfer.speed)
+            snapshot.append({
+                "id": transfer_id,
+                "label": transfer.label,
+                "total": total,
+                "transferred": transfer.transferred,
+                "speed": transfer.speed,
+                "eta": eta,
+            })
+        return snapshot
+
+    def snapshot_events(self):
+        snapshot = self.snapshot()
+        events = [("transfer_progress", snapshot)]
+        if snapshot:
+            if len(snapshot) == 1:
+                item = snapshot[0]
+                label = item["label"]
+            else:
+                label = f"{snapshot[0]['label']} 等 {len(snapshot)} 个传输"
+            total = sum(item["total"] for item in snapshot)
+            transferred = sum(item["transferred"] for item in snapshot)
+            speed = sum(item["speed"] for item in snapshot)
+            eta = int((total - transferred) / speed) if speed > 0 and total > transferred else 0
+            # NOTE: Decky frontend expects arguments wrapped in a list for destructuring
+            events.append(("transfer_status", [label, total, transferred, speed, eta]))
+        return events
+
+    async def close(self):
+        """Stop publishing."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._transfers.clear()
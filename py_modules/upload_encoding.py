@@ -0,0 +1,137 @@
+# upload_encoding.py - Streaming decompression of compressed upload bodies for decky-send
+#
+# This module lets upload handlers accept gzip/deflate (and zstd when the
+# optional zstandard package is installed) bodies and decode them slice by
+# slice while streaming to disk:
+# - Incremental decoders with a cap on decoded output (decompression bombs);
+#   zstd input is fed in small pieces so no call can inflate far past it
+# - Detection of truncated compressed streams
+# - Encoding name normalization and discovery of supported encodings
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# zstd input is fed in pieces of this size. A block needs at least 4 input
+# bytes and decodes to at most 128 KiB, so one call yields at most ~8 MiB.
+_ZSTD_FEED = 256
+# zlib output is produced in pieces of at most this size.
+_ZLIB_OUTPUT_LIMIT = 1024 * 1024
+
+
+class UnsupportedEncodingError(ValueError):
+    """Raised for an encoding this server cannot decode."""
+
+
+class UploadDecodeError(ValueError):
+    """Raised when decoded data exceeds the expected size or is malformed."""
+
+
+def normalize_encoding(encoding):
+    """Return the canonical encoding name, or None for an identity body."""
+    name = (encoding or "").strip().lower()
+    if name in ("", "identity", "none"):
+        return None
+    if name in ("gzip", "x-gzip"):
+        return "gzip"
+    if name == "deflate":
+        return "deflate"
+    if name in ("zstd", "zstandard"):
+        return "zstd"
+    raise UnsupportedEncodingError(name)
+
+
+def supported_encodings():
+    encodings = ["identity", "gzip", "deflate"]
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+class StreamDecoder:
+    """Incremental decoder for one compressed upload body (or chunk).
+
+    ``decode`` returns the decoded bytes of each received slice; pass
+    ``final=True`` with the last slice so a truncated stream is rejected.
+    Decoded output beyond ``max_output`` bytes raises UploadDecodeError as soon
+    as it is produced rather than after the whole body was inflated.
+    """
+
+    def __init__(self, encoding, max_output=None):
+        self.encoding = normalize_encoding(encoding)
+        if self.encoding is None:
+            raise UnsupportedEncodingError("identity")
+        self.max_output = max_output
+        self.output_size = 0
+        if self.encoding == "zstd":
+            if zstandard is None:
+                raise UnsupportedEncodingError("zstd")
+            self._zstd = zstandard.ZstdDecompressor().decompressobj()
+            self._zlib = None
+        else:
+            # gzip: header + trailer; deflate: zlib-wrapped per HTTP, raw as fallback
+            self._zlib = zlib.decompressobj(31 if self.encoding == "gzip" else 15)
+            self._zstd = None
+            self._raw_deflate_checked = self.encoding == "gzip"
+
+    def _account(self, data):
+        self.output_size += len(data)
+        if self.max_output is not None and self.output_size > self.max_output:
+            raise UploadDecodeError(f"decoded size exceeds {self.max_output} bytes")
+        return data
+
+    def _decode_zlib(self, data):
+        if not self._raw_deflate_checked and data:
+            self._raw_deflate_checked = True
+            # Some clients send raw deflate despite the zlib framing HTTP asks for.
+            if (data[0] & 0x0F) != 8:
+                self._zlib = zlib.decompressobj(-15)
+        pieces = []
+        while data:
+            limit = _ZLIB_OUTPUT_LIMIT
+            if self.max_output is not None:
+                limit = min(limit, self.max_output - self.output_size + 1)
+            piece = self._zlib.decompress(data, max(limit, 1))
+            pieces.append(self._account(piece))
+            if self._zlib.eof:
+                if self._zlib.unused_data.strip(b"\0"):
+                    raise UploadDecodeError("trailing data after compressed stream")
+                break
+            data = self._zlib.unconsumed_tail
+        return b"".join(pieces)
+
+    def _decode_zstd(self, data):
+        # The zstd API has no limit on the output of one call, so the size
+        # check runs after every small piece of input.
+        view = memoryview(data)
+        pieces = []
+        for start in range(0, len(view), _ZSTD_FEED):
+            pieces.append(self._account(self._zstd.decompress(view[start:start + _ZSTD_FEED])))
+        return b"".join(pieces)
+
+    def decode(self, data, final=False):
+        """Decode one received slice (bytes-like); raises UploadDecodeError on bad input."""
+        try:
+            if self._zstd is not None:
+                decoded = self._decode_zstd(data)
+                if final and not self._zstd.eof:
+                    raise UploadDecodeError("truncated zstd stream")
+            else:
+                decoded = self._decode_zlib(data)
+                if final:
+                    decoded += self._account(self._zlib.flush())
+                if final and not self._zlib.eof:
+                    raise UploadDecodeError(f"truncated {self.encoding} stream")
+        except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as e:
+            raise UploadDecodeError(f"invalid {self.encoding} data: {e}") from e
+        return decoded
+
+
+def make_decoder(encoding, max_output=None):
+    """Return a StreamDecoder, or None for an identity (uncompressed) body."""
+    if normalize_encoding(encoding) is None:
+        return None
+    return StreamDecoder(encoding, max_output)
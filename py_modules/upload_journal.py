@@ -0,0 +1,128 @@
+# upload_journal.py - Crash-safe journal of chunked upload sessions for decky-send
+#
+# This module persists chunked upload session state so resumes survive plugin
+# reloads, Decky restarts and server restarts:
+# - Session metadata and a received-chunk bitmap per upload
+# - Batched writes (at most one rewrite per flush interval)
+# - fdatasync of the temp files before the journal that vouches for them
+# - Atomic replace of the journal file
+
+import os
+import json
+import asyncio
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+import utils
+
+
+class UploadJournal:
+    """On-disk journal of chunked upload sessions.
+
+    Entries are plain dicts produced by the upload handlers. ``record`` only
+    marks an upload dirty; the journal is rewritten once per flush interval so
+    a burst of chunks costs one write and one fsync, not one per chunk.
+    """
+
+    def __init__(self, path=None, flush_interval=None):
+        self.path = path or config.UPLOAD_JOURNAL_PATH
+        self.flush_interval = (
+            config.UPLOAD_JOURNAL_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        )
+        self._entries = {}
+        self._dirty = {}
+        self._removed = False
+        self._flush_task = None
+        self._flush_lock = None
+
+    def load(self):
+        """Read journal entries from disk.
+
+        Returns:
+            dict: upload_id -> entry dict (empty if the journal is missing or invalid)
+        """
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            config.logger.warning(f"Ignoring unreadable upload journal {self.path}: {e}")
+            return {}
+        sessions = data.get("sessions") if isinstance(data, dict) else None
+        if not isinstance(sessions, dict):
+            return {}
+        self._entries = {
+            str(upload_id): entry for upload_id, entry in sessions.items() if isinstance(entry, dict)
+        }
+        return dict(self._entries)
+
+    def record(self, upload_id, snapshot):
+        """Mark an upload as changed.
+
+        Args:
+            upload_id: Upload session id
+            snapshot: Callable evaluated at flush time, returning ``(entry, fd)``
+                where fd is a descriptor of the temp file to fdatasync first (or
+                None). The journal owns it and closes it after the sync, so the
+                session may close its own descriptor at any time meanwhile.
+        """
+        self._dirty[upload_id] = snapshot
+        self._schedule_flush()
+
+    def forget(self, upload_id):
+        """Drop an upload from the journal (finished, failed or expired)."""
+        self._dirty.pop(upload_id, None)
+        if self._entries.pop(upload_id, None) is not None:
+            self._removed = True
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_after_delay())
+
+    async def _flush_after_delay(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if not self._dirty and not self._removed:
+                return
+
+    async def flush(self):
+        """Persist pending changes now."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty and not self._removed:
+                return
+            dirty, self._dirty = self._dirty, {}
+            self._removed = False
+            fds = []
+            for upload_id, snapshot in dirty.items():
+                try:
+                    self._entries[upload_id], fd = snapshot()
+                except Exception as e:
+                    config.logger.error(f"Failed to snapshot upload session {upload_id}: {e}")
+                    continue
+                if fd is not None:
+                    fds.append(fd)
+            payload = {"version": 1, "sessions": dict(self._entries)}
+            try:
+                await asyncio.to_thread(self._write, payload, fds)
+            except Exception as e:
+                config.logger.error(f"Failed to write upload journal {self.path}: {e}")
+
+    def _write(self, payload, fds):
+        # Chunk data must be durable before the journal claims it was received.
+        for fd in fds:
+            try:
+                os.fdatasync(fd)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+        utils.write_json_atomic(self.path, payload)
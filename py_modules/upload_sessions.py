@@ -0,0 +1,425 @@
+# upload_sessions.py - Chunked upload session state for decky-send
+#
+# This module provides the per-upload session object used by the chunked
+# upload handlers:
+# - Compact __slots__ session with a bytearray received-chunk bitmap
+# - Range-encoded received/missing chunk lists for resume responses
+# - Temp file descriptor ownership, reference counted by chunk writers
+# - Journal entry (de)serialization
+# - Session registry with per-upload locks and deadline-based expiry
+# - Finished uploads remembered for late duplicate chunks
+
+import os
+import time
+import errno
+import heapq
+import base64
+import asyncio
+import contextlib
+from collections import OrderedDict
+
+# Finished uploads remembered per registry for late duplicate chunks
+_FINISHED_LIMIT = 256
+
+
+def _bits_to_ranges(bitmap, total, want_set):
+    """Return inclusive ``[first, last]`` runs of chunks whose bit equals want_set."""
+    ranges = []
+    run_start = None
+    full_byte = 0xFF if want_set else 0x00
+    index = 0
+    while index < total:
+        byte_index = index >> 3
+        # Whole bytes that continue (or never start) a run are skipped at once.
+        if index & 7 == 0 and index + 8 <= total:
+            byte = bitmap[byte_index]
+            if byte == full_byte:
+                if run_start is None:
+                    run_start = index
+                index += 8
+                continue
+            if byte == (0xFF ^ full_byte) and run_start is None:
+                index += 8
+                continue
+        bit_set = bool(bitmap[byte_index] & (1 << (index & 7)))
+        if bit_set == want_set:
+            if run_start is None:
+                run_start = index
+        elif run_start is not None:
+            ranges.append([run_start, index - 1])
+            run_start = None
+        index += 1
+    if run_start is not None:
+        ranges.append([run_start, total - 1])
+    return ranges
+
+
+class UploadSession:
+    """State of one chunked upload.
+
+    Received chunks are tracked in a bitmap (one bit per chunk), so a 100 GB
+    upload at 8 MB chunks costs 1.6 KB instead of a 12,800-entry set.
+    """
+
+    __slots__ = (
+        "file_path",
+        "temp_path",
+        "filename",
+        "expected_hash",
+        "hash_algo",
+        "total_chunks",
+        "total_size",
+        "chunk_size",
+        "bitmap",
+        "received_count",
+        "received_bytes",
+        "start_time",
+        "last_update",
+        "fd",
+        "rolling_hash",
+        "finalizing",
+        "writers",
+        "closed",
+        "idle",
+    )
+
+    def __init__(self, file_path, temp_path, filename, expected_hash, hash_algo,
+                 total_chunks, total_size, chunk_size, now, rolling_hash=None):
+        self.file_path = file_path
+        self.temp_path = temp_path
+        self.filename = filename
+        self.expected_hash = expected_hash
+        self.hash_algo = hash_algo
+        self.total_chunks = int(total_chunks)
+        self.total_size = int(total_size)
+        self.chunk_size = int(chunk_size)
+        self.bitmap = bytearray((self.total_chunks + 7) // 8)
+        self.received_count = 0
+        self.received_bytes = 0
+        self.start_time = now
+        self.last_update = now
+        self.fd = None
+        self.rolling_hash = rolling_hash
+        self.finalizing = False
+        self.writers = 0
+        self.closed = False
+        self.idle = None
+
+    # -------------------------------------------------------------------------
+    # Chunk bookkeeping
+    # -------------------------------------------------------------------------
+
+    def has_chunk(self, index):
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def mark_received(self, index, length):
+        """Record a chunk as received.
+
+        Returns:
+            bool: True if the chunk was new, False if it had been received before
+        """
+        mask = 1 << (index & 7)
+        if self.bitmap[index >> 3] & mask:
+            return False
+        self.bitmap[index >> 3] |= mask
+        self.received_count += 1
+        self.received_bytes += length
+        return True
+
+    def is_complete(self):
+        return self.received_count >= self.total_chunks
+
+    def chunk_length(self, index):
+        """Expected byte length of a chunk (chunk_size unless it is the last one)."""
+        if self.total_size <= 0:
+            return self.chunk_size
+        return max(min(self.chunk_size, self.total_size - index * self.chunk_size), 0)
+
+    def received_indexes(self):
+        return [index for index in range(self.total_chunks) if self.has_chunk(index)]
+
+    def received_ranges(self):
+        return _bits_to_ranges(self.bitmap, self.total_chunks, True)
+
+    def missing_ranges(self):
+        return _bits_to_ranges(self.bitmap, self.total_chunks, False)
+
+    # -------------------------------------------------------------------------
+    # Temp file descriptor
+    # -------------------------------------------------------------------------
+
+    def open_fd(self):
+        """Return the temp file descriptor, opening it on first use.
+
+        One descriptor is shared by every chunk request of the upload and is
+        closed when the session is finalized, reset or expired. A closed
+        session never reopens (and so never recreates) its temp file.
+        """
+        if self.fd is None:
+            if self.closed:
+                raise OSError(errno.EBADF, "Upload session is closed", self.temp_path)
+            self.fd = os.open(self.temp_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self.fd
+
+    def dup_fd(self):
+        """Return a private copy of the open descriptor, or None once it is closed.
+
+        Background readers close the copy themselves, so closing the session
+        never pulls the descriptor (or a reused number) out from under them.
+        """
+        if self.fd is None:
+            return None
+        return os.dup(self.fd)
+
+    def close_fd(self):
+        """Stop taking chunks and close the descriptor once no writer uses it."""
+        self.closed = True
+        if self.writers == 0:
+            self._close()
+
+    def _close(self):
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    # -------------------------------------------------------------------------
+    # Chunk writers
+    # -------------------------------------------------------------------------
+
+    def acquire_writer(self):
+        """Take a reference on the temp file for one chunk request.
+
+        While any writer holds a reference the descriptor stays open, so a
+        reset or finalize never closes it (or lets its number be reused) under
+        a pwrite in flight.
+
+        Returns:
+            bool: False if the session is finalizing or closed; the chunk is refused
+        """
+        if self.finalizing or self.closed:
+            return False
+        self.writers += 1
+        return True
+
+    def release_writer(self):
+        """Drop a writer reference; the last one closes a descriptor close_fd deferred."""
+        self.writers -= 1
+        if self.writers == 0 and self.closed:
+            self._close()
+        if self.idle is not None:
+            self.idle.set()
+
+    async def wait_for_writers(self, remaining=1):
+        """Wait until at most ``remaining`` writers (the caller's own) are left."""
+        while self.writers > remaining:
+            self.idle = asyncio.Event()
+            await self.idle.wait()
+        self.idle = None
+
+    # -------------------------------------------------------------------------
+    # Journal serialization
+    # -------------------------------------------------------------------------
+
+    def to_journal_entry(self):
+        """Return ``(entry, fd)`` for upload_journal.UploadJournal.record.
+
+        fd is a duplicate handed over to the journal (None once the session's
+        descriptor is closed), so the journal never syncs a closed or reused
+        descriptor number.
+        """
+        entry = {
+            "file_path": self.file_path,
+            "temp_path": self.temp_path,
+            "filename": self.filename,
+            "expected_hash": self.expected_hash,
+            "hash_algo": self.hash_algo,
+            "total_chunks": self.total_chunks,
+            "total_size": self.total_size,
+            "chunk_size": self.chunk_size,
+            "received_bytes": self.received_bytes,
+            "last_update": self.last_update,
+            "received": base64.b64encode(bytes(self.bitmap)).decode("ascii"),
+        }
+        return entry, self.dup_fd()
+
+    @classmethod
+    def from_journal_entry(cls, entry, now, rolling_hash=None):
+        """Rebuild a session from a journal entry (raises on malformed entries)."""
+        session = cls(
+            entry["file_path"],
+            entry["temp_path"],
+            entry.get("filename") or os.path.basename(entry["file_path"]),
+            entry.get("expected_hash"),
+            entry.get("hash_algo"),
+            entry["total_chunks"],
+            entry.get("total_size") or 0,
+            entry["chunk_size"],
+            now,
+            rolling_hash,
+        )
+        bitmap = base64.b64decode(entry.get("received") or "")
+        if len(bitmap) != len(session.bitmap):
+            raise ValueError("bitmap size mismatch")
+        session.bitmap[:] = bitmap
+        # Stray bits past the last chunk would inflate the received count.
+        if session.total_chunks & 7 and session.bitmap:
+            session.bitmap[-1] &= (1 << (session.total_chunks & 7)) - 1
+        session.received_count = sum(bin(byte).count("1") for byte in session.bitmap)
+        session.received_bytes = int(entry.get("received_bytes") or 0)
+        return session
+
+
+class UploadSessionRegistry:
+    """Chunked upload sessions keyed by upload id.
+
+    Each upload gets its own lock, so chunk requests of different uploads never
+    wait on each other. Locks are reference counted and dropped once no
+    request holds a reference, so finished upload ids do not accumulate.
+    Expiry uses a heap of deadlines swept by a background task that only runs
+    while sessions exist; chunk requests just bump ``last_update`` and never
+    scan the registry. Finished uploads are remembered (bounded, for one TTL)
+    so a chunk retried after the upload completed gets the original answer
+    instead of starting a new upload.
+    """
+
+    def __init__(self, ttl, sweep_interval=60.0, on_expire=None):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.on_expire = on_expire
+        self._sessions = {}
+        self._locks = {}
+        self._deadlines = []
+        self._sweeper = None
+        self._finished = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, upload_id):
+        return self._sessions.get(upload_id)
+
+    def items(self):
+        return list(self._sessions.items())
+
+    def lock(self, upload_id):
+        """Return the lock serializing state changes of one upload.
+
+        Every call takes a reference to the lock; give it back with
+        ``release(upload_id)`` when the request is done with the upload.
+        """
+        entry = self._locks.get(upload_id)
+        if entry is None:
+            entry = self._locks[upload_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, upload_id):
+        """Drop a reference taken by ``lock``; the last one removes the lock."""
+        entry = self._locks.get(upload_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._locks[upload_id]
+
+    @contextlib.asynccontextmanager
+    async def locked(self, upload_id):
+        """Hold one upload's lock for the duration of a ``with`` block."""
+        lock = self.lock(upload_id)
+        try:
+            async with lock:
+                yield
+        finally:
+            self.release(upload_id)
+
+    def add(self, upload_id, session):
+        self._sessions[upload_id] = session
+        heapq.heappush(self._deadlines, (session.last_update + self.ttl, upload_id))
+        self._start_sweeper()
+        return session
+
+    def pop(self, upload_id):
+        """Remove an upload; its stale deadline entry is discarded when swept."""
+        return self._sessions.pop(upload_id, None)
+
+    def finish(self, upload_id, file_path, result):
+        """Remember a finalized upload's response while its file is unchanged."""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return
+        identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+        self._finished[upload_id] = (time.time() + self.ttl, file_path, identity, result)
+        self._finished.move_to_end(upload_id)
+        while len(self._finished) > _FINISHED_LIMIT:
+            self._finished.popitem(last=False)
+
+    def finished(self, upload_id, file_path):
+        """Response of a finished upload of file_path, or None if it is a new upload.
+
+        The upload counts as finished only while the file it produced is still
+        there unchanged; uploading it again after that starts over.
+        """
+        entry = self._finished.get(upload_id)
+        if entry is None:
+            return None
+        deadline, finished_path, identity, result = entry
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            st = None
+        if (deadline <= time.time() or finished_path != file_path or st is None
+                or (st.st_ino, st.st_size, st.st_mtime_ns) != identity):
+            del self._finished[upload_id]
+            return None
+        return result
+
+    def expire(self, now=None):
+        """Remove and return sessions idle for longer than the TTL.
+
+        Deadlines are pushed when a session is added; a session that has been
+        touched since is re-queued with its new deadline instead of expiring.
+        """
+        now = time.time() if now is None else now
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, upload_id = heapq.heappop(self._deadlines)
+            session = self._sessions.get(upload_id)
+            if session is None:
+                continue
+            deadline = session.last_update + self.ttl
+            if deadline > now:
+                heapq.heappush(self._deadlines, (deadline, upload_id))
+                continue
+            self.pop(upload_id)
+            expired.append((upload_id, session))
+        return expired
+
+    def _start_sweeper(self):
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while self._sessions:
+            await asyncio.sleep(self.sweep_interval)
+            for upload_id, session in self.expire():
+                if self.on_expire is not None:
+                    self.on_expire(upload_id, session)
+        # Drop deadlines left by finished uploads so the heap does not grow.
+        self._deadlines.clear()
+
+    def close(self):
+        """Stop the sweeper and release every session's temp file descriptor."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for session in self._sessions.values():
+            session.close_fd()
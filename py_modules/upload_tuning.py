@@ -0,0 +1,187 @@
+# upload_tuning.py - Upload plan recommendations for decky-send
+#
+# This module picks chunk size, parallel stream count and chunking threshold
+# for the web client instead of one fixed setting for every link and disk:
+# - Measured write throughput per destination filesystem (short fdatasync probe)
+# - Recent per-client network throughput from finished upload requests
+# - Plan derivation from the slower of the two
+
+import os
+import time
+import asyncio
+
+# NOTE: Direct import - Decky adds py_modules/ to sys.path
+import config
+
+MIB = 1024 * 1024
+
+# Defaults used while nothing has been measured (the web client's old constants)
+DEFAULT_CHUNK_SIZE = 8 * MIB
+DEFAULT_PARALLEL = 2
+DEFAULT_THRESHOLD = 512 * MIB
+
+MIN_CHUNK_SIZE = 4 * MIB
+MAX_CHUNK_SIZE = 64 * MIB
+MAX_PARALLEL = 4
+MIN_THRESHOLD = 64 * MIB
+MAX_THRESHOLD = 1024 * MIB
+
+# A chunk should take about this long per stream: long enough to amortize the
+# per-request overhead, short enough that a retry on a flaky link is cheap.
+_TARGET_CHUNK_SECONDS = 2.0
+# Files that take longer than this to send are chunked so they can resume.
+_TARGET_SIMPLE_UPLOAD_SECONDS = 20.0
+# Below this write rate (SD cards, USB sticks) parallel writers only thrash.
+_SLOW_DISK_BPS = 15 * MIB
+# Smoothing factor for the per-client throughput average.
+_EWMA_ALPHA = 0.3
+_MAX_TRACKED_CLIENTS = 32
+# Requests shorter than this say more about latency than throughput.
+_MIN_SAMPLE_BYTES = 1 * MIB
+
+
+def _nearest_existing_dir(path):
+    path = os.path.abspath(path)
+    while path and not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def _probe_write_throughput(directory, size):
+    """Write ``size`` bytes, fdatasync them and return bytes per second."""
+    probe_path = os.path.join(directory, f".decky-send-probe-{os.getpid()}")
+    data = os.urandom(size)
+    fd = os.open(probe_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        start = time.perf_counter()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fdatasync(fd)
+        elapsed = max(time.perf_counter() - start, 1e-6)
+    finally:
+        os.close(fd)
+        try:
+            os.remove(probe_path)
+        except OSError:
+            pass
+    return size / elapsed
+
+
+def _round_down_pow2(value):
+    result = 1
+    while result * 2 <= value:
+        result *= 2
+    return result
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class UploadTuner:
+    """Throughput measurements and the upload plans derived from them."""
+
+    def __init__(self, probe_size=None, probe_ttl=None):
+        self.probe_size = probe_size or config.UPLOAD_WRITE_PROBE_SIZE
+        self.probe_ttl = config.UPLOAD_WRITE_PROBE_TTL if probe_ttl is None else probe_ttl
+        # st_dev -> (bytes_per_second, measured_at)
+        self._disk_rates = {}
+        self._probes = {}
+        # client address -> smoothed single-stream bytes_per_second
+        self._client_rates = {}
+
+    # -------------------------------------------------------------------------
+    # Measurements
+    # -------------------------------------------------------------------------
+
+    def record_transfer(self, client, nbytes, seconds):
+        """Fold one finished upload request into the client's stream throughput."""
+        if not client or nbytes < _MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        sample = nbytes / seconds
+        previous = self._client_rates.pop(client, None)
+        if previous is not None:
+            sample = previous + _EWMA_ALPHA * (sample - previous)
+        self._client_rates[client] = sample
+        while len(self._client_rates) > _MAX_TRACKED_CLIENTS:
+            self._client_rates.pop(next(iter(self._client_rates)))
+
+    def client_rate(self, client):
+        return self._client_rates.get(client)
+
+    async def disk_rate(self, directory):
+        """Return the write throughput of the filesystem holding ``directory``.
+
+        The filesystem is probed once per TTL; concurrent callers share a probe.
+        Returns None if the directory cannot be probed (e.g. read-only).
+        """
+        directory = _nearest_existing_dir(directory)
+        try:
+            dev = os.stat(directory).st_dev
+        except OSError:
+            return None
+        cached = self._disk_rates.get(dev)
+        if cached and time.time() - cached[1] < self.probe_ttl:
+            return cached[0]
+        probe = self._probes.get(dev)
+        # A probe started on a previous server loop cannot be awaited here.
+        if probe is None or probe.get_loop() is not asyncio.get_running_loop():
+            probe = asyncio.ensure_future(
+                asyncio.to_thread(_probe_write_throughput, directory, self.probe_size)
+            )
+            self._probes[dev] = probe
+        try:
+            rate = await asyncio.shield(probe)
+        except Exception as e:
+            config.logger.warning(f"Write throughput probe failed for {directory}: {e}")
+            return None
+        finally:
+            if self._probes.get(dev) is probe and probe.done():
+                self._probes.pop(dev, None)
+        self._disk_rates[dev] = (rate, time.time())
+        return rate
+
+    # -------------------------------------------------------------------------
+    # Plan
+    # -------------------------------------------------------------------------
+
+    def plan(self, disk_bps, stream_bps):
+        """Derive ``{chunk_size, parallel, threshold}`` from measured rates.
+
+        Args:
+            disk_bps: Destination filesystem write rate, or None if unknown
+            stream_bps: Client single-stream network rate, or None if unknown
+        """
+        parallel = DEFAULT_PARALLEL
+        if disk_bps and disk_bps < _SLOW_DISK_BPS:
+            parallel = 1
+        elif disk_bps and stream_bps:
+            # Add streams while the disk can absorb them; a single slow Wi-Fi
+            # stream is latency-bound and more streams fill the link.
+            parallel = _clamp(int(disk_bps // stream_bps) or 1, 1, MAX_PARALLEL)
+
+        rates = [rate for rate in (disk_bps, stream_bps * parallel if stream_bps else None) if rate]
+        if not rates:
+            return {
+                "chunk_size": DEFAULT_CHUNK_SIZE,
+                "parallel": parallel,
+                "threshold": DEFAULT_THRESHOLD,
+            }
+        rate = min(rates)
+
+        per_stream = rate / parallel
+        chunk_size = _clamp(
+            _round_down_pow2(int(per_stream * _TARGET_CHUNK_SECONDS)), MIN_CHUNK_SIZE, MAX_CHUNK_SIZE
+        )
+        threshold = _clamp(int(rate * _TARGET_SIMPLE_UPLOAD_SECONDS), MIN_THRESHOLD, MAX_THRESHOLD)
+        if not stream_bps:
+            # The link is unmeasured and may well be slower than the disk, so
+            # the disk rate can only lower the defaults, never raise them.
+            chunk_size = min(chunk_size, DEFAULT_CHUNK_SIZE)
+            threshold = min(threshold, DEFAULT_THRESHOLD)
+        threshold = max(threshold, 2 * chunk_size)
+        return {"chunk_size": chunk_size, "parallel": parallel, "threshold": threshold}
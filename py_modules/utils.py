@@ -4,6 +4,8 @@
 # - IP address detection
 # - Port availability checking
 # - Port release waiting
+# - Disk space checks and file preallocation
+# - Durable directory entries and atomic JSON files
 
 import socket
 import time
@@ -13,6 +15,8 @@ import shutil
 import subprocess
 import json
 import glob
+import errno
+import ctypes
 from typing import List, Dict, Any
 # NOTE: Direct import - Decky adds py_modules/ to sys.path
 import config
@@ -251,6 +255,99 @@ async def wait_for_service_healthy(port, endpoint='/', timeout=None, check_inter
     return False
 
 
+# =============================================================================
+# Storage Utilities
+# =============================================================================
+
+_libc = None
+
+
+def get_libc():
+    """The C library (errno-aware), loaded once and shared by ctypes callers."""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    return _libc
+
+
+def get_free_space(path: str) -> int:
+    """Return bytes available to unprivileged users on the filesystem holding path."""
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+def fallocate_file(fd: int, length: int) -> bool:
+    """Allocate real blocks for the first ``length`` bytes of an open file.
+
+    Uses fallocate(2) directly: unlike posix_fallocate, glibc never falls back
+    to writing zeros block by block, which would take minutes for a large file
+    on a microSD card. The file size grows to ``length`` if it was smaller.
+
+    Returns:
+        bool: True if allocated, False if the filesystem does not support it
+    Raises:
+        OSError: ENOSPC and other real allocation failures
+    """
+    if length <= 0:
+        return True
+    try:
+        libc = get_libc()
+        libc.fallocate64.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        libc.fallocate64.restype = ctypes.c_int
+        result = libc.fallocate64(fd, 0, 0, length)
+    except (OSError, AttributeError):
+        return False
+    if result == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+        return False
+    raise OSError(err, os.strerror(err))
+
+
+def sync_filesystem(path: str) -> None:
+    """Flush dirty data of the filesystem holding path (syncfs(2), sync(2) as fallback)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        os.sync()
+        return
+    try:
+        if get_libc().syncfs(fd) != 0:
+            os.sync()
+    except (OSError, AttributeError):
+        os.sync()
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path: str) -> None:
+    """Make renames and new entries in directory path durable (best effort)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path: str, payload: Any) -> None:
+    """Replace path with payload as JSON: fsync'd temp file, rename, directory fsync."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    fsync_dir(directory)
+
+
 # =============================================================================
 # Notification Utilities
 # =============================================================================
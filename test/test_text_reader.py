@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for ranged text reads (text_reader line index)
+"""
+
+import os
+import sys
+import tempfile
+
+# Add the py_modules directory to the path so we can import our modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'py_modules'))
+
+import text_reader
+
+BLOCK = text_reader._BLOCK
+
+
+def _write_file(data):
+    fd, path = tempfile.mkstemp(suffix=".log")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_line_at_block_boundary_count():
+    """A line whose preceding newline count equals a block boundary's count"""
+    print("\n--- Testing line start at a block newline-count boundary ---")
+
+    # Ten short lines, then one long line running past the first block, so
+    # block 1 starts with exactly 10 newlines before it
+    head = b"".join(b"line %d\n" % n for n in range(1, 11))
+    long_line = b"x" * (BLOCK + 100) + b"\n"
+    path = _write_file(head + long_line + b"line 12\n")
+    try:
+        result = text_reader.read_range(path, line=11, lines=1)
+        assert result["offset"] == len(head), result["offset"]
+        assert result["content"].startswith("xxx"), result["content"][:20]
+        result = text_reader.read_range(path, line=12, lines=1)
+        assert result["content"] == "line 12\n", result["content"]
+        print("✓ Lines 11 and 12 start after their newlines")
+    finally:
+        os.remove(path)
+
+
+def test_line_ending_at_block_end():
+    """A newline that is the last byte of a block"""
+    print("\n--- Testing a newline on the last byte of a block ---")
+
+    first = b"a" * (BLOCK - 1) + b"\n"
+    path = _write_file(first + b"second\n" + b"third\n")
+    try:
+        result = text_reader.read_range(path, line=2, lines=2)
+        assert result["offset"] == BLOCK, result["offset"]
+        assert result["content"] == "second\nthird\n", result["content"]
+        result = text_reader.read_range(path, line=4, lines=1)
+        assert result["content"] == "" and result["lines"] == 0, result
+        print("✓ Line 2 starts at the block boundary; past the end is empty")
+    finally:
+        os.remove(path)
+
+
+def main():
+    print("Testing Text Reader Module")
+    print("="*40)
+
+    test_line_at_block_boundary_count()
+    test_line_ending_at_block_end()
+
+    print("\n" + "="*40)
+    print("Test completed!")
+
+if __name__ == "__main__":
+    main()